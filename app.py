@@ -6,7 +6,8 @@ COMPLETE REWRITE - Fixed all import conflicts and route issues
 import os
 import sys
 import logging
-from flask import Flask, render_template, request, redirect, url_for, session, jsonify
+import uuid
+from flask import Flask, render_template, request, redirect, url_for, session, jsonify, Response
 from datetime import datetime
 import traceback
 
@@ -32,19 +33,26 @@ sys.path.insert(0, os.path.join(os.path.dirname(__file__), 'src'))
 
 # Import configuration - FIXED to handle missing config gracefully
 try:
-    from config import FLASK_DEBUG, SECRET_KEY, FLASK_ENV, validate_config
+    from config import FLASK_DEBUG, SECRET_KEY, FLASK_ENV, STARTUP_SETTINGS, validate_config
 except ImportError:
     # Fallback configuration if config.py is missing
     FLASK_DEBUG = True
     SECRET_KEY = 'dev-secret-key-change-in-production'
     FLASK_ENV = 'development'
+    STARTUP_SETTINGS = {'llm_warmup_enabled': True, 'llm_warmup_timeout_seconds': 5.0, 'ready_requires_llm': False}
     
     def validate_config():
         return ["Config file missing - using fallback configuration"]
 
 # Import services with error handling
 from src.services.ai_context_analyzer import initialize_ai_analyzer
-from src.services.together_client import get_together_client
+from src.services.together_client import (
+    start_llm_warmup, get_llm_warmup_status, is_llm_configured, get_circuit_breaker_stats
+)
+from src.services.worker_pool import get_worker_pool_stats
+from src.services.rate_limiter import get_llm_rate_limiter
+from src.utils.metrics import register_gauge, render_metrics
+from src.services.conversation_store import get_conversation_store
 
 def create_app():
     """Create and configure Flask application"""
@@ -128,17 +136,22 @@ def setup_logging(app):
         pass
 
 def initialize_services(app):
-    """Initialize external services"""
+    """
+    Initialize external services
+    
+    Không gửi LLM request khi khởi động: client được tạo lazy, connection pool
+    được warm-up ở background và /health/ready báo khi worker sẵn sàng.
+    """
     with app.app_context():
-        # Test Together AI client
+        # Warm-up Together AI connection (non-blocking)
         try:
-            client = get_together_client()
-            if client:
-                app.logger.info("Together AI client ready")
-            else:
+            if not is_llm_configured():
                 app.logger.warning("Together AI client not available")
+            elif STARTUP_SETTINGS['llm_warmup_enabled']:
+                start_llm_warmup(STARTUP_SETTINGS['llm_warmup_timeout_seconds'])
+                app.logger.info("Together AI warm-up started")
         except Exception as e:
-            app.logger.error(f"Together AI client error: {e}")
+            app.logger.error(f"Together AI warm-up error: {e}")
         
         # Initialize AI analyzer
         try:
@@ -215,8 +228,12 @@ def register_routes(app):
         try:
             # Initialize session if needed
             if 'session_id' not in session:
-                session['session_id'] = f"session_{datetime.now().strftime('%Y%m%d_%H%M%S')}"
+                session['session_id'] = f"session_{datetime.now().strftime('%Y%m%d_%H%M%S')}_{uuid.uuid4().hex[:8]}"
                 session['created_at'] = datetime.now().isoformat()
+            elif request.args.get('new') == '1':
+                # Chỉ xóa khi client yêu cầu hội thoại mới (/chat?new=1) - reload / tab mới
+                # giữ history, chat.js tải lại qua /api/chat/conversation
+                get_conversation_store(app.permanent_session_lifetime.total_seconds()).delete(session['session_id'])
             
             return render_template('chat.html', session_id=session['session_id'])
         except Exception as e:
@@ -300,33 +317,69 @@ def register_routes(app):
             return render_template_safe('error.html', 
                                       error_message='Không thể tải trang chính sách'), 500
     
+    @app.route('/health/live')
+    def liveness():
+        """Liveness probe - process đang chạy và phục vụ request"""
+        return jsonify({'status': 'alive', 'timestamp': datetime.now().isoformat()}), 200
+    
+    @app.route('/health/ready')
+    def readiness():
+        """
+        Readiness probe - worker sẵn sàng nhận traffic
+        
+        Chưa ready khi chat engine chưa khởi tạo hoặc LLM warm-up đang chạy.
+        Warm-up lỗi vẫn ready (fallback responses) trừ khi ready_requires_llm bật.
+        """
+        try:
+            from src.api import chat as chat_api
+            chat_ready = chat_api.chat_engine is not None
+        except Exception:
+            chat_ready = False
+        
+        warmup = get_llm_warmup_status()
+        if STARTUP_SETTINGS['ready_requires_llm']:
+            llm_ready = warmup['status'] == 'ready'
+        else:
+            # 'pending' = warm-up bị tắt
+            llm_ready = warmup['status'] != 'running'
+        
+        ready = chat_ready and llm_ready
+        return jsonify({
+            'status': 'ready' if ready else 'not_ready',
+            'chat_engine': chat_ready,
+            'llm_warmup': warmup,
+            'timestamp': datetime.now().isoformat()
+        }), 200 if ready else 503
+    
+    @app.route('/metrics')
+    def metrics():
+        """Prometheus text format: stage latency histograms, LLM calls/tokens theo caller"""
+        try:
+            return Response(render_metrics(), content_type='text/plain; version=0.0.4; charset=utf-8')
+        except Exception as e:
+            app.logger.error(f"Metrics error: {e}")
+            return Response(f"# metrics unavailable: {e}\n", status=500, mimetype='text/plain')
+    
+    register_metrics_gauges()
+    
+    # Snapshot template/static state một lần lúc khởi động - /health không chạm filesystem
+    health_snapshot = build_health_snapshot(app)
+    
     # ADDED: Health check endpoint for monitoring
     @app.route('/health')
     def health_check():
-        """Health check endpoint"""
+        """Health check endpoint (snapshot lúc khởi động + worker pool stats)"""
         try:
             health_status = {
-                'status': 'healthy',
+                'status': health_snapshot['status'],
                 'timestamp': datetime.now().isoformat(),
                 'version': '1.0.0',
-                'services': {
-                    'web_server': 'running',
-                    'templates': 'available',
-                    'static_files': 'available'
-                }
+                'services': dict(health_snapshot['services']),
+                'snapshot_at': health_snapshot['snapshot_at']
             }
             
-            # Check if critical templates exist
-            template_dir = os.path.join(app.template_folder or 'templates')
-            critical_templates = ['base.html', 'home.html', 'chat.html', 'assessment.html']
-            
-            for template in critical_templates:
-                template_path = os.path.join(template_dir, template)
-                if not os.path.exists(template_path):
-                    health_status['services'][f'template_{template}'] = 'missing'
-                    health_status['status'] = 'degraded'
-                else:
-                    health_status['services'][f'template_{template}'] = 'available'
+            # Chat worker pool saturation
+            health_status['worker_pool'] = get_worker_pool_stats()
             
             status_code = 200 if health_status['status'] == 'healthy' else 503
             return jsonify(health_status), status_code
@@ -339,6 +392,62 @@ def register_routes(app):
                 'timestamp': datetime.now().isoformat()
             }), 500
 
+def build_health_snapshot(app):
+    """
+    Kiểm tra critical templates + static folder một lần
+    
+    Templates/static không đổi khi app đang chạy nên không cần os.path.exists
+    ở mỗi request /health.
+    
+    Return: {'status', 'services', 'snapshot_at'}
+    """
+    snapshot = {
+        'status': 'healthy',
+        'services': {
+            'web_server': 'running',
+            'templates': 'available',
+            'static_files': 'available'
+        },
+        'snapshot_at': datetime.now().isoformat()
+    }
+    
+    template_dir = os.path.join(app.root_path, app.template_folder or 'templates')
+    critical_templates = ['base.html', 'home.html', 'chat.html', 'assessment.html']
+    
+    for template in critical_templates:
+        template_path = os.path.join(template_dir, template)
+        if not os.path.exists(template_path):
+            snapshot['services'][f'template_{template}'] = 'missing'
+            snapshot['services']['templates'] = 'degraded'
+            snapshot['status'] = 'degraded'
+        else:
+            snapshot['services'][f'template_{template}'] = 'available'
+    
+    if not app.static_folder or not os.path.isdir(app.static_folder):
+        snapshot['services']['static_files'] = 'missing'
+        snapshot['status'] = 'degraded'
+    
+    return snapshot
+
+def register_metrics_gauges():
+    """Gauges tính lúc scrape /metrics (worker pool, circuit breaker, LLM queue)"""
+    register_gauge(
+        'chat_worker_pool_active', 'Chat turns currently running on the worker pool',
+        lambda: {(): get_worker_pool_stats()['active']}
+    )
+    register_gauge(
+        'chat_worker_pool_queued', 'Chat turns waiting for a worker',
+        lambda: {(): get_worker_pool_stats()['queued']}
+    )
+    register_gauge(
+        'llm_circuit_open', '1 when the LLM circuit breaker is open',
+        lambda: {(): 1 if get_circuit_breaker_stats()['state'] == 'open' else 0}
+    )
+    register_gauge(
+        'llm_queue_depth', 'LLM calls waiting for a rate limit token',
+        lambda: {(('priority', name),): count for name, count in get_llm_rate_limiter().queue_depth().items()}
+    )
+
 def render_template_safe(template_name, **kwargs):
     """Safe template rendering with fallback"""
     try:
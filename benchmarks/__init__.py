@@ -0,0 +1,3 @@
+"""
+Benchmarks - Load test và đo latency cho chat / assessment / export APIs
+"""
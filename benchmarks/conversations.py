@@ -0,0 +1,109 @@
+"""
+Synthetic Conversations - Tạo hội thoại giả (tiếng Việt / English) cho benchmark
+Deterministic with a seed so runs are comparable across commits
+"""
+
+import random
+from typing import Dict, List, Optional
+
+PHRASES = {
+    'vi': {
+        'opening': [
+            'Chào bạn, dạo này tôi thấy không ổn lắm.',
+            'Xin chào, tôi muốn nói chuyện một chút.',
+            'Hôm nay tôi cảm thấy hơi mệt.'
+        ],
+        'mild': [
+            'Tôi lo lắng về kỳ thi sắp tới.',
+            'Công việc dạo này khá căng thẳng.',
+            'Tôi hơi buồn vì cãi nhau với bạn thân.',
+            'Tối qua tôi ngủ không ngon lắm.'
+        ],
+        'moderate': [
+            'Mấy tuần nay tôi thường xuyên mất ngủ và chán ăn.',
+            'Tôi cảm thấy áp lực và quá tải suốt cả tháng nay.',
+            'Tôi không còn hứng thú với những việc trước đây tôi thích.',
+            'Tôi hay lo âu mà không rõ lý do, tim đập nhanh.'
+        ],
+        'severe': [
+            'Tôi cảm thấy tuyệt vọng, không thấy lối thoát.',
+            'Ngày nào tôi cũng thấy mình vô dụng và kiệt sức.',
+            'Đã hơn hai tháng tôi không muốn gặp ai cả.'
+        ],
+        'closing': [
+            'Cảm ơn bạn đã lắng nghe.',
+            'Nói chuyện xong tôi thấy nhẹ nhõm hơn.'
+        ]
+    },
+    'en': {
+        'opening': [
+            "Hi, I haven't been feeling great lately.",
+            'Hello, I just want to talk for a bit.',
+            'I feel a bit tired today.'
+        ],
+        'mild': [
+            "I'm worried about my upcoming exam.",
+            'Work has been quite stressful recently.',
+            'I feel a little sad after arguing with a friend.',
+            "I didn't sleep well last night."
+        ],
+        'moderate': [
+            "For weeks I've had trouble sleeping and no appetite.",
+            "I've felt overwhelmed and under pressure all month.",
+            'I lost interest in things I used to enjoy.',
+            'I feel anxious for no reason and my heart races.'
+        ],
+        'severe': [
+            'I feel hopeless and I cannot see a way out.',
+            'Every day I feel worthless and exhausted.',
+            "For over two months I haven't wanted to see anyone."
+        ],
+        'closing': [
+            'Thank you for listening.',
+            'I feel a bit better after talking.'
+        ]
+    }
+}
+
+# Mức độ nặng tăng dần theo lượt - giống hội thoại thực tế dẫn tới assessment
+SEVERITY_PROGRESSION = ['mild', 'mild', 'moderate', 'moderate', 'severe']
+
+def generate_conversation(turns: int, language: str = 'vi', rng: Optional[random.Random] = None) -> List[str]:
+    """
+    Tạo danh sách tin nhắn user cho một hội thoại
+
+    Params:
+        - turns: Số lượt user
+        - language: 'vi', 'en' hoặc 'mixed'
+        - rng: Random instance (để tái lập kết quả)
+
+    Return: List tin nhắn theo thứ tự
+    """
+    rng = rng or random.Random()
+    messages = []
+
+    for turn in range(turns):
+        lang = rng.choice(['vi', 'en']) if language == 'mixed' else language
+        phrases = PHRASES[lang]
+
+        if turn == 0:
+            bucket = 'opening'
+        elif turn == turns - 1 and turns > 2:
+            bucket = 'closing'
+        else:
+            bucket = SEVERITY_PROGRESSION[min(turn - 1, len(SEVERITY_PROGRESSION) - 1)]
+
+        messages.append(rng.choice(phrases[bucket]))
+
+    return messages
+
+def generate_conversations(count: int, turns: int, language: str = 'vi', seed: int = 42) -> List[List[str]]:
+    """Tạo nhiều hội thoại deterministic từ seed"""
+    rng = random.Random(seed)
+    return [generate_conversation(turns, language, rng) for _ in range(count)]
+
+def generate_answers(question_ids: List[str], rng: Optional[random.Random] = None,
+                     max_value: int = 3) -> Dict[str, int]:
+    """Câu trả lời ngẫu nhiên cho một questionnaire"""
+    rng = rng or random.Random()
+    return {question_id: rng.randint(0, max_value) for question_id in question_ids}
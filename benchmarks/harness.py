@@ -0,0 +1,351 @@
+"""
+Benchmark Harness - Virtual users chạy chat / assessment / export scenarios
+In-process (Flask test client) or over HTTP, with latency percentiles and peak RSS
+"""
+
+import json
+import logging
+import os
+import random
+import threading
+import time
+import uuid
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from benchmarks.conversations import generate_answers, generate_conversations
+
+logger = logging.getLogger(__name__)
+
+CHAT_ENDPOINT = '/api/chat/send_message'
+ASSESSMENT_ENDPOINT = '/api/assessment/submit'
+EXPORT_ENDPOINT = '/api/export/pdf'
+
+# Số câu hỏi của các questionnaire được dùng trong benchmark
+ASSESSMENT_QUESTION_COUNTS = {'phq9': 9, 'gad7': 7}
+
+class InProcessTarget:
+    """Gọi Flask app trực tiếp qua test client (một client cho mỗi thread)"""
+
+    name = 'inprocess'
+
+    def __init__(self, app):
+        self.app = app
+        self._local = threading.local()
+
+    def post(self, path: str, payload: Dict) -> Tuple[int, Any]:
+        client = getattr(self._local, 'client', None)
+        if client is None:
+            client = self.app.test_client()
+            self._local.client = client
+
+        response = client.post(path, json=payload)
+        if response.is_json:
+            return response.status_code, response.get_json()
+        return response.status_code, response.get_data()
+
+class HttpTarget:
+    """Gọi server đang chạy qua HTTP (một connection pool cho mỗi thread)"""
+
+    name = 'http'
+
+    def __init__(self, base_url: str, timeout: float = 60.0):
+        import httpx
+
+        self._httpx = httpx
+        self.base_url = base_url.rstrip('/')
+        self.timeout = timeout
+        self._local = threading.local()
+
+    def post(self, path: str, payload: Dict) -> Tuple[int, Any]:
+        client = getattr(self._local, 'client', None)
+        if client is None:
+            client = self._httpx.Client(base_url=self.base_url, timeout=self.timeout)
+            self._local.client = client
+
+        response = client.post(path, json=payload)
+        if 'application/json' in response.headers.get('content-type', ''):
+            return response.status_code, response.json()
+        return response.status_code, response.content
+
+class ScenarioRecorder:
+    """Thu thập latency + status code của một scenario (thread-safe)"""
+
+    def __init__(self, name: str):
+        self.name = name
+        self.latencies: List[float] = []
+        self.status_codes: Dict[str, int] = {}
+        self.errors = 0
+        self.extra: Dict[str, float] = {}
+        self._lock = threading.Lock()
+
+    def record(self, latency: float, status: int, ok: bool) -> None:
+        with self._lock:
+            self.latencies.append(latency)
+            self.status_codes[str(status)] = self.status_codes.get(str(status), 0) + 1
+            if not ok:
+                self.errors += 1
+
+    def add(self, key: str, amount: float) -> None:
+        with self._lock:
+            self.extra[key] = self.extra.get(key, 0) + amount
+
+    def summary(self, wall_seconds: float) -> Dict[str, Any]:
+        with self._lock:
+            latencies = sorted(self.latencies)
+            count = len(latencies)
+            return {
+                'requests': count,
+                'errors': self.errors,
+                'error_rate': round(self.errors / count, 4) if count else 0.0,
+                'status_codes': dict(self.status_codes),
+                'requests_per_second': round(count / wall_seconds, 2) if wall_seconds > 0 else 0.0,
+                'latency_ms': {
+                    'p50': _percentile_ms(latencies, 50),
+                    'p95': _percentile_ms(latencies, 95),
+                    'p99': _percentile_ms(latencies, 99),
+                    'mean': round(sum(latencies) / count * 1000, 2) if count else 0.0,
+                    'max': round(latencies[-1] * 1000, 2) if count else 0.0
+                },
+                **self.extra
+            }
+
+class RSSSampler:
+    """Đo peak RSS bằng background thread (psutil, fallback sang resource)"""
+
+    def __init__(self, pid: Optional[int] = None, interval: float = 0.05):
+        self.pid = pid or os.getpid()
+        self.interval = interval
+        self.peak_bytes = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='rss-sampler', daemon=True)
+
+        try:
+            import psutil
+            self._process = psutil.Process(self.pid)
+        except Exception:
+            self._process = None
+
+    def __enter__(self) -> 'RSSSampler':
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self._stop.set()
+        self._thread.join()
+        self._sample()
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval):
+            self._sample()
+
+    def _sample(self) -> None:
+        if self._process is not None:
+            try:
+                self.peak_bytes = max(self.peak_bytes, self._process.memory_info().rss)
+                return
+            except Exception:
+                pass
+
+        if self.pid == os.getpid():
+            import resource
+            # ru_maxrss tính bằng KB trên Linux
+            self.peak_bytes = max(self.peak_bytes, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024)
+
+    @property
+    def peak_mb(self) -> Optional[float]:
+        return round(self.peak_bytes / (1024 * 1024), 1) if self.peak_bytes else None
+
+class BenchmarkRunner:
+    """
+    Chạy N virtual users, mỗi user lần lượt: hội thoại chat -> submit assessment -> export PDF
+    """
+
+    def __init__(self, target, users: int = 10, conversations_per_user: int = 1, turns: int = 6,
+                 language: str = 'vi', scenarios: Optional[List[str]] = None, seed: int = 42,
+                 llm_call_counter: Optional[Callable[[], int]] = None, server_pid: Optional[int] = None):
+        self.target = target
+        self.users = users
+        self.conversations_per_user = conversations_per_user
+        self.turns = turns
+        self.language = language
+        self.scenarios = scenarios or ['chat', 'assessment', 'export']
+        self.seed = seed
+        self.llm_call_counter = llm_call_counter
+        self.server_pid = server_pid
+        self.recorders = {name: ScenarioRecorder(name) for name in self.scenarios}
+
+    def run(self) -> Dict[str, Any]:
+        """Chạy benchmark và trả về results dict (JSON-serializable)"""
+        conversations = generate_conversations(
+            self.users * self.conversations_per_user, self.turns, self.language, self.seed
+        )
+        llm_calls_before = self.llm_call_counter() if self.llm_call_counter else None
+
+        threads = [
+            threading.Thread(
+                target=self._virtual_user,
+                args=(index, conversations[index::self.users]),
+                name=f'vu-{index}'
+            )
+            for index in range(self.users)
+        ]
+
+        with RSSSampler(self.server_pid) as sampler:
+            started = time.perf_counter()
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            wall_seconds = time.perf_counter() - started
+
+        results = {
+            'wall_seconds': round(wall_seconds, 3),
+            'peak_rss_mb': sampler.peak_mb,
+            'scenarios': {name: recorder.summary(wall_seconds) for name, recorder in self.recorders.items()}
+        }
+
+        chat = results['scenarios'].get('chat')
+        if chat is not None:
+            turns = chat['requests']
+            if llm_calls_before is not None:
+                # Đếm trực tiếp số LLM call (chỉ in-process)
+                llm_calls = self.llm_call_counter() - llm_calls_before
+                chat['llm_calls_source'] = 'client_counter'
+            else:
+                # HTTP mode: ước lượng từ response metadata
+                llm_calls = chat.pop('reported_llm_calls', 0)
+                chat['llm_calls_source'] = 'response_metadata'
+            chat.pop('reported_llm_calls', None)
+            chat['llm_calls'] = llm_calls
+            chat['llm_calls_per_turn'] = round(llm_calls / turns, 3) if turns else 0.0
+
+        return results
+
+    def _virtual_user(self, index: int, conversations: List[List[str]]) -> None:
+        rng = random.Random(self.seed + index)
+
+        for messages in conversations:
+            history: List[Dict] = []
+            if 'chat' in self.scenarios:
+                history = self._run_chat(messages)
+
+            assessment_result = None
+            if 'assessment' in self.scenarios:
+                assessment_result = self._run_assessment(rng, history)
+
+            if 'export' in self.scenarios:
+                self._run_export(assessment_result, rng)
+
+    def _run_chat(self, messages: List[str]) -> List[Dict]:
+        recorder = self.recorders['chat']
+        history: List[Dict] = []
+        state = {
+            'current_phase': 'chat',
+            'message_count': 0,
+            'session_id': str(uuid.uuid4()),
+            'language': 'vi'
+        }
+
+        for message in messages:
+            status, body, latency = self._timed_post(CHAT_ENDPOINT, {
+                'message': message,
+                'history': history,
+                'state': state,
+                'use_ai': True
+            })
+            ok = status == 200 and isinstance(body, dict) and body.get('success', False)
+            recorder.record(latency, status, ok)
+
+            if not ok:
+                continue
+
+            history = body.get('history', history)
+            state = body.get('state', state)
+            metadata = body.get('metadata', {})
+            reported_calls = metadata.get('llm_classifications', 0)
+            if metadata.get('ai_used') and metadata.get('type') == 'chat_response' and not metadata.get('circuit_open'):
+                reported_calls += 1
+            recorder.add('reported_llm_calls', reported_calls)
+
+            # Hội thoại chuyển sang assessment - dừng chat
+            if state.get('current_phase') == 'assessment':
+                recorder.add('transitions', 1)
+                break
+
+        return history
+
+    def _run_assessment(self, rng: random.Random, history: List[Dict]) -> Optional[Dict]:
+        assessment_type = rng.choice(sorted(ASSESSMENT_QUESTION_COUNTS))
+        question_ids = [f'{assessment_type}_{i}' for i in range(1, ASSESSMENT_QUESTION_COUNTS[assessment_type] + 1)]
+
+        status, body, latency = self._timed_post(ASSESSMENT_ENDPOINT, {
+            'assessment_type': assessment_type,
+            'session_id': str(uuid.uuid4()),
+            'answers': generate_answers(question_ids, rng),
+            'chat_history': history,
+            'completed_at': datetime.now().isoformat()
+        })
+        ok = status == 200 and isinstance(body, dict) and body.get('success', False)
+        self.recorders['assessment'].record(latency, status, ok)
+        return body if ok else None
+
+    def _run_export(self, assessment_result: Optional[Dict], rng: random.Random) -> None:
+        if assessment_result is None:
+            question_ids = [f'phq9_{i}' for i in range(1, 10)]
+            assessment_result = {
+                'assessment_type': 'phq9',
+                'answers': generate_answers(question_ids, rng),
+                'results': {'total_score': 0, 'severity': 'minimal'}
+            }
+
+        status, body, latency = self._timed_post(EXPORT_ENDPOINT, {
+            'assessment_data': {
+                'assessment': {'type': assessment_result.get('assessment_type', 'phq9')},
+                'results': assessment_result.get('results', {}),
+                'answers': assessment_result.get('answers', {}),
+                'recommendations': assessment_result.get('recommendations', [])
+            },
+            'format_options': {}
+        })
+        self.recorders['export'].record(latency, status, status == 200 and isinstance(body, bytes))
+
+    def _timed_post(self, path: str, payload: Dict) -> Tuple[int, Any, float]:
+        started = time.perf_counter()
+        try:
+            status, body = self.target.post(path, payload)
+        except Exception as e:
+            logger.error(f"Benchmark request to {path} failed: {e}")
+            status, body = 0, None
+        return status, body, time.perf_counter() - started
+
+def _percentile_ms(sorted_values: List[float], percentile: float) -> float:
+    """Nearest-rank percentile (ms)"""
+    if not sorted_values:
+        return 0.0
+    rank = max(1, int(round(percentile / 100.0 * len(sorted_values) + 0.5 - 1e-9)))
+    return round(sorted_values[min(rank, len(sorted_values)) - 1] * 1000, 2)
+
+def compare_results(current: Dict, baseline: Dict) -> List[str]:
+    """So sánh hai result files, return các dòng mô tả thay đổi p50/p95/p99/rps"""
+    lines = []
+    for name, summary in current.get('scenarios', {}).items():
+        previous = baseline.get('scenarios', {}).get(name)
+        if not previous:
+            continue
+        for key in ('p50', 'p95', 'p99'):
+            before, after = previous['latency_ms'][key], summary['latency_ms'][key]
+            change = ((after - before) / before * 100) if before else 0.0
+            lines.append(f"{name:<11} {key:<4} {before:>10.2f} -> {after:>10.2f} ms ({change:+.1f}%)")
+        before, after = previous['requests_per_second'], summary['requests_per_second']
+        change = ((after - before) / before * 100) if before else 0.0
+        lines.append(f"{name:<11} rps  {before:>10.2f} -> {after:>10.2f}    ({change:+.1f}%)")
+    return lines
+
+def save_results(results: Dict, path: str) -> str:
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(results, f, ensure_ascii=False, indent=2)
+    return path
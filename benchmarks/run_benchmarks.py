@@ -0,0 +1,165 @@
+"""
+Run Benchmarks - CLI cho load test chat / assessment / export APIs
+
+Ví dụ:
+    # In-process với mock LLM (không cần network / API key)
+    python -m benchmarks.run_benchmarks --users 20 --turns 6 --mock-latency-ms 300
+
+    # Qua HTTP với server đang chạy (server nên bật MOCK_AI_RESPONSES=true)
+    python -m benchmarks.run_benchmarks --mode http --base-url http://127.0.0.1:5000 --server-pid 12345
+
+    # So sánh với kết quả trước đó
+    python -m benchmarks.run_benchmarks --compare benchmarks/results/<file>.json
+
+Kết quả được ghi vào benchmarks/results/<timestamp>_<commit>.json.
+"""
+
+import argparse
+import json
+import logging
+import os
+import platform
+import subprocess
+import sys
+from datetime import datetime
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RESULTS_DIR = os.path.join(ROOT_DIR, 'benchmarks', 'results')
+
+def parse_args(argv=None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description='Load test chat, assessment and export APIs')
+    parser.add_argument('--mode', choices=['inprocess', 'http'], default='inprocess')
+    parser.add_argument('--base-url', default='http://127.0.0.1:5000', help='Server URL cho --mode http')
+    parser.add_argument('--server-pid', type=int, help='PID của server để đo peak RSS (--mode http)')
+    parser.add_argument('--users', type=int, default=10, help='Số virtual users chạy đồng thời')
+    parser.add_argument('--conversations', type=int, default=1, help='Số hội thoại mỗi user')
+    parser.add_argument('--turns', type=int, default=6, help='Số tin nhắn user mỗi hội thoại')
+    parser.add_argument('--language', choices=['vi', 'en', 'mixed'], default='vi')
+    parser.add_argument('--scenarios', default='chat,assessment,export',
+                        help='Danh sách scenarios, phân cách bằng dấu phẩy')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--mock-latency-ms', type=float, help='Latency của mock LLM (in-process)')
+    parser.add_argument('--mock-latency-distribution', choices=['fixed', 'lognormal', 'spike', 'spike_lognormal'])
+    parser.add_argument('--mock-error-rate', type=float)
+    parser.add_argument('--mock-spike-probability', type=float, help='Xác suất tail spike của mock LLM')
+    parser.add_argument('--mock-spike-ms', type=float, help='Độ dài tail spike (ms)')
+    parser.add_argument('--hedging', action='store_true', help='Bật hedged LLM requests (LLM_HEDGING_ENABLED)')
+    parser.add_argument('--output', help='File kết quả (mặc định benchmarks/results/<timestamp>_<commit>.json)')
+    parser.add_argument('--compare', help='Result file để so sánh')
+    return parser.parse_args(argv)
+
+def git_commit() -> str:
+    try:
+        return subprocess.check_output(
+            ['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT_DIR, stderr=subprocess.DEVNULL
+        ).decode().strip()
+    except Exception:
+        return 'unknown'
+
+def configure_mock_llm(args: argparse.Namespace) -> None:
+    """Bật mock LLM qua environment - phải chạy trước khi import config"""
+    os.environ.setdefault('MOCK_AI_RESPONSES', 'true')
+    overrides = {
+        'MOCK_LLM_LATENCY_MS': args.mock_latency_ms,
+        'MOCK_LLM_LATENCY_DISTRIBUTION': args.mock_latency_distribution,
+        'MOCK_LLM_ERROR_RATE': args.mock_error_rate,
+        'MOCK_LLM_SPIKE_PROBABILITY': args.mock_spike_probability,
+        'MOCK_LLM_SPIKE_MS': args.mock_spike_ms,
+        'LLM_HEDGING_ENABLED': 'true' if args.hedging else None
+    }
+    for key, value in overrides.items():
+        if value is not None:
+            os.environ[key] = str(value)
+    os.environ.setdefault('MOCK_LLM_SEED', str(args.seed))
+
+def build_target(args: argparse.Namespace):
+    """Return (target, llm_call_counter, app_settings)"""
+    if args.mode == 'http':
+        from benchmarks.harness import HttpTarget
+        return HttpTarget(args.base_url), None, {}
+
+    configure_mock_llm(args)
+    if ROOT_DIR not in sys.path:
+        sys.path.insert(0, ROOT_DIR)
+
+    from app import create_app
+    from config import DEVELOPMENT_SETTINGS, MOCK_LLM_SETTINGS, PERFORMANCE_SETTINGS, LLM_HEDGING_SETTINGS
+    from src.services.together_client import get_llm_call_stats
+    from benchmarks.harness import InProcessTarget
+
+    app = create_app()
+    settings = {
+        'mock_ai_responses': DEVELOPMENT_SETTINGS['mock_ai_responses'],
+        'mock_llm': MOCK_LLM_SETTINGS,
+        'performance': PERFORMANCE_SETTINGS,
+        'hedging': LLM_HEDGING_SETTINGS
+    }
+    return InProcessTarget(app), lambda: get_llm_call_stats()['calls'], settings
+
+def main(argv=None) -> int:
+    args = parse_args(argv)
+    logging.basicConfig(level=logging.WARNING)
+
+    target, llm_call_counter, app_settings = build_target(args)
+
+    from benchmarks.harness import BenchmarkRunner, compare_results, save_results
+
+    scenarios = [name.strip() for name in args.scenarios.split(',') if name.strip()]
+    runner = BenchmarkRunner(
+        target,
+        users=args.users,
+        conversations_per_user=args.conversations,
+        turns=args.turns,
+        language=args.language,
+        scenarios=scenarios,
+        seed=args.seed,
+        llm_call_counter=llm_call_counter,
+        server_pid=args.server_pid
+    )
+
+    commit = git_commit()
+    results = {
+        'meta': {
+            'timestamp': datetime.now().isoformat(),
+            'git_commit': commit,
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'mode': args.mode,
+            'users': args.users,
+            'conversations_per_user': args.conversations,
+            'turns': args.turns,
+            'language': args.language,
+            'scenarios': scenarios,
+            'seed': args.seed,
+            'app_settings': app_settings
+        },
+        **runner.run()
+    }
+
+    output = args.output or os.path.join(
+        RESULTS_DIR, f"{datetime.now().strftime('%Y%m%d_%H%M%S')}_{commit}.json"
+    )
+    save_results(results, output)
+
+    print(f"Wall time: {results['wall_seconds']}s, peak RSS: {results['peak_rss_mb']} MB")
+    for name, summary in results['scenarios'].items():
+        latency = summary['latency_ms']
+        line = (f"{name:<11} n={summary['requests']:<5} err={summary['errors']:<4} "
+                f"rps={summary['requests_per_second']:<8} p50={latency['p50']}ms "
+                f"p95={latency['p95']}ms p99={latency['p99']}ms")
+        if 'llm_calls_per_turn' in summary:
+            line += f" llm/turn={summary['llm_calls_per_turn']}"
+        print(line)
+    print(f"Results saved to {output}")
+
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as f:
+            baseline = json.load(f)
+        print(f"\nCompared with {args.compare} ({baseline.get('meta', {}).get('git_commit', '?')}):")
+        for line in compare_results(results, baseline):
+            print(line)
+
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -101,8 +101,15 @@ AI_ANALYSIS_SETTINGS = {
     'model': os.getenv('AI_ANALYSIS_MODEL', 'meta-llama/Llama-3.3-70B-Instruct-Turbo-Free'),
     'enable_caching': os.getenv('AI_ANALYSIS_ENABLE_CACHING', 'True').lower() == 'true',
     'cache_duration': int(os.getenv('AI_ANALYSIS_CACHE_DURATION', '300')),  # 5 minutes
+    'cache_max_entries': int(os.getenv('AI_ANALYSIS_CACHE_MAX_ENTRIES', '1000')),
+    'cache_backend': os.getenv('AI_ANALYSIS_CACHE_BACKEND', 'memory'),  # memory | sqlite (dùng chung giữa workers)
+    'cache_path': os.getenv('AI_ANALYSIS_CACHE_PATH', 'cache/analysis_cache.sqlite3'),
     'retry_attempts': int(os.getenv('AI_ANALYSIS_RETRY_ATTEMPTS', '3')),
-    'timeout_seconds': int(os.getenv('AI_ANALYSIS_TIMEOUT', '30'))
+    'timeout_seconds': int(os.getenv('AI_ANALYSIS_TIMEOUT', '30')),
+    'local_model_mode': os.getenv('LOCAL_MODEL_MODE', 'off'),  # off | primary | shadow | fallback
+    'local_model_path': os.getenv('LOCAL_MODEL_PATH', 'models/emotion_classifier_v1.npz'),
+    'local_model_min_confidence': float(os.getenv('LOCAL_MODEL_MIN_CONFIDENCE', '0.8')),  # Primary mode: dưới ngưỡng thì gọi LLM
+    'label_log_path': os.getenv('AI_ANALYSIS_LABEL_LOG', '')  # JSONL của LLM labels để train local model, rỗng = tắt
 }
 
 # Conversation Depth Analysis
@@ -117,8 +124,19 @@ CONVERSATION_DEPTH_WEIGHTS = {
 AI_USAGE_CONTROL = {
     'min_messages_before_ai': int(os.getenv('AI_MIN_MESSAGES', '3')),  # Dùng AI sau message thứ 3
     'ai_analysis_interval': int(os.getenv('AI_ANALYSIS_INTERVAL', '2')),  # Mỗi 2 messages
-    'max_ai_calls_per_session': int(os.getenv('MAX_AI_CALLS_PER_SESSION', '10')),
-    'ai_cooldown_minutes': int(os.getenv('AI_COOLDOWN_MINUTES', '1'))  # 1 phút giữa các AI calls
+    # Ngân sách mỗi session, tính mọi LLM call (analysis + reply + classifier); 0 = không giới hạn
+    'max_ai_calls_per_session': int(os.getenv('MAX_AI_CALLS_PER_SESSION', '40')),
+    'max_ai_tokens_per_session': int(os.getenv('MAX_AI_TOKENS_PER_SESSION', '0')),
+    'ai_cooldown_minutes': int(os.getenv('AI_COOLDOWN_MINUTES', '1')),  # 1 phút giữa các AI calls
+    'budget_ttl_hours': float(os.getenv('AI_BUDGET_TTL_HOURS', '24')),  # Session idle lâu hơn thì reset ngân sách
+    'ledger_max_sessions': int(os.getenv('AI_BUDGET_MAX_SESSIONS', '10000'))
+}
+
+# Severity prefilter (local scorer, skip LLM khi severity chắc chắn thấp)
+PREFILTER_SETTINGS = {
+    'enabled': os.getenv('SEVERITY_PREFILTER_ENABLED', 'True').lower() == 'true',
+    'skip_below': float(os.getenv('SEVERITY_PREFILTER_SKIP_BELOW', '0.35')),  # Skip khi upper bound < threshold
+    'shadow_rate': float(os.getenv('SEVERITY_PREFILTER_SHADOW_RATE', '0.05'))  # Tỉ lệ lượt skip vẫn gọi LLM để đo disagreement
 }
 
 # Response Generation Settings
@@ -152,7 +170,75 @@ PERFORMANCE_SETTINGS = {
     'enable_response_caching': os.getenv('ENABLE_RESPONSE_CACHING', 'False').lower() == 'true',
     'cache_similar_responses': os.getenv('CACHE_SIMILAR_RESPONSES', 'False').lower() == 'true',
     'async_ai_analysis': os.getenv('ASYNC_AI_ANALYSIS', 'False').lower() == 'true',
-    'batch_ai_requests': os.getenv('BATCH_AI_REQUESTS', 'False').lower() == 'true'
+    'concurrent_turn_processing': os.getenv('CONCURRENT_TURN_PROCESSING', 'False').lower() == 'true',  # Generate reply song song với classification
+    'batch_ai_requests': os.getenv('BATCH_AI_REQUESTS', 'False').lower() == 'true',
+    'classifier_mode': os.getenv('AI_CLASSIFIER_MODE', 'batched'),  # batched | concurrent | sequential (AIClassifier)
+    'classifier_max_concurrency': int(os.getenv('AI_CLASSIFIER_MAX_CONCURRENCY', '4')),
+    'chat_worker_threads': int(os.getenv('CHAT_WORKER_THREADS', '8')),  # Pool xử lý chat dùng chung cả app
+    'request_timeout_seconds': float(os.getenv('REQUEST_TIMEOUT_SECONDS', '30')),  # Deadline cho mỗi chat request
+    'questionnaire_cache_max_age': int(os.getenv('QUESTIONNAIRE_CACHE_MAX_AGE', '3600'))  # Cache-Control max-age cho questionnaire APIs
+}
+
+# Startup: không gửi LLM request khi khởi động, warm-up connection ở background
+STARTUP_SETTINGS = {
+    'llm_warmup_enabled': os.getenv('LLM_WARMUP_ENABLED', 'True').lower() == 'true',
+    'llm_warmup_timeout_seconds': float(os.getenv('LLM_WARMUP_TIMEOUT', '5')),
+    'ready_requires_llm': os.getenv('READY_REQUIRES_LLM', 'False').lower() == 'true'  # /health/ready chờ warm-up thành công
+}
+
+# Server-side conversation store (client chỉ gửi tin nhắn mới)
+CONVERSATION_STORE_SETTINGS = {
+    'backend': os.getenv('CONVERSATION_STORE_BACKEND', 'memory'),  # memory | sqlite (dùng chung giữa workers)
+    'path': os.getenv('CONVERSATION_STORE_PATH', 'cache/conversations.sqlite3'),
+    'max_sessions': int(os.getenv('CONVERSATION_STORE_MAX_SESSIONS', '10000')),
+    'ttl_seconds': float(os.environ['CONVERSATION_STORE_TTL_SECONDS']) if os.getenv('CONVERSATION_STORE_TTL_SECONDS') else None,  # None = PERMANENT_SESSION_LIFETIME
+    'purge_interval_seconds': float(os.getenv('CONVERSATION_STORE_PURGE_INTERVAL', '60'))
+}
+
+# LLM HTTP Client (async pooled transport)
+LLM_CLIENT_SETTINGS = {
+    'base_url': os.getenv('TOGETHER_BASE_URL', 'https://api.together.xyz/v1'),
+    'use_async_transport': os.getenv('LLM_USE_ASYNC_TRANSPORT', 'True').lower() == 'true',
+    'max_connections': int(os.getenv('LLM_MAX_CONNECTIONS', '20')),
+    'max_keepalive_connections': int(os.getenv('LLM_MAX_KEEPALIVE_CONNECTIONS', '10')),
+    'keepalive_expiry': float(os.getenv('LLM_KEEPALIVE_EXPIRY', '30')),
+    'connect_timeout': float(os.getenv('LLM_CONNECT_TIMEOUT', '5')),
+    # Request giống hệt nhau (double-click, retry) đang in-flight thì dùng chung một provider call
+    'coalesce_identical_requests': os.getenv('LLM_COALESCE_REQUESTS', 'True').lower() == 'true'
+}
+
+# Rate limiter + priority queue trước LLM provider (tránh burst 429 trên free tier)
+LLM_RATE_LIMIT_SETTINGS = {
+    'enabled': os.getenv('LLM_RATE_LIMIT_ENABLED', 'True').lower() == 'true',
+    'requests_per_second': float(os.getenv('LLM_RATE_LIMIT_RPS', '8')),
+    'burst': int(os.getenv('LLM_RATE_LIMIT_BURST', '16')),
+    'max_queue': int(os.getenv('LLM_QUEUE_MAX_SIZE', '100')),
+    'max_wait_seconds': float(os.getenv('LLM_QUEUE_MAX_WAIT', '10')),  # Chờ lâu hơn thì dùng fallback
+    'backend': os.getenv('LLM_RATE_LIMIT_BACKEND', 'memory'),  # memory | sqlite (chung giữa các workers)
+    'path': os.getenv('LLM_RATE_LIMIT_PATH', 'cache/llm_rate_limit.sqlite3')
+}
+
+# Hedged requests: gửi request dự phòng khi call chậm hơn rolling p95 của call type (opt-in)
+LLM_HEDGING_SETTINGS = {
+    'enabled': os.getenv('LLM_HEDGING_ENABLED', 'False').lower() == 'true',
+    'percentile': float(os.getenv('LLM_HEDGING_PERCENTILE', '0.95')),
+    'max_hedge_ratio': float(os.getenv('LLM_HEDGING_MAX_RATIO', '0.1')),  # Tối đa 10% request có hedge
+    'min_samples': int(os.getenv('LLM_HEDGING_MIN_SAMPLES', '20')),  # Chưa đủ samples thì không hedge
+    'window_size': int(os.getenv('LLM_HEDGING_WINDOW_SIZE', '200')),
+    'min_delay_seconds': float(os.getenv('LLM_HEDGING_MIN_DELAY', '0.05')),
+    'max_burst': int(os.getenv('LLM_HEDGING_MAX_BURST', '5'))
+}
+
+# Circuit breaker cho Together AI (chuyển sang rule-based khi provider lỗi)
+CIRCUIT_BREAKER_SETTINGS = {
+    'enabled': os.getenv('CIRCUIT_BREAKER_ENABLED', 'True').lower() == 'true',
+    'window_seconds': float(os.getenv('CIRCUIT_BREAKER_WINDOW_SECONDS', '60')),
+    'min_requests': int(os.getenv('CIRCUIT_BREAKER_MIN_REQUESTS', '5')),
+    'failure_rate_threshold': float(os.getenv('CIRCUIT_BREAKER_FAILURE_RATE', '0.5')),
+    'slow_call_seconds': float(os.getenv('CIRCUIT_BREAKER_SLOW_CALL_SECONDS', '10')),
+    'slow_call_rate_threshold': float(os.getenv('CIRCUIT_BREAKER_SLOW_CALL_RATE', '0.8')),
+    'open_seconds': float(os.getenv('CIRCUIT_BREAKER_OPEN_SECONDS', '30')),  # Thời gian chờ trước khi probe lại
+    'half_open_max_calls': int(os.getenv('CIRCUIT_BREAKER_HALF_OPEN_CALLS', '1'))
 }
 
 # Development and Testing
@@ -163,6 +249,19 @@ DEVELOPMENT_SETTINGS = {
     'save_conversation_transcripts': os.getenv('SAVE_CONVERSATION_TRANSCRIPTS', 'False').lower() == 'true'
 }
 
+# Mock LLM (dùng khi mock_ai_responses=True hoặc chạy src/services/mock_llm.py)
+MOCK_LLM_SETTINGS = {
+    'latency_distribution': os.getenv('MOCK_LLM_LATENCY_DISTRIBUTION', 'fixed'),  # fixed | lognormal | spike | spike_lognormal
+    'latency_ms': float(os.getenv('MOCK_LLM_LATENCY_MS', '300')),
+    'latency_sigma': float(os.getenv('MOCK_LLM_LATENCY_SIGMA', '0.5')),
+    'spike_probability': float(os.getenv('MOCK_LLM_SPIKE_PROBABILITY', '0.0')),
+    'spike_ms': float(os.getenv('MOCK_LLM_SPIKE_MS', '5000')),
+    'error_rate': float(os.getenv('MOCK_LLM_ERROR_RATE', '0.0')),
+    'error_status': int(os.getenv('MOCK_LLM_ERROR_STATUS', '503')),
+    'tokens_per_second': float(os.getenv('MOCK_LLM_TOKENS_PER_SECOND', '40')),
+    'seed': int(os.environ['MOCK_LLM_SEED']) if os.getenv('MOCK_LLM_SEED') else None
+}
+
 # === HELPER FUNCTIONS ===
 
 def get_assessment_config(assessment_type: str) -> Dict[str, Any]:
@@ -230,6 +329,60 @@ def validate_config() -> List[str]:
     if AI_ANALYSIS_SETTINGS['max_tokens'] < 50 or AI_ANALYSIS_SETTINGS['max_tokens'] > 1000:
         issues.append("AI max_tokens should be between 50 and 1000")
     
+    if AI_ANALYSIS_SETTINGS['cache_backend'] not in ('memory', 'sqlite'):
+        issues.append("AI_ANALYSIS_CACHE_BACKEND must be 'memory' or 'sqlite'")
+    
+    if AI_ANALYSIS_SETTINGS['cache_max_entries'] < 1:
+        issues.append("AI_ANALYSIS_CACHE_MAX_ENTRIES must be at least 1")
+    
+    if AI_ANALYSIS_SETTINGS['local_model_mode'] not in ('off', 'primary', 'shadow', 'fallback'):
+        issues.append("LOCAL_MODEL_MODE must be off, primary, shadow or fallback")
+    
+    if PERFORMANCE_SETTINGS['classifier_mode'] not in ('batched', 'concurrent', 'sequential'):
+        issues.append("AI_CLASSIFIER_MODE must be batched, concurrent or sequential")
+    
+    if STARTUP_SETTINGS['llm_warmup_timeout_seconds'] <= 0:
+        issues.append("LLM_WARMUP_TIMEOUT must be positive")
+    
+    if AI_USAGE_CONTROL['max_ai_calls_per_session'] < 0 or AI_USAGE_CONTROL['max_ai_tokens_per_session'] < 0:
+        issues.append("MAX_AI_CALLS_PER_SESSION and MAX_AI_TOKENS_PER_SESSION must not be negative (0 = unlimited)")
+    
+    if AI_USAGE_CONTROL['ai_analysis_interval'] < 1:
+        issues.append("AI_ANALYSIS_INTERVAL must be at least 1")
+    
+    if not 0.0 < PREFILTER_SETTINGS['skip_below'] <= 1.0:
+        issues.append("SEVERITY_PREFILTER_SKIP_BELOW must be between 0.0 and 1.0")
+    
+    if not 0.0 <= PREFILTER_SETTINGS['shadow_rate'] <= 1.0:
+        issues.append("SEVERITY_PREFILTER_SHADOW_RATE must be between 0.0 and 1.0")
+    
+    if CONVERSATION_STORE_SETTINGS['backend'] not in ('memory', 'sqlite'):
+        issues.append("CONVERSATION_STORE_BACKEND must be 'memory' or 'sqlite'")
+    
+    if CONVERSATION_STORE_SETTINGS['max_sessions'] < 1:
+        issues.append("CONVERSATION_STORE_MAX_SESSIONS must be at least 1")
+    
+    if MOCK_LLM_SETTINGS['latency_distribution'] not in ('fixed', 'lognormal', 'spike', 'spike_lognormal'):
+        issues.append("MOCK_LLM_LATENCY_DISTRIBUTION must be fixed, lognormal, spike or spike_lognormal")
+    
+    if LLM_RATE_LIMIT_SETTINGS['requests_per_second'] <= 0 or LLM_RATE_LIMIT_SETTINGS['burst'] < 1:
+        issues.append("LLM_RATE_LIMIT_RPS must be positive and LLM_RATE_LIMIT_BURST at least 1")
+    
+    if LLM_RATE_LIMIT_SETTINGS['max_queue'] < 1 or LLM_RATE_LIMIT_SETTINGS['max_wait_seconds'] <= 0:
+        issues.append("LLM_QUEUE_MAX_SIZE must be at least 1 and LLM_QUEUE_MAX_WAIT positive")
+    
+    if LLM_RATE_LIMIT_SETTINGS['backend'] not in ('memory', 'sqlite'):
+        issues.append("LLM_RATE_LIMIT_BACKEND must be 'memory' or 'sqlite'")
+    
+    if not 0.0 < LLM_HEDGING_SETTINGS['percentile'] < 1.0:
+        issues.append("LLM_HEDGING_PERCENTILE must be between 0.0 and 1.0")
+    
+    if not 0.0 <= LLM_HEDGING_SETTINGS['max_hedge_ratio'] <= 1.0:
+        issues.append("LLM_HEDGING_MAX_RATIO must be between 0.0 and 1.0")
+    
+    if not 0.0 < CIRCUIT_BREAKER_SETTINGS['failure_rate_threshold'] <= 1.0:
+        issues.append("CIRCUIT_BREAKER_FAILURE_RATE must be between 0.0 and 1.0")
+    
     return issues
 
 # Run validation on import
@@ -243,8 +396,10 @@ if _config_issues and FLASK_ENV == 'development':
 __all__ = [
     'TOGETHER_API_KEY', 'TOGETHER_MODEL', 'SECRET_KEY',
     'SIMPLIFIED_TRANSITION_THRESHOLDS', 'AI_ANALYSIS_SETTINGS',
-    'CONVERSATION_DEPTH_WEIGHTS', 'AI_USAGE_CONTROL',
-    'SAFETY_SETTINGS', 'ASSESSMENT_TYPES',
+    'CONVERSATION_DEPTH_WEIGHTS', 'AI_USAGE_CONTROL', 'PREFILTER_SETTINGS',
+    'SAFETY_SETTINGS', 'ASSESSMENT_TYPES', 'LLM_CLIENT_SETTINGS',
+    'CONVERSATION_STORE_SETTINGS', 'STARTUP_SETTINGS',
+    'LLM_RATE_LIMIT_SETTINGS', 'LLM_HEDGING_SETTINGS', 'CIRCUIT_BREAKER_SETTINGS', 'DEVELOPMENT_SETTINGS', 'MOCK_LLM_SETTINGS',
     'get_assessment_config', 'get_transition_threshold',
     'get_ai_model_config', 'is_ai_analysis_enabled',
     'get_safety_threshold', 'should_use_fallback',
@@ -0,0 +1,3 @@
+"""
+Scripts - Công cụ offline (train local classifier, ...)
+"""
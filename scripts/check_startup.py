@@ -0,0 +1,73 @@
+"""
+Check Startup - Import-time budget cho app (chạy trong process mới)
+
+Đo thời gian `import app` (bao gồm create_app) và kiểm tra không có LLM
+request nào được gửi trong lúc khởi động. Exit code 1 nếu vượt budget.
+
+Ví dụ:
+    python -m scripts.check_startup
+    python -m scripts.check_startup --budget-ms 1500 --runs 5
+
+    # Không có network: boot vẫn phải thành công và nằm trong budget
+    TOGETHER_BASE_URL=http://10.255.255.1 python -m scripts.check_startup
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Chạy trong subprocess: đo import + create_app và đếm LLM calls
+PROBE = """
+import json, sys, time
+started = time.perf_counter()
+import app
+elapsed = time.perf_counter() - started
+from src.services import together_client
+print(json.dumps({
+    'seconds': elapsed,
+    'llm_calls': together_client.get_llm_call_stats()['calls'],
+    'sdk_client_created': together_client._together_client is not None,
+    'warmup': together_client.get_llm_warmup_status()['status']
+}))
+"""
+
+def parse_args(argv=None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description='Check app import/startup time budget')
+    parser.add_argument('--budget-ms', type=float, default=2000.0, help='Budget cho median startup time')
+    parser.add_argument('--runs', type=int, default=3, help='Số lần đo (lấy median)')
+    return parser.parse_args(argv)
+
+def measure_startup() -> dict:
+    """Một lần `import app` trong process mới"""
+    output = subprocess.check_output(
+        [sys.executable, '-c', PROBE], cwd=ROOT_DIR, stderr=subprocess.DEVNULL, env=os.environ.copy()
+    )
+    return json.loads(output.decode().strip().splitlines()[-1])
+
+def main(argv=None) -> int:
+    args = parse_args(argv)
+
+    runs = [measure_startup() for _ in range(args.runs)]
+    median_ms = statistics.median(run['seconds'] for run in runs) * 1000
+    problems = []
+
+    if median_ms > args.budget_ms:
+        problems.append(f"startup {median_ms:.0f}ms exceeds budget {args.budget_ms:.0f}ms")
+    if any(run['llm_calls'] for run in runs):
+        problems.append("LLM requests were sent during startup")
+    if any(run['sdk_client_created'] for run in runs):
+        problems.append("Together SDK client was created during startup")
+
+    print(f"Startup: median {median_ms:.0f}ms over {args.runs} runs "
+          f"(budget {args.budget_ms:.0f}ms, warm-up {runs[-1]['warmup']})")
+    for problem in problems:
+        print(f"FAIL: {problem}")
+    return 1 if problems else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,129 @@
+"""
+Import-Time Report - Profile `python -X importtime` của app và kiểm tra regression
+
+In các module tốn thời gian import nhất (cumulative), tổng thời gian import và
+fail (exit code 1) khi:
+    - tổng thời gian vượt --max-total-ms
+    - một heavy dependency (reportlab, together, pandas, numpy, ...) bị import lúc khởi động
+    - chậm hơn baseline quá --max-regression (khi có --compare)
+
+Ví dụ:
+    python -m scripts.importtime_report
+    python -m scripts.importtime_report --top 30 --save benchmarks/results/importtime.json
+    python -m scripts.importtime_report --compare benchmarks/results/importtime.json --max-regression 0.25
+"""
+
+import argparse
+import json
+import os
+import re
+import subprocess
+import sys
+from typing import Dict, List, Tuple
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Chỉ được import khi dùng lần đầu (PDF export, local model, SDK fallback, analytics)
+DEFERRED_MODULES = ['reportlab', 'together', 'pandas', 'numpy', 'matplotlib', 'weasyprint']
+
+IMPORTTIME_LINE = re.compile(r'^import time:\s+(\d+)\s+\|\s+(\d+)\s+\|\s*(\S+)\s*$')
+
+def parse_args(argv=None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description='Import-time profile of the app with regression checks')
+    parser.add_argument('--module', default='app', help='Module cần import (mặc định app, gồm create_app)')
+    parser.add_argument('--top', type=int, default=20, help='Số module chậm nhất được in ra')
+    parser.add_argument('--max-total-ms', type=float, default=1500.0, help='Ngưỡng tổng thời gian import')
+    parser.add_argument('--allow', action='append', default=[], help='Cho phép một deferred module')
+    parser.add_argument('--save', help='Ghi profile ra file JSON (làm baseline)')
+    parser.add_argument('--compare', help='Baseline JSON để so sánh')
+    parser.add_argument('--max-regression', type=float, default=0.25, help='Tỉ lệ chậm hơn baseline cho phép')
+    return parser.parse_args(argv)
+
+def run_importtime(module: str) -> Tuple[float, List[Dict]]:
+    """
+    Chạy `python -X importtime -c "import <module>"` trong process mới
+
+    Tổng thời gian được đo bằng wall clock quanh import: indent của importtime
+    không đáng tin khi background threads (LLM warm-up) cũng import module.
+
+    Return: (total_ms, [{'module', 'self_us', 'cumulative_us'}] theo thứ tự output)
+    """
+    probe = (
+        "import sys, time\n"
+        "started = time.perf_counter()\n"
+        f"import {module}\n"
+        "sys.stdout.write(str(time.perf_counter() - started))\n"
+    )
+    process = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', probe],
+        cwd=ROOT_DIR, capture_output=True, text=True, env=os.environ.copy()
+    )
+    if process.returncode != 0:
+        raise RuntimeError(f"import {module} failed:\n{process.stderr[-2000:]}")
+    total_ms = round(float(process.stdout.strip().splitlines()[-1]) * 1000, 1)
+
+    entries = []
+    for line in process.stderr.splitlines():
+        match = IMPORTTIME_LINE.match(line)
+        if match:
+            entries.append({
+                'module': match.group(3),
+                'self_us': int(match.group(1)),
+                'cumulative_us': int(match.group(2))
+            })
+    return total_ms, entries
+
+def summarize(total_ms: float, entries: List[Dict], top: int = 20) -> Dict:
+    """Profile summary để lưu làm baseline"""
+    slowest = sorted(entries, key=lambda entry: entry['cumulative_us'], reverse=True)[:top]
+    return {
+        'total_ms': total_ms,
+        'modules': len(entries),
+        'slowest_ms': {entry['module']: round(entry['cumulative_us'] / 1000, 1) for entry in slowest}
+    }
+
+def find_deferred(entries: List[Dict], allowed: List[str]) -> List[str]:
+    """Heavy modules bị import lúc khởi động"""
+    imported = {entry['module'].split('.')[0] for entry in entries}
+    return [name for name in DEFERRED_MODULES if name in imported and name not in allowed]
+
+def main(argv=None) -> int:
+    args = parse_args(argv)
+
+    total_ms, entries = run_importtime(args.module)
+    summary = summarize(total_ms, entries, args.top)
+    problems = []
+
+    print(f"import {args.module}: {summary['total_ms']}ms total, {summary['modules']} modules")
+    print(f"\n{'cumulative':>12} {'self':>10}  module")
+    for entry in sorted(entries, key=lambda item: item['cumulative_us'], reverse=True)[:args.top]:
+        print(f"{entry['cumulative_us'] / 1000:>10.1f}ms {entry['self_us'] / 1000:>8.1f}ms  {entry['module']}")
+
+    if summary['total_ms'] > args.max_total_ms:
+        problems.append(f"total import time {summary['total_ms']}ms exceeds {args.max_total_ms:.0f}ms")
+
+    for name in find_deferred(entries, args.allow):
+        problems.append(f"'{name}' is imported at startup (should be deferred until first use)")
+
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as f:
+            baseline = json.load(f)
+        limit = baseline['total_ms'] * (1 + args.max_regression)
+        print(f"\nBaseline {args.compare}: {baseline['total_ms']}ms (limit {limit:.1f}ms)")
+        if summary['total_ms'] > limit:
+            problems.append(f"import time regressed from {baseline['total_ms']}ms to {summary['total_ms']}ms")
+
+    if args.save:
+        directory = os.path.dirname(args.save)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with open(args.save, 'w', encoding='utf-8') as f:
+            json.dump(summary, f, indent=2)
+        print(f"Profile saved to {args.save}")
+
+    for problem in problems:
+        print(f"FAIL: {problem}")
+    return 1 if problems else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
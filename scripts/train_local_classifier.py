@@ -0,0 +1,87 @@
+"""
+Train Local Classifier - Distill LLM context analysis thành model NumPy chạy local
+
+Labels được ghi khi bật AI_ANALYSIS_LABEL_LOG (mỗi dòng: text, history, parsed LLM label).
+
+Ví dụ:
+    python -m scripts.train_local_classifier logs/analysis_labels.jsonl --version v1
+
+    # Nhiều file label, giữ lại 20% để đánh giá
+    python -m scripts.train_local_classifier logs/labels_*.jsonl --holdout 0.2 \\
+        --output models/emotion_classifier_v2.npz --version v2
+
+Weights file (.npz) được load bởi AIContextAnalyzer khi LOCAL_MODEL_MODE khác 'off'.
+"""
+
+import argparse
+import glob
+import logging
+import os
+import random
+import sys
+import time
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def parse_args(argv=None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description='Train the local emotion classifier from recorded LLM labels')
+    parser.add_argument('labels', nargs='+', help='JSONL label files (glob patterns được hỗ trợ)')
+    parser.add_argument('--version', required=True, help='Model version ghi vào weights file, ví dụ v1')
+    parser.add_argument('--output', help='Weights file (mặc định models/emotion_classifier_<version>.npz)')
+    parser.add_argument('--n-features', type=int, default=2 ** 15, help='Số hash buckets')
+    parser.add_argument('--min-ngram', type=int, default=2)
+    parser.add_argument('--max-ngram', type=int, default=4)
+    parser.add_argument('--epochs', type=int, default=15)
+    parser.add_argument('--learning-rate', type=float, default=0.5)
+    parser.add_argument('--l2', type=float, default=1e-5)
+    parser.add_argument('--min-confidence', type=float, default=0.0, help='Bỏ label có LLM confidence thấp hơn')
+    parser.add_argument('--holdout', type=float, default=0.1, help='Tỉ lệ examples dùng để đánh giá')
+    parser.add_argument('--seed', type=int, default=42)
+    return parser.parse_args(argv)
+
+def main(argv=None) -> int:
+    args = parse_args(argv)
+    logging.basicConfig(level=logging.INFO)
+
+    if ROOT_DIR not in sys.path:
+        sys.path.insert(0, ROOT_DIR)
+    from src.services.local_classifier import (
+        HashedNgramFeaturizer, LocalEmotionClassifier, load_label_examples
+    )
+
+    paths = sorted({path for pattern in args.labels for path in (glob.glob(pattern) or [pattern])})
+    examples = load_label_examples(paths, min_confidence=args.min_confidence)
+    if len(examples) < 10:
+        print(f"Not enough labelled examples in {paths} ({len(examples)})")
+        return 1
+
+    random.Random(args.seed).shuffle(examples)
+    holdout_size = int(len(examples) * args.holdout)
+    holdout, training = examples[:holdout_size], examples[holdout_size:]
+
+    model = LocalEmotionClassifier(HashedNgramFeaturizer(
+        n_features=args.n_features, ngram_range=(args.min_ngram, args.max_ngram)
+    ))
+    started = time.perf_counter()
+    training_metrics = model.fit(
+        training, epochs=args.epochs, learning_rate=args.learning_rate, l2=args.l2, seed=args.seed
+    )
+    training_seconds = time.perf_counter() - started
+
+    evaluation = model.evaluate(holdout)
+    output = args.output or os.path.join(ROOT_DIR, 'models', f"emotion_classifier_{args.version}.npz")
+    model.save(output, args.version, {
+        'training': {**training_metrics, 'seconds': round(training_seconds, 2), 'label_files': paths},
+        'holdout': evaluation
+    })
+
+    print(f"Trained on {training_metrics['examples']} examples in {training_seconds:.1f}s "
+          f"(loss {training_metrics['loss']})")
+    if holdout:
+        print(f"Holdout ({evaluation['examples']}): type accuracy {evaluation['type_accuracy']}, "
+              f"severity MAE {evaluation['severity_mae']}")
+    print(f"Weights saved to {output} ({os.path.getsize(output) / 1024:.0f} KB)")
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
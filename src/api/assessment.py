@@ -5,7 +5,7 @@ Enhanced version compatible with existing project structure
 
 import logging
 import json
-from flask import Blueprint, request, jsonify, render_template
+from flask import Blueprint, request, jsonify, render_template, current_app
 from datetime import datetime
 from typing import Dict, List, Optional, Any
 
@@ -30,6 +30,14 @@ except ImportError:
             return False
         return len(answers) > 0
 
+from src.services.questionnaire_registry import QuestionnaireRegistry, CachedPayload, splice_json
+
+try:
+    from config import PERFORMANCE_SETTINGS
+    QUESTIONNAIRE_CACHE_MAX_AGE = PERFORMANCE_SETTINGS.get('questionnaire_cache_max_age', 3600)
+except ImportError:
+    QUESTIONNAIRE_CACHE_MAX_AGE = 3600
+
 logger = logging.getLogger(__name__)
 
 # Create blueprint với tên unique để tránh conflicts
@@ -435,28 +443,52 @@ STANDARD_QUESTIONNAIRES = {
     }
 }
 
+# Registry build một lần lúc import: payloads tĩnh được serialize sẵn kèm ETag
+questionnaire_registry = QuestionnaireRegistry(STANDARD_QUESTIONNAIRES)
+
+def _check_questionnaire_sources() -> None:
+    """Cảnh báo khi data/questionnaires.py hoặc config.ASSESSMENT_TYPES lệch với registry"""
+    sources = {}
+    try:
+        from data.questionnaires import questionnaires
+        sources['data.questionnaires'] = {
+            key: {'question_count': len(value.get('questions', [])),
+                  'max_score': value.get('scoring_info', {}).get('max_score')}
+            for key, value in questionnaires.items()
+        }
+    except ImportError:
+        pass
+    try:
+        from config import ASSESSMENT_TYPES
+        sources['config.ASSESSMENT_TYPES'] = {
+            key: {'question_count': value.get('questions'), 'max_score': value.get('max_score')}
+            for key, value in ASSESSMENT_TYPES.items()
+        }
+    except ImportError:
+        pass
+    questionnaire_registry.check_consistency(sources)
+
+_check_questionnaire_sources()
+
+def _cached_json_response(payload: CachedPayload):
+    """
+    Response từ bytes có sẵn, hỗ trợ If-None-Match (304) và Cache-Control
+    
+    Browser / proxy cache lại questionnaire; request lặp lại chỉ tốn so sánh ETag.
+    """
+    response = current_app.response_class(payload.body, mimetype='application/json')
+    response.set_etag(payload.etag)
+    response.cache_control.public = True
+    response.cache_control.max_age = QUESTIONNAIRE_CACHE_MAX_AGE
+    return response.make_conditional(request)
+
 # API Routes - FIXED: Chỉ API routes, không có page routes
 
 @assessment_bp.route('/types', methods=['GET'])
 def get_assessment_types():
     """Get available assessment types for API calls"""
     try:
-        assessment_types = {}
-        for key, data in STANDARD_QUESTIONNAIRES.items():
-            assessment_types[key] = {
-                'name': key.upper(),
-                'title': data['title'],
-                'description': data['description'],
-                'question_count': data['question_count'],
-                'estimated_time': data['estimated_time'],
-                'category': data['category']
-            }
-        
-        return jsonify({
-            'success': True,
-            'assessment_types': assessment_types,
-            'total_types': len(assessment_types)
-        })
+        return _cached_json_response(questionnaire_registry.types_payload())
         
     except Exception as e:
         logger.error(f"Error getting assessment types: {e}")
@@ -493,7 +525,7 @@ def start_assessment():
         mode = data.get('mode', 'poll')  # Default to poll mode
         
         # FIXED: Use internal assessment types list instead of missing class
-        if not assessment_type or assessment_type not in ASSESSMENT_TYPES_LIST:
+        if not assessment_type or assessment_type not in ASSESSMENT_TYPES_LIST or assessment_type not in questionnaire_registry:
             return jsonify({
                 'error': 'Invalid assessment type',
                 'message': 'Loại đánh giá không hợp lệ',
@@ -507,48 +539,24 @@ def start_assessment():
                 'message': 'Mã phiên làm việc không hợp lệ'
             }), 400
         
-        # Get questionnaire data
-        questionnaire = STANDARD_QUESTIONNAIRES[assessment_type]
-        
-        # Prepare response based on mode
+        # Prepare response based on mode - questionnaire / first question đã serialize sẵn
+        response_data = {
+            'success': True,
+            'assessment_type': assessment_type,
+            'session_id': session_id,
+            'mode': 'poll' if mode == 'poll' else 'chat',
+            'started_at': datetime.now().isoformat()
+        }
         if mode == 'poll':
             # Poll mode - return all questions for frontend handling
-            response_data = {
-                'success': True,
-                'assessment_type': assessment_type,
-                'session_id': session_id,
-                'mode': 'poll',
-                'questionnaire': {
-                    'title': questionnaire['title'],
-                    'description': questionnaire['description'],
-                    'instructions': questionnaire['instructions'],
-                    'question_count': questionnaire['question_count'],
-                    'estimated_time': questionnaire['estimated_time'],
-                    'questions': questionnaire['questions'],
-                    'scoring': questionnaire['scoring']
-                },
-                'started_at': datetime.now().isoformat()
-            }
+            body = splice_json(response_data, 'questionnaire', questionnaire_registry.questionnaire_json(assessment_type))
         else:
             # Chat mode - return first question only
-            first_question = questionnaire['questions'][0]
-            response_data = {
-                'success': True,
-                'assessment_type': assessment_type,
-                'session_id': session_id,
-                'mode': 'chat',
-                'current_question': {
-                    'index': 0,
-                    'total': questionnaire['question_count'],
-                    'question': first_question,
-                    'instructions': questionnaire['instructions']
-                },
-                'started_at': datetime.now().isoformat()
-            }
+            body = splice_json(response_data, 'current_question', questionnaire_registry.first_question_json(assessment_type))
         
         _log_assessment_activity(assessment_type, session_id, 'start', mode=mode)
         
-        return jsonify(response_data)
+        return current_app.response_class(body, mimetype='application/json')
         
     except Exception as e:
         logger.error(f"Error starting assessment: {e}")
@@ -557,35 +565,38 @@ def start_assessment():
             'message': 'Không thể bắt đầu đánh giá'
         }), 500
 
+@assessment_bp.route('/questionnaire/<assessment_type>', methods=['GET'])
+def get_questionnaire(assessment_type):
+    """Get full questionnaire (cacheable, ETag / If-None-Match)"""
+    payload = questionnaire_registry.questionnaire_payload(assessment_type)
+    if payload is None:
+        return jsonify({
+            'error': 'Invalid assessment type',
+            'message': 'Loại đánh giá không hợp lệ'
+        }), 400
+    
+    return _cached_json_response(payload)
+
 @assessment_bp.route('/question/<assessment_type>/<int:question_index>', methods=['GET'])
 def get_question(assessment_type, question_index):
     """Get specific question for chat mode"""
     try:
         # Validate assessment type
-        if assessment_type not in STANDARD_QUESTIONNAIRES:
+        if assessment_type not in questionnaire_registry:
             return jsonify({
                 'error': 'Invalid assessment type',
                 'message': 'Loại đánh giá không hợp lệ'
             }), 400
         
-        questionnaire = STANDARD_QUESTIONNAIRES[assessment_type]
-        
         # Validate question index
-        if question_index < 0 or question_index >= len(questionnaire['questions']):
+        payload = questionnaire_registry.question_payload(assessment_type, question_index)
+        if payload is None:
             return jsonify({
                 'error': 'Invalid question index',
                 'message': 'Chỉ số câu hỏi không hợp lệ'
             }), 400
         
-        question = questionnaire['questions'][question_index]
-        
-        return jsonify({
-            'success': True,
-            'question': question,
-            'index': question_index,
-            'total': len(questionnaire['questions']),
-            'progress': round((question_index / len(questionnaire['questions'])) * 100, 1)
-        })
+        return _cached_json_response(payload)
         
     except Exception as e:
         logger.error(f"Error getting question: {e}")
@@ -631,7 +642,7 @@ def submit_assessment():
                 'message': 'Mã phiên làm việc không hợp lệ'
             }), 400
         
-        if not assessment_type or assessment_type not in STANDARD_QUESTIONNAIRES:
+        if not assessment_type or assessment_type not in questionnaire_registry:
             return jsonify({
                 'error': 'Invalid assessment type',
                 'message': 'Loại đánh giá không hợp lệ'
@@ -651,7 +662,7 @@ def submit_assessment():
             }), 400
         
         # Get questionnaire for scoring
-        questionnaire = STANDARD_QUESTIONNAIRES[assessment_type]
+        questionnaire = questionnaire_registry.get(assessment_type)
         
         # Calculate results
         results = _calculate_assessment_results(assessment_type, answers, questionnaire)
@@ -1047,4 +1058,4 @@ def internal_error(error):
     }), 500
 
 # Export the blueprint
-__all__ = ['assessment_bp', 'STANDARD_QUESTIONNAIRES']
\ No newline at end of file
+__all__ = ['assessment_bp', 'STANDARD_QUESTIONNAIRES', 'questionnaire_registry']
\ No newline at end of file
@@ -3,16 +3,30 @@ Chat API - SỬA ĐỔI NHỎ để tương thích với transition logic mới
 Updated to handle AI analysis errors and fallbacks
 """
 
-from flask import Blueprint, request, jsonify, session
+from flask import Blueprint, request, jsonify, session, current_app, Response, stream_with_context
+import copy
+import json
 import logging
-from typing import Dict, List, Any, Optional
+from typing import Dict, List, Any, Optional, Tuple
 import traceback
+import uuid
 from datetime import datetime
 
 from src.core.chat_engine import create_chat_engine
-from src.services.ai_context_analyzer import initialize_ai_analyzer
+from src.services.ai_context_analyzer import initialize_ai_analyzer, get_analysis_cache_stats, get_local_model_stats
+from src.services.together_client import get_circuit_breaker_stats, get_coalescing_stats
+from src.services.worker_pool import get_chat_worker_pool, get_worker_pool_stats
+from src.services.conversation_store import get_conversation_store
+from src.core.severity_prefilter import get_prefilter_stats
+from src.services.usage_ledger import session_budget_scope, get_session_budget, get_usage_ledger_stats
+from src.services.hedging import get_hedging_stats
+from src.services.rate_limiter import (
+    PRIORITY_BACKGROUND, PRIORITY_TRANSITION, llm_priority_scope, get_rate_limiter_stats
+)
 from src.utils.validators import validate_message, validate_chat_state
+from src.utils.metrics import track_stage
 from src.utils.constants import ERROR_MESSAGES, SUCCESS_MESSAGES
+from config import PERFORMANCE_SETTINGS
 
 logger = logging.getLogger(__name__)
 
@@ -24,13 +38,18 @@ chat_engine = None
 ai_analyzer_initialized = False
 
 def initialize_chat_services():
-    """Initialize chat services"""
+    """
+    Initialize chat services
+    
+    Gọi một lần khi register blueprint (không chạy lúc import), không gửi LLM request.
+    """
     global chat_engine, ai_analyzer_initialized
     
     try:
         # Initialize chat engine
-        chat_engine = create_chat_engine()
-        logger.info("Chat engine initialized successfully")
+        if chat_engine is None:
+            chat_engine = create_chat_engine()
+            logger.info("Chat engine initialized successfully")
         
         # Initialize AI analyzer
         ai_analyzer_initialized = initialize_ai_analyzer()
@@ -43,9 +62,6 @@ def initialize_chat_services():
     except Exception as e:
         logger.error(f"Failed to initialize chat services: {e}")
         return False
-
-# Initialize on module load
-initialize_chat_services()
 @chat_bp.route('/send', methods=['POST'])
 @chat_bp.route('/send_message', methods=['POST'])
 def send_message():
@@ -70,10 +86,17 @@ def send_message():
         
         # Extract required fields
         message = data.get('message', '').strip()
-        history = data.get('history', [])
-        state = data.get('state', {})
         use_ai = data.get('use_ai', True)
         
+        # NEW: Delta protocol - không có history trong request thì dùng conversation store
+        server_side = 'history' not in data
+        if server_side:
+            session_id = get_chat_session_id()
+            history, state = load_server_conversation(session_id)
+        else:
+            history = data.get('history', [])
+            state = data.get('state', {})
+        
         # Validate input
         if not validate_message(message):
             return jsonify({
@@ -92,13 +115,16 @@ def send_message():
             state = {
                 'current_phase': 'chat',
                 'message_count': 0,
-                'session_id': session.get('session_id', 'default'),
+                'session_id': get_chat_session_id(),  # Key của LLM budget ledger
                 'language': 'vi',
                 'created_at': datetime.now().isoformat(),
                 'ai_analysis_count': 0,
                 'fallback_mode': False
             }
         
+        # Budget ledger key luôn do server quyết định - bỏ qua session_id client gửi trong state
+        state['session_id'] = get_chat_session_id()
+        
         # Check if chat engine is available
         if not chat_engine:
             logger.error("Chat engine not initialized")
@@ -115,8 +141,7 @@ def send_message():
                 message=message,
                 history=history,
                 state=state,
-                use_ai=use_ai and ai_analyzer_initialized,
-                timeout_seconds=30
+                use_ai=use_ai and ai_analyzer_initialized
             )
             
         except TimeoutError:
@@ -166,20 +191,32 @@ def send_message():
             }), 500
         
         # NEW: Add metadata về AI usage
-        response_data = {
-            'message': result['message'],
-            'history': result.get('history', history),
-            'state': result.get('state', state),
-            'metadata': result.get('metadata', {}),
-            'success': True
-        }
+        if server_side:
+            # Chỉ trả về phần mới, history + state đầy đủ nằm trong store
+            history_delta = result.get('history', history)[len(history):]
+            response_data = {
+                'message': result['message'],
+                'history_delta': history_delta,
+                'state': save_server_conversation(session_id, history_delta, result.get('state', state)),
+                'metadata': result.get('metadata', {}),
+                'success': True
+            }
+        else:
+            response_data = {
+                'message': result['message'],
+                'history': result.get('history', history),
+                'state': result.get('state', state),
+                'metadata': result.get('metadata', {}),
+                'success': True
+            }
         
         # Add AI-specific metadata
         response_data['ai_info'] = {
             'ai_analyzer_available': ai_analyzer_initialized,
             'ai_used': result.get('metadata', {}).get('ai_used', False),
             'fallback_mode': state.get('fallback_mode', False),
-            'ai_severity': result.get('metadata', {}).get('ai_severity', 0.0)
+            'ai_severity': result.get('metadata', {}).get('ai_severity', 0.0),
+            'ai_budget': get_session_budget(result.get('state', state).get('session_id'))
         }
         
         # Add warning if in fallback mode
@@ -190,7 +227,9 @@ def send_message():
         logger.info(f"Message processed successfully: AI={response_data['ai_info']['ai_used']}, "
                    f"Fallback={response_data['ai_info']['fallback_mode']}")
         
-        return jsonify(response_data)
+        with track_stage('serialization'):
+            response = jsonify(response_data)
+        return response
         
     except Exception as e:
         # Comprehensive error handling
@@ -206,32 +245,230 @@ def send_message():
         
         return jsonify(error_details), 500
 
-def process_message_with_timeout(message: str, history: List[Dict], state: Dict, use_ai: bool, timeout_seconds: int = 30) -> Dict:
+def process_message_with_timeout(message: str, history: List[Dict], state: Dict, use_ai: bool, timeout_seconds: Optional[float] = None) -> Dict:
     """
     NEW: Process message với timeout handling
+    
+    Chạy trên worker pool dùng chung với deadline thật: request được trả về
+    đúng hạn, và deadline được truyền xuống mọi LLM call của lượt chat.
+    """
+    if timeout_seconds is None:
+        timeout_seconds = PERFORMANCE_SETTINGS.get('request_timeout_seconds', 30)
+    
+    # Worker nhận bản copy của state - worker quá hạn không ghi đè state
+    # mà fallback path đang dùng
+    worker_state = copy.deepcopy(state)
+    
+    return get_chat_worker_pool().run(
+        chat_engine.process_message,
+        timeout_seconds,
+        message=message,
+        history=history,
+        state=worker_state,
+        use_ai=use_ai
+    )
+
+@chat_bp.route('/stream', methods=['POST'])
+def stream_message():
     """
-    import signal
-    import threading
-    from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+    NEW: Stream bot reply bằng Server-Sent Events
     
-    def process_message_worker():
-        """Worker function to process message"""
-        return chat_engine.process_message(
-            message=message,
-            history=history,
-            state=state,
-            use_ai=use_ai
-        )
+    Request body giống /send (không có history = dùng conversation store). Response là text/event-stream:
+        event: token  -> {"text": "..."} cho từng đoạn reply
+        event: done   -> {"message", "state", "history_delta", "metadata", "ai_info", "success"}
+        event: error  -> {"error": "..."} nếu xử lý thất bại
+    """
+    if not request.is_json:
+        return jsonify({
+            'error': 'Content-Type must be application/json',
+            'success': False
+        }), 400
+    
+    data = request.get_json()
+    if not data:
+        return jsonify({
+            'error': 'No JSON data provided',
+            'success': False
+        }), 400
+    
+    message = data.get('message', '').strip()
+    use_ai = data.get('use_ai', True)
+    
+    server_side = 'history' not in data
+    session_id = None
+    if server_side:
+        session_id = get_chat_session_id()
+        history, state = load_server_conversation(session_id)
+    else:
+        history = data.get('history', [])
+        state = data.get('state', {})
+    
+    if not validate_message(message):
+        return jsonify({
+            'error': 'Invalid message format or content',
+            'success': False
+        }), 400
+    
+    if not validate_chat_state(state):
+        return jsonify({
+            'error': 'Invalid chat state format',
+            'success': False
+        }), 400
+    
+    if not state:
+        state = {
+            'current_phase': 'chat',
+            'message_count': 0,
+            'session_id': get_chat_session_id(),  # Key của LLM budget ledger
+            'language': 'vi',
+            'created_at': datetime.now().isoformat(),
+            'ai_analysis_count': 0,
+            'fallback_mode': False
+        }
+    
+    # Budget ledger key luôn do server quyết định - bỏ qua session_id client gửi trong state
+    state['session_id'] = get_chat_session_id()
+    
+    if not chat_engine:
+        logger.error("Chat engine not initialized")
+        return jsonify({
+            'error': 'Chat engine not available',
+            'success': False,
+            'fallback_available': True
+        }), 503
     
-    # Use ThreadPoolExecutor for timeout handling
-    with ThreadPoolExecutor(max_workers=1) as executor:
-        future = executor.submit(process_message_worker)
+    def generate():
         try:
-            result = future.result(timeout=timeout_seconds)
-            return result
-        except FutureTimeoutError:
-            logger.warning(f"Message processing timeout after {timeout_seconds} seconds")
-            raise TimeoutError(f"Processing timeout after {timeout_seconds} seconds")
+            for kind, payload in chat_engine.process_message_stream(
+                message=message,
+                history=history,
+                state=state,
+                use_ai=use_ai and ai_analyzer_initialized
+            ):
+                if kind == 'token':
+                    yield format_sse('token', {'text': payload})
+                    continue
+                
+                result_state = payload.get('state', state)
+                metadata = payload.get('metadata', {})
+                # Client chỉ cần phần mới (user message + bot reply)
+                history_delta = payload.get('history', [])[len(history):]
+                if server_side:
+                    result_state = save_server_conversation(session_id, history_delta, result_state)
+                with track_stage('serialization'):
+                    done_event = format_sse('done', {
+                        'message': payload['message'],
+                        'state': result_state,
+                        'history_delta': history_delta,
+                        'metadata': metadata,
+                        'ai_info': {
+                            'ai_analyzer_available': ai_analyzer_initialized,
+                            'ai_used': metadata.get('ai_used', False),
+                            'fallback_mode': result_state.get('fallback_mode', False),
+                            'ai_severity': metadata.get('ai_severity', 0.0),
+                            'ai_budget': get_session_budget(result_state.get('session_id'))
+                        },
+                        'success': True
+                    })
+                yield done_event
+        except Exception as e:
+            logger.error(f"Unhandled error in stream_message: {e}")
+            yield format_sse('error', {
+                'error': 'Internal server error during message processing',
+                'success': False
+            })
+    
+    return Response(
+        stream_with_context(generate()),
+        mimetype='text/event-stream',
+        headers={
+            'Cache-Control': 'no-cache',
+            'X-Accel-Buffering': 'no'  # Tắt buffering của nginx
+        }
+    )
+
+def format_sse(event: str, data: Dict) -> str:
+    """Format một Server-Sent Event"""
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+# State keys giữ phía server (cached analyses), không gửi về client
+SERVER_ANALYSIS_KEYS = ['conversation_analysis']
+
+def get_chat_session_id() -> str:
+    """session['session_id'] của user, tạo mới nếu chưa có"""
+    if 'session_id' not in session:
+        session['session_id'] = f"session_{datetime.now().strftime('%Y%m%d_%H%M%S')}_{uuid.uuid4().hex[:8]}"
+        session['created_at'] = datetime.now().isoformat()
+    return session['session_id']
+
+def conversation_store():
+    """Global conversation store, TTL theo PERMANENT_SESSION_LIFETIME"""
+    return get_conversation_store(current_app.permanent_session_lifetime.total_seconds())
+
+def load_server_conversation(session_id: str) -> Tuple[List[Dict], Dict]:
+    """
+    Lấy history + state của session từ conversation store
+    
+    Return: (history, state) - state mới nếu session chưa có hội thoại
+    """
+    record = conversation_store().load(session_id)
+    if record is None:
+        return [], {
+            'current_phase': 'chat',
+            'message_count': 0,
+            'session_id': session_id,
+            'language': 'vi',
+            'created_at': datetime.now().isoformat(),
+            'ai_analysis_count': 0,
+            'fallback_mode': False
+        }
+    
+    state = record['state']
+    state.update(record['analyses'])
+    return record['history'], state
+
+def save_server_conversation(session_id: str, new_messages: List[Dict], state: Dict) -> Dict:
+    """
+    Ghi messages mới + state vào conversation store
+    
+    Return: State để trả về client (không gồm cached analyses)
+    """
+    public_state = dict(state)
+    analyses = {key: public_state.pop(key) for key in SERVER_ANALYSIS_KEYS if key in public_state}
+    conversation_store().append(session_id, new_messages, public_state, analyses)
+    return public_state
+
+@chat_bp.route('/conversation', methods=['GET'])
+def get_conversation():
+    """NEW: History + state phía server để client hiển thị lại sau khi reload trang"""
+    try:
+        history, state = load_server_conversation(get_chat_session_id())
+        public_state = {key: value for key, value in state.items() if key not in SERVER_ANALYSIS_KEYS}
+        return jsonify({
+            'history': history,
+            'state': public_state,
+            'success': True
+        })
+    except Exception as e:
+        logger.error(f"Error loading conversation: {e}")
+        return jsonify({
+            'error': 'Could not load conversation',
+            'success': False
+        }), 500
+
+@chat_bp.route('/reset', methods=['POST'])
+def reset_conversation():
+    """NEW: Xóa hội thoại phía server của session hiện tại"""
+    try:
+        if 'session_id' in session:
+            conversation_store().delete(session['session_id'])
+        return jsonify({'success': True})
+    except Exception as e:
+        logger.error(f"Error resetting conversation: {e}")
+        return jsonify({
+            'error': 'Could not reset conversation',
+            'success': False
+        }), 500
 
 @chat_bp.route('/get_followup', methods=['POST'])
 def get_followup():
@@ -262,7 +499,8 @@ def get_followup():
         
         # Generate followup question
         try:
-            followup = chat_engine.transition_manager.generate_followup_question(history)
+            with session_budget_scope(get_chat_session_id()), llm_priority_scope(PRIORITY_BACKGROUND):
+                followup = chat_engine.transition_manager.generate_followup_question(history)
             
             return jsonify({
                 'followup_question': followup,
@@ -328,9 +566,10 @@ def check_transition():
         
         # Check transition
         try:
-            should_transition, assessment_type, reason = chat_engine.transition_manager.should_transition(
-                history, state
-            )
+            with session_budget_scope(get_chat_session_id()), llm_priority_scope(PRIORITY_TRANSITION):
+                should_transition, assessment_type, reason = chat_engine.transition_manager.should_transition(
+                    history, state
+                )
             
             return jsonify({
                 'should_transition': should_transition,
@@ -385,7 +624,8 @@ def get_conversation_summary():
         
         # Get conversation summary
         try:
-            summary = chat_engine.get_conversation_summary(history)
+            with session_budget_scope(get_chat_session_id()), llm_priority_scope(PRIORITY_BACKGROUND):
+                summary = chat_engine.get_conversation_summary(history)
             
             return jsonify({
                 'summary': summary,
@@ -427,6 +667,16 @@ def health_check():
         health_status = {
             'chat_engine_available': chat_engine is not None,
             'ai_analyzer_available': ai_analyzer_initialized,
+            'analysis_cache': get_analysis_cache_stats(),
+            'local_classifier': get_local_model_stats(),
+            'worker_pool': get_worker_pool_stats(),
+            'llm_circuit': get_circuit_breaker_stats(),
+            'llm_coalescing': get_coalescing_stats(),
+            'llm_hedging': get_hedging_stats(),
+            'conversation_store': conversation_store().get_stats(),
+            'severity_prefilter': get_prefilter_stats(),
+            'usage_ledger': get_usage_ledger_stats(),
+            'llm_rate_limiter': get_rate_limiter_stats(),
             'timestamp': datetime.now().isoformat(),
             'status': 'healthy'
         }
@@ -441,6 +691,10 @@ def health_check():
                 health_status['chat_engine_test'] = 'failed'
                 health_status['status'] = 'degraded'
         
+        # Circuit open: vẫn phục vụ được bằng rule-based responses
+        if health_status['llm_circuit']['state'] != 'closed':
+            health_status['status'] = 'degraded'
+        
         return jsonify(health_status)
         
     except Exception as e:
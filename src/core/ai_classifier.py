@@ -3,55 +3,119 @@ AI Classifier with Keyword Fallback
 Robust classification system that solves the AI reliability issue
 """
 
+import contextvars
+import json
 import logging
 import re
+from concurrent.futures import ThreadPoolExecutor
 from typing import Dict, List, Optional
-from ..services.together_ai import generate_chat_completion, extract_text_from_response
+from ..services.together_client import generate_chat_completion, extract_text_from_response
+from ..utils.keyword_matcher import register_keyword_table, scan_keywords
 
 logger = logging.getLogger(__name__)
 
+# Mental health area indicators
+AREA_KEYWORDS = {
+    'depression': [
+        'buồn', 'chán nản', 'tuyệt vọng', 'vô vọng', 'trầm cảm', 'sad', 'depressed', 'hopeless',
+        'mệt mỏi', 'không hứng thú', 'mất động lực', 'tired', 'no interest', 'unmotivated'
+    ],
+    'anxiety': [
+        'lo lắng', 'hồi hộp', 'căng thẳng', 'sợ hãi', 'anxiety', 'worried', 'nervous', 'panic',
+        'bồn chồn', 'bất an', 'restless', 'uneasy'
+    ],
+    'stress': [
+        'căng thẳng', 'áp lực', 'quá tải', 'overwhelmed', 'pressure', 'stress',
+        'không kiểm soát', 'out of control', 'racing thoughts'
+    ]
+}
+
+register_keyword_table('classifier_areas', AREA_KEYWORDS)
+
+# Classification modes
+CLASSIFIER_MODES = ('batched', 'concurrent', 'sequential')
+
+# Token budget cho batched prompt (mỗi item ~ '"question_id": 2,')
+BATCH_TOKENS_PER_ITEM = 12
+BATCH_BASE_TOKENS = 20
+
+SYSTEM_PROMPT = "You are a mental health assessment expert. Classify symptom severity based on conversation content."
+
 class AIClassifier:
     """AI-powered classification with robust fallback mechanisms"""
     
-    def __init__(self):
+    def __init__(self, mode: Optional[str] = None, max_concurrency: Optional[int] = None):
+        """
+        Args:
+            mode: 'batched' (một LLM call cho mọi item), 'concurrent' (mỗi item một call,
+                  chạy song song) hoặc 'sequential'; mặc định từ PERFORMANCE_SETTINGS
+            max_concurrency: Số call song song tối đa cho mode 'concurrent'
+        """
         self.keyword_mappings = self._initialize_keyword_mappings()
         self.question_contexts = self._initialize_question_contexts()
+        
+        try:
+            from config import PERFORMANCE_SETTINGS
+            settings = PERFORMANCE_SETTINGS
+        except ImportError:
+            settings = {}
+        self.mode = mode or settings.get('classifier_mode', 'batched')
+        self.max_concurrency = max_concurrency or settings.get('classifier_max_concurrency', 4)
+        if self.mode not in CLASSIFIER_MODES:
+            logger.warning(f"Unknown classifier mode '{self.mode}', using 'batched'")
+            self.mode = 'batched'
+        
+        # Severity keywords trong automaton dùng chung ('<question_id>.<severity>')
+        register_keyword_table('classifier_severity', {
+            f"{question_id}.{severity}": keywords
+            for question_id, severity_keywords in self.keyword_mappings.items()
+            for severity, keywords in severity_keywords.items()
+        })
     
-    def classify_conversation_segment(self, message: str, history: List[Dict]) -> Dict[str, int]:
+    def classify_conversation_segment(self, message: str, history: List[Dict],
+                                      mode: Optional[str] = None) -> Dict[str, int]:
         """
         Classify conversation segment and return scores for relevant questions
         
         Args:
             message: Current user message
             history: Recent conversation history
+            mode: Override classification mode ('batched', 'concurrent', 'sequential')
             
         Returns:
             Dictionary mapping question_ids to severity scores (0-4)
         """
-        scores = {}
-        
         # Analyze the current message and recent history
         conversation_text = self._prepare_conversation_text(message, history)
         
         # Try to identify relevant mental health areas
         relevant_areas = self._identify_relevant_areas(conversation_text)
         
+        question_ids = []
         for area in relevant_areas:
-            question_ids = self._get_questions_for_area(area)
-            
+            for question_id in self._get_questions_for_area(area):
+                if question_id not in question_ids:
+                    question_ids.append(question_id)
+        
+        mode = mode or self.mode
+        if mode == 'batched':
+            ai_scores = self._classify_batch_with_ai(conversation_text, question_ids)
+        elif mode == 'concurrent':
+            ai_scores = self._classify_concurrently_with_ai(conversation_text, question_ids)
+        else:
+            ai_scores = {}
             for question_id in question_ids:
-                try:
-                    # Try AI classification first
-                    score = self._classify_with_ai(conversation_text, question_id)
-                    if score is not None:
-                        scores[question_id] = score
-                    else:
-                        # Fallback to keyword classification
-                        scores[question_id] = self._classify_with_keywords(conversation_text, question_id)
-                except Exception as e:
-                    logger.error(f"Classification error for {question_id}: {e}")
-                    # Final fallback to keyword classification
-                    scores[question_id] = self._classify_with_keywords(conversation_text, question_id)
+                score = self._classify_with_ai(conversation_text, question_id)
+                if score is not None:
+                    ai_scores[question_id] = score
+        
+        scores = {}
+        for question_id in question_ids:
+            if question_id in ai_scores:
+                scores[question_id] = ai_scores[question_id]
+            else:
+                # Fallback to keyword classification cho item AI không trả về
+                scores[question_id] = self._classify_with_keywords(conversation_text, question_id)
         
         return scores
     
@@ -72,33 +136,11 @@ class AIClassifier:
     def _identify_relevant_areas(self, text: str) -> List[str]:
         """Identify which mental health areas are relevant to the conversation"""
         areas = []
+        keyword_counts = scan_keywords(text)
         
-        # Depression indicators
-        depression_keywords = [
-            'buồn', 'chán nản', 'tuyệt vọng', 'vô vọng', 'trầm cảm', 'sad', 'depressed', 'hopeless',
-            'mệt mỏi', 'không hứng thú', 'mất động lực', 'tired', 'no interest', 'unmotivated'
-        ]
-        
-        # Anxiety indicators  
-        anxiety_keywords = [
-            'lo lắng', 'hồi hộp', 'căng thẳng', 'sợ hãi', 'anxiety', 'worried', 'nervous', 'panic',
-            'bồn chồn', 'bất an', 'restless', 'uneasy'
-        ]
-        
-        # Stress indicators
-        stress_keywords = [
-            'căng thẳng', 'áp lực', 'quá tải', 'overwhelmed', 'pressure', 'stress',
-            'không kiểm soát', 'out of control', 'racing thoughts'
-        ]
-        
-        if any(keyword in text for keyword in depression_keywords):
-            areas.append('depression')
-        
-        if any(keyword in text for keyword in anxiety_keywords):
-            areas.append('anxiety')
-            
-        if any(keyword in text for keyword in stress_keywords):
-            areas.append('stress')
+        for area in AREA_KEYWORDS:
+            if keyword_counts.get(f"classifier_areas.{area}", 0):
+                areas.append(area)
         
         # If no specific area identified, default to depression (most common)
         if not areas:
@@ -125,6 +167,99 @@ class AIClassifier:
         
         return question_mapping.get(area, [])
     
+    def _classify_batch_with_ai(self, conversation_text: str, question_ids: List[str]) -> Dict[str, int]:
+        """
+        Score mọi item trong một LLM call
+        
+        Returns:
+            Dictionary question_id -> score cho các item parse được (có thể thiếu item)
+        """
+        if not question_ids:
+            return {}
+        
+        try:
+            items = '\n'.join(
+                f"- {question_id}: {self.question_contexts.get(question_id, {}).get('description', question_id)}"
+                for question_id in question_ids
+            )
+            
+            prompt = f"""TASK: Classify mental health symptom severity from conversation for EACH symptom below.
+
+SYMPTOMS:
+{items}
+
+SCALE:
+0 = No symptoms/Never
+1 = Minimal/Rarely  
+2 = Mild/Sometimes
+3 = Moderate/Often
+4 = Severe/Always
+
+CONVERSATION TEXT:
+{conversation_text}
+
+INSTRUCTIONS:
+- Return ONLY a JSON object mapping every symptom id to an integer 0-4
+- Example: {{"{question_ids[0]}": 2}}
+- Base your assessment on evidence in the conversation
+- If insufficient information, use 1
+- No explanation needed
+
+RESULT:"""
+
+            messages = [
+                {"role": "system", "content": SYSTEM_PROMPT},
+                {"role": "user", "content": prompt}
+            ]
+            
+            response = generate_chat_completion(
+                messages, max_tokens=BATCH_BASE_TOKENS + BATCH_TOKENS_PER_ITEM * len(question_ids),
+                caller='AIClassifier'
+            )
+            if not response:
+                return {}
+            
+            scores = parse_batch_scores(extract_text_from_response(response), question_ids)
+            missing = [question_id for question_id in question_ids if question_id not in scores]
+            if missing:
+                logger.warning(f"Batch classification missing items, using keywords: {missing}")
+            return scores
+            
+        except Exception as e:
+            logger.error(f"Batch AI classification failed: {e}")
+            return {}
+    
+    def _classify_concurrently_with_ai(self, conversation_text: str, question_ids: List[str]) -> Dict[str, int]:
+        """
+        Một LLM call nhỏ cho mỗi item, chạy song song (tối đa max_concurrency)
+        
+        Returns:
+            Dictionary question_id -> score cho các item AI trả lời được
+        """
+        if not question_ids:
+            return {}
+        
+        scores = {}
+        with ThreadPoolExecutor(max_workers=min(self.max_concurrency, len(question_ids)),
+                                thread_name_prefix='ai-classifier') as executor:
+            # copy_context: request deadline đi theo vào worker threads
+            futures = {
+                question_id: executor.submit(
+                    contextvars.copy_context().run, self._classify_with_ai, conversation_text, question_id
+                )
+                for question_id in question_ids
+            }
+            for question_id, future in futures.items():
+                try:
+                    score = future.result()
+                except Exception as e:
+                    logger.error(f"Concurrent classification failed for {question_id}: {e}")
+                    score = None
+                if score is not None:
+                    scores[question_id] = score
+        
+        return scores
+    
     def _classify_with_ai(self, conversation_text: str, question_id: str) -> Optional[int]:
         """
         Use AI to classify severity for a specific question
@@ -160,7 +295,7 @@ RESULT:"""
             messages = [
                 {
                     "role": "system",
-                    "content": "You are a mental health assessment expert. Classify symptom severity based on conversation content."
+                    "content": SYSTEM_PROMPT
                 },
                 {
                     "role": "user", 
@@ -168,7 +303,7 @@ RESULT:"""
                 }
             ]
             
-            response = generate_chat_completion(messages)
+            response = generate_chat_completion(messages, caller='AIClassifier')
             if response:
                 text = extract_text_from_response(response).strip()
                 
@@ -190,12 +325,11 @@ RESULT:"""
         Returns:
             Severity score 0-4
         """
-        keywords = self.keyword_mappings.get(question_id, {})
+        keyword_counts = scan_keywords(conversation_text)
         
         # Check for keywords from high to low severity
         for severity in [4, 3, 2, 1, 0]:
-            severity_keywords = keywords.get(severity, [])
-            if any(keyword in conversation_text for keyword in severity_keywords):
+            if keyword_counts.get(f"classifier_severity.{question_id}.{severity}", 0):
                 return severity
         
         # Default to minimal if no keywords found but area was identified
@@ -284,4 +418,59 @@ RESULT:"""
             'irritable': {
                 'description': 'Being easily annoyed or irritable'
             }
-        }
\ No newline at end of file
+        }
+
+def parse_batch_scores(text: str, question_ids: List[str]) -> Dict[str, int]:
+    """
+    Parse batched classification response
+    
+    Chấp nhận JSON object (có thể nằm trong ```json fences hoặc kèm text thừa),
+    giá trị int / float / string; nếu JSON hỏng thì tìm từng cặp "id": score.
+    
+    Args:
+        text: Response text từ LLM
+        question_ids: Các item được yêu cầu
+        
+    Returns:
+        Dictionary question_id -> score 0-4 cho các item hợp lệ
+    """
+    if not text:
+        return {}
+    
+    scores = {}
+    wanted = set(question_ids)
+    
+    data = None
+    start = text.find('{')
+    end = text.rfind('}')
+    if start != -1 and end > start:
+        try:
+            data = json.loads(text[start:end + 1])
+        except ValueError:
+            data = None
+    
+    if isinstance(data, dict):
+        for key, value in data.items():
+            score = _coerce_score(value)
+            if key in wanted and score is not None:
+                scores[key] = score
+    
+    # Fallback: từng cặp key / score (JSON bị cắt hoặc sai cú pháp)
+    for match in re.finditer(r'["\']?([a-z_]+)["\']?\s*[:=]\s*["\']?(\d+(?:\.\d+)?)', text):
+        key = match.group(1)
+        if key in wanted and key not in scores:
+            score = _coerce_score(match.group(2))
+            if score is not None:
+                scores[key] = score
+    
+    return scores
+
+def _coerce_score(value) -> Optional[int]:
+    """Chuyển giá trị score thành int 0-4, None nếu không hợp lệ"""
+    if isinstance(value, bool):
+        return None
+    try:
+        score = int(round(float(value)))
+    except (TypeError, ValueError):
+        return None
+    return score if 0 <= score <= 4 else None
@@ -4,21 +4,84 @@ Updated to use AI-powered transition logic
 """
 
 import logging
-from typing import Dict, List, Optional, Any
+import time
+from concurrent.futures import Future, CancelledError
+from typing import Dict, List, Optional, Any, Iterator, Tuple
 from datetime import datetime
 
-from src.services.together_client import get_together_client
+from config import PERFORMANCE_SETTINGS, AI_ANALYSIS_SETTINGS
+from src.services.together_client import (
+    get_together_client, generate_chat_completion, submit_chat_completion,
+    stream_chat_completion, is_llm_available
+)
 from src.core.transition_logic import TransitionManager
 from src.services.ai_context_analyzer import classify_emotional_context
 from src.core.positive_closure import PositiveClosureManager
+from src.core.turn_context import TurnAnalysisContext, create_turn_context
+from src.core.severity_prefilter import estimate_severity
+from src.services.usage_ledger import get_usage_ledger, session_budget_scope
+from src.services.rate_limiter import PRIORITY_CRITICAL, PRIORITY_TRANSITION, llm_priority_scope
+from src.utils.deadline import clamp_timeout
+from src.utils.keyword_matcher import register_keyword_table, scan_keywords
+from src.utils.metrics import track_stage, observe_turn
 
 logger = logging.getLogger(__name__)
 
+# Từ khóa cho rule-based fallback responses
+FALLBACK_KEYWORDS = {
+    'gratitude': ['cảm ơn', 'thank'],
+    'sadness': ['buồn', 'sad', 'khó khăn']
+}
+
+register_keyword_table('fallback', FALLBACK_KEYWORDS)
+
+REPLY_MODEL = "meta-llama/Llama-3.3-70B-Instruct-Turbo-Free"
+REPLY_MAX_TOKENS = 200
+REPLY_TEMPERATURE = 0.7
+
+class SpeculativeReply:
+    """Reply được generate song song với classification + transition decision"""
+    
+    def __init__(self, future: Future):
+        self.future = future
+        self.started_at = time.perf_counter()
+        self.completed_at: Optional[float] = None
+        self.outcome = 'pending'
+        future.add_done_callback(self._mark_done)
+    
+    def _mark_done(self, _future: Future) -> None:
+        self.completed_at = time.perf_counter()
+    
+    def cancel(self) -> None:
+        """Transition thắng - hủy request đang chạy hoặc bỏ kết quả"""
+        self.outcome = 'cancelled' if self.future.cancel() else 'discarded'
+    
+    def result(self, timeout: Optional[float] = None) -> Any:
+        try:
+            response = self.future.result(timeout=timeout)
+        except CancelledError:
+            response = None
+        self.outcome = 'used' if response is not None else 'failed'
+        return response
+    
+    def to_metadata(self, analysis_seconds: float) -> Dict:
+        """Thời gian tiết kiệm = (analysis + reply) tuần tự - thời gian thực tế"""
+        finished = time.perf_counter()
+        reply_seconds = ((self.completed_at or finished) - self.started_at)
+        wall_seconds = finished - self.started_at
+        saved_seconds = max(0.0, analysis_seconds + reply_seconds - wall_seconds) if self.outcome == 'used' else 0.0
+        return {
+            'concurrent_mode': True,
+            'speculative_reply': self.outcome,
+            'analysis_ms': round(analysis_seconds * 1000, 1),
+            'reply_ms': round(reply_seconds * 1000, 1),
+            'time_saved_ms': round(saved_seconds * 1000, 1)
+        }
+
 class ChatEngine:
     """Main chat engine với AI-powered transition logic"""
     
     def __init__(self):
-        self.client = get_together_client()
         self.transition_manager = TransitionManager()
         self.closure_manager = PositiveClosureManager()
         
@@ -30,6 +93,11 @@ class ChatEngine:
             'transition': "Cảm ơn bạn đã tin tưởng chia sẻ. Để hiểu rõ hơn tình trạng của bạn, tôi muốn đặt một số câu hỏi cụ thể. Bạn có sẵn sàng không?"
         }
     
+    @property
+    def client(self):
+        """Together SDK client, tạo lazy ở lần dùng đầu tiên"""
+        return get_together_client()
+    
     def process_message(self, message: str, history: List[Dict], state: Dict, use_ai: bool = True) -> Dict:
         """
         THAY ĐỔI: Sử dụng transition logic mới
@@ -45,149 +113,378 @@ class ChatEngine:
         Returns:
             Response dictionary with message, updated state, and metadata
         """
+        turn_started = time.perf_counter()
+        # Mọi LLM call của lượt chat được tính vào ngân sách của session
+        with session_budget_scope(state.get('session_id')):
+            result = self._process_message(message, history, state, use_ai)
+        observe_turn(time.perf_counter() - turn_started, result.get('metadata', {}).get('type'))
+        return result
+
+    def _process_message(self, message: str, history: List[Dict], state: Dict, use_ai: bool = True) -> Dict:
+        """Pipeline của process_message: classification -> transition -> reply -> closure"""
         try:
-            # Update state
-            state['message_count'] = state.get('message_count', 0) + 1
-            state['last_message_time'] = datetime.now().isoformat()
+            # Circuit open: đi thẳng rule-based path, không chờ provider timeout
+            circuit_open = use_ai and not is_llm_available()
+            if circuit_open:
+                use_ai = False
+            
+            # Hết ngân sách LLM của session: local analysis + rule-based reply
+            budget_exhausted = use_ai and not get_usage_ledger().is_available(state.get('session_id'))
+            if budget_exhausted:
+                use_ai = False
             
             # Add user message to history
             updated_history = history + [{'role': 'user', 'content': message}]
             
-            # NEW: Check if we should use AI analysis
-            should_use_ai = self.should_use_ai_analysis(state['message_count'], state)
+            # Một AI classification dùng chung cho cả lượt chat
+            turn_context = create_turn_context(message, updated_history)
+            
+            # Concurrent mode: bắt đầu generate reply trong lúc classify + quyết định transition
+            speculative = None
+            if use_ai and PERFORMANCE_SETTINGS.get('concurrent_turn_processing', False):
+                speculative = self._start_speculative_reply(updated_history, state)
+            analysis_started = time.perf_counter()
+            
+            ai_context, should_transition, assessment_type, reason = self._analyze_turn(
+                updated_history, state, turn_context, use_ai
+            )
+            
+            analysis_seconds = time.perf_counter() - analysis_started
+            
+            if should_transition:
+                result = self._handle_transition(assessment_type, reason, state, updated_history, ai_context, turn_context)
+                if speculative is not None:
+                    speculative.cancel()
+                    result['metadata'].update(speculative.to_metadata(analysis_seconds))
+                return result
+            
+            # Generate chat response
+            concurrency_info = {}
+            with track_stage('reply_generation'):
+                if speculative is not None:
+                    bot_response = self._finish_speculative_reply(
+                        speculative, message, updated_history, state, ai_context, turn_context
+                    )
+                    concurrency_info = speculative.to_metadata(analysis_seconds)
+                elif use_ai:
+                    bot_response = self._generate_ai_response(message, updated_history, state, ai_context, turn_context)
+                else:
+                    bot_response = self._generate_fallback_response(message, updated_history, state)
+            
+            if circuit_open:
+                concurrency_info['circuit_open'] = True
+            if budget_exhausted:
+                concurrency_info['ai_budget_exhausted'] = True
+            
+            return self._complete_chat_turn(
+                bot_response, updated_history, state, ai_context, turn_context, use_ai, concurrency_info
+            )
+            
+        except Exception as e:
+            logger.error(f"Error processing message: {e}")
+            return self._generate_error_response(history, state)
+
+    def process_message_stream(self, message: str, history: List[Dict], state: Dict,
+                               use_ai: bool = True) -> Iterator[Tuple[str, Any]]:
+        """
+        Streaming version của process_message
+        
+        Classification + transition decision chạy trước (giống process_message),
+        sau đó reply được stream từng token.
+        
+        Args:
+            message: User's message
+            history: Conversation history
+            state: Current session state
+            use_ai: Whether to use AI for response generation
+            
+        Yields:
+            ('token', text) cho từng đoạn reply, cuối cùng ('done', response_dict)
+            với cùng format như process_message(). Nếu closure được kích hoạt,
+            message trong response cuối thay thế phần đã stream.
+        """
+        turn_started = time.perf_counter()
+        for event, payload in self._process_message_stream(message, history, state, use_ai):
+            if event == 'done':
+                # Latency của cả lượt (tới done event), giống process_message
+                observe_turn(time.perf_counter() - turn_started, payload.get('metadata', {}).get('type'))
+            yield event, payload
+
+    def _process_message_stream(self, message: str, history: List[Dict], state: Dict,
+                                use_ai: bool = True) -> Iterator[Tuple[str, Any]]:
+        """Pipeline của process_message_stream: classification -> transition -> stream reply -> closure"""
+        circuit_open = use_ai and not is_llm_available()
+        if circuit_open:
+            use_ai = False
+        
+        session_id = state.get('session_id')
+        budget_exhausted = use_ai and not get_usage_ledger().is_available(session_id)
+        if budget_exhausted:
+            use_ai = False
+        
+        try:
+            updated_history = history + [{'role': 'user', 'content': message}]
+            turn_context = create_turn_context(message, updated_history)
             
+            with session_budget_scope(session_id):
+                ai_context, should_transition, assessment_type, reason = self._analyze_turn(
+                    updated_history, state, turn_context, use_ai
+                )
+        except Exception as e:
+            logger.error(f"Error processing message: {e}")
+            yield 'done', self._generate_error_response(history, state)
+            return
+        
+        if should_transition:
+            yield 'done', self._handle_transition(assessment_type, reason, state, updated_history, ai_context, turn_context)
+            return
+        
+        streamed = []
+        stream_info = {'streamed': False}
+        if circuit_open:
+            stream_info['circuit_open'] = True
+        if budget_exhausted:
+            stream_info['ai_budget_exhausted'] = True
+        if use_ai:
+            try:
+                for text in stream_chat_completion(
+                    self._build_reply_messages(updated_history, state, ai_context),
+                    model=REPLY_MODEL,
+                    max_tokens=REPLY_MAX_TOKENS,
+                    temperature=REPLY_TEMPERATURE,
+                    caller='ChatEngine',
+                    session_id=session_id
+                ):
+                    streamed.append(text)
+                    yield 'token', text
+                stream_info['streamed'] = True
+            except Exception as e:
+                # Lỗi giữa chừng: giữ phần đã gửi cho user thay vì đổi câu trả lời
+                logger.error(f"Error streaming AI response: {e}")
+                stream_info['stream_error'] = True
+        
+        bot_response = ''.join(streamed).strip()
+        if not bot_response:
+            bot_response = self._generate_fallback_response(message, updated_history, state)
+            yield 'token', bot_response
+        elif stream_info['streamed'] and ai_context and ai_context.get('needs_followup', False):
+            followup = self.transition_manager.generate_followup_question(updated_history, turn_context)
+            if followup and followup not in bot_response:
+                bot_response += f" {followup}"
+                yield 'token', f" {followup}"
+        
+        try:
+            result = self._complete_chat_turn(
+                bot_response, updated_history, state, ai_context, turn_context, use_ai, stream_info
+            )
+        except Exception as e:
+            logger.error(f"Error processing message: {e}")
+            result = self._generate_error_response(history, state)
+        yield 'done', result
+
+    def _analyze_turn(self, updated_history: List[Dict], state: Dict, turn_context: TurnAnalysisContext,
+                      use_ai: bool = True) -> Tuple[Optional[Dict], bool, Optional[str], str]:
+        """
+        Cập nhật state, chạy AI context analysis và quyết định transition
+        
+        Return: (ai_context, should_transition, assessment_type, reason)
+        """
+        # Update state
+        state['message_count'] = state.get('message_count', 0) + 1
+        state['last_message_time'] = datetime.now().isoformat()
+        
+        # NEW: Check if we should use AI analysis
+        should_use_ai, decision_reason = self._ai_analysis_decision(
+            state['message_count'], state, turn_context.message
+        )
+        
+        # Transition / follow-up dùng cùng quyết định: lượt không được phép dùng LLM thì dùng local estimate
+        turn_context.llm_allowed = should_use_ai and use_ai
+        if not turn_context.llm_allowed:
+            turn_context.llm_deferred_reason = decision_reason if not should_use_ai else 'ai_disabled'
+        
+        # Analysis cho transition đi trước reply trong LLM rate limit queue;
+        # session đã có dấu hiệu suicide_risk thì re-analysis được ưu tiên cao nhất
+        last_type = (state.get('last_ai_analysis') or {}).get('type')
+        priority = PRIORITY_CRITICAL if last_type == 'suicide_risk' else PRIORITY_TRANSITION
+        
+        with llm_priority_scope(priority):
             # NEW: AI context analysis for response generation
             ai_context = None
             if should_use_ai and use_ai:
                 try:
-                    ai_context = classify_emotional_context(message, updated_history)
+                    ai_context = turn_context.get_classification('chat_engine')
                     state['last_ai_analysis'] = ai_context
                     state['last_ai_analysis_time'] = datetime.now().isoformat()
+                    get_usage_ledger().record_analysis(state.get('session_id'))
                 except Exception as e:
                     logger.warning(f"AI context analysis failed: {e}")
             
             # THAY ĐỔI: Sử dụng transition logic mới
-            should_transition, assessment_type, reason = self.transition_manager.should_transition(
-                updated_history, state
-            )
-            
-            if should_transition:
-                return self._handle_transition(assessment_type, reason, state, updated_history, ai_context)
-            
-            # Generate chat response
-            if use_ai:
-                bot_response = self._generate_ai_response(message, updated_history, state, ai_context)
-            else:
-                bot_response = self._generate_fallback_response(message, updated_history, state)
-            
-            # Add bot response to history
-            final_history = updated_history + [{'role': 'bot', 'content': bot_response}]
-            
-            # Kiểm tra closure trước khi return
-            if not state.get('closure_applied', False):
+            with track_stage('transition_decision'):
+                should_transition, assessment_type, reason = self.transition_manager.should_transition(
+                    updated_history, state, turn_context
+                )
+        return ai_context, should_transition, assessment_type, reason
+
+    def _complete_chat_turn(self, bot_response: str, updated_history: List[Dict], state: Dict,
+                            ai_context: Optional[Dict], turn_context: TurnAnalysisContext,
+                            use_ai: bool, extra_metadata: Optional[Dict] = None) -> Dict:
+        """Thêm bot response vào history, kiểm tra closure và build response dict"""
+        # Add bot response to history
+        final_history = updated_history + [{'role': 'bot', 'content': bot_response}]
+        
+        # Kiểm tra closure trước khi return
+        if not state.get('closure_applied', False):
+            with track_stage('closure_check'):
                 should_close, reason = self.closure_manager.should_trigger_closure(
-                    final_history, ai_context
+                    final_history, ai_context, turn_context
                 )
-                
-                if should_close:
-                    closure_message = self.closure_manager.generate_closure_message(
-                        final_history, ai_context
-                    )
-                    # Override response với closure message
-                    return closure_message
-                
-            return {
-                'message': bot_response,
-                'history': final_history,
-                'state': state,
-                'metadata': {
-                    'type': 'chat_response',
-                    'phase': 'chat',
-                    'ai_used': use_ai,
-                    'ai_context_available': ai_context is not None,
-                    'message_count': state['message_count'],
-                    'transition_checked': True,
-                    'ai_severity': ai_context.get('severity', 0.0) if ai_context else 0.0
-                }
-            }
             
-        except Exception as e:
-            logger.error(f"Error processing message: {e}")
-            return self._generate_error_response(history, state)
+            if should_close:
+                closure_message = self.closure_manager.generate_closure_message(
+                    final_history, ai_context, turn_context
+                )
+                # Override response với closure message
+                return self._build_closure_response(closure_message, reason, updated_history, state, turn_context)
+            
+        return {
+            'message': bot_response,
+            'history': final_history,
+            'state': state,
+            'metadata': {
+                'type': 'chat_response',
+                'phase': 'chat',
+                'ai_used': use_ai,
+                'ai_context_available': ai_context is not None,
+                'message_count': state['message_count'],
+                'transition_checked': True,
+                'ai_severity': ai_context.get('severity', 0.0) if ai_context else 0.0,
+                **turn_context.to_metadata(),
+                **(extra_metadata or {})
+            }
+        }
 
-    def should_use_ai_analysis(self, message_count: int, state: Dict) -> bool:
+    def should_use_ai_analysis(self, message_count: int, state: Dict, message: Optional[str] = None) -> bool:
         """
         THÊM MỚI: Quyết định khi nào dùng AI analysis
         
         Params:
             - message_count: Số tin nhắn trong conversation
             - state: Current state
+            - message: Tin nhắn hiện tại, dùng cho severity prefilter
         
         Return: True nếu nên dùng AI
         """
-        # Dùng AI sau message thứ 3 (tránh overuse)
-        if message_count < 3:
-            return False
+        return self._ai_analysis_decision(message_count, state, message)[0]
+
+    def _ai_analysis_decision(self, message_count: int, state: Dict,
+                              message: Optional[str] = None) -> Tuple[bool, str]:
+        """
+        AI_USAGE_CONTROL cho lượt này: ngân sách session, min messages, cooldown, interval
         
-        # Skip nếu đã có recent analysis (trong vòng 2 messages)
-        last_analysis_time = state.get('last_ai_analysis_time')
-        if last_analysis_time:
-            try:
-                from datetime import datetime, timedelta
-                last_time = datetime.fromisoformat(last_analysis_time)
-                if datetime.now() - last_time < timedelta(minutes=1):
-                    return False
-            except:
-                pass  # Ignore parsing errors
-        
-        # Always use nếu detect potential clinical signs trong state
-        if state.get('potential_clinical_signs', False):
-            return True
-        
-        # Use mỗi 2-3 messages
-        return message_count % 2 == 0
+        Quyết định skip theo severity thấp thuộc về SeverityPrefilter.classify (được đếm
+        trong skip_rate / shadow sampling); ở đây prefilter chỉ dùng để crisis term
+        bỏ qua interval và cooldown.
+        
+        Return: (allowed, reason)
+        """
+        crisis = bool(message) and estimate_severity(message)['crisis']
+        
+        allowed, reason = get_usage_ledger().should_analyze(
+            state.get('session_id'), message_count,
+            crisis=crisis, clinical_signs=state.get('potential_clinical_signs', False)
+        )
+        if not allowed:
+            logger.debug(f"AI analysis skipped: {reason}")
+        return allowed, reason
 
-    def _generate_ai_response(self, message: str, history: List[Dict], state: Dict, ai_context: Optional[Dict] = None) -> str:
+    def _generate_ai_response(self, message: str, history: List[Dict], state: Dict, ai_context: Optional[Dict] = None,
+                              turn_context: Optional[TurnAnalysisContext] = None) -> str:
         """
         THAY ĐỔI: Tích hợp AI context analysis
         Generate response using AI with context awareness
         """
         try:
-            # Create context-aware system prompt
-            system_prompt = self._create_system_prompt(state, ai_context)
-            
-            # Prepare conversation context (last 6 messages)
-            recent_history = history[-6:] if len(history) > 6 else history
-            
-            # Convert to API format
-            messages = [{"role": "system", "content": system_prompt}]
-            
-            for msg in recent_history:
-                role = "user" if msg['role'] == 'user' else "assistant"
-                messages.append({"role": role, "content": msg['content']})
-            
-            # Generate response
-            response = self.client.chat.completions.create(
-                model="meta-llama/Llama-3.3-70B-Instruct-Turbo-Free",
-                messages=messages,
-                max_tokens=200,
-                temperature=0.7
+            # Generate response (pooled client, per-call timeout từ config)
+            response = generate_chat_completion(
+                self._build_reply_messages(history, state, ai_context),
+                model=REPLY_MODEL,
+                max_tokens=REPLY_MAX_TOKENS,
+                temperature=REPLY_TEMPERATURE,
+                caller='ChatEngine'
             )
-            
-            ai_response = response.choices[0].message.content.strip()
-            
-            # NEW: Add follow-up question if needed
-            if ai_context and ai_context.get('needs_followup', False):
-                followup = self.transition_manager.generate_followup_question(history)
-                if followup and followup not in ai_response:
-                    ai_response += f" {followup}"
-            
-            return ai_response
+            return self._finalize_ai_response(response, history, ai_context, turn_context)
             
         except Exception as e:
             logger.error(f"Error generating AI response: {e}")
             return self._generate_fallback_response(message, history, state)
 
+    def _build_reply_messages(self, history: List[Dict], state: Dict, ai_context: Optional[Dict] = None) -> List[Dict]:
+        """Build API messages: system prompt + 6 tin nhắn gần nhất"""
+        # Create context-aware system prompt
+        system_prompt = self._create_system_prompt(state, ai_context)
+        
+        # Prepare conversation context (last 6 messages)
+        recent_history = history[-6:] if len(history) > 6 else history
+        
+        # Convert to API format
+        messages = [{"role": "system", "content": system_prompt}]
+        
+        for msg in recent_history:
+            role = "user" if msg['role'] == 'user' else "assistant"
+            messages.append({"role": role, "content": msg['content']})
+        
+        return messages
+
+    def _finalize_ai_response(self, response: Any, history: List[Dict], ai_context: Optional[Dict] = None,
+                              turn_context: Optional[TurnAnalysisContext] = None) -> str:
+        """Extract reply text và thêm follow-up question nếu cần"""
+        if response is None:
+            raise RuntimeError("No response from Together AI")
+        
+        ai_response = response.choices[0].message.content.strip()
+        
+        # NEW: Add follow-up question if needed
+        if ai_context and ai_context.get('needs_followup', False):
+            followup = self.transition_manager.generate_followup_question(history, turn_context)
+            if followup and followup not in ai_response:
+                ai_response += f" {followup}"
+        
+        return ai_response
+
+    def _start_speculative_reply(self, history: List[Dict], state: Dict) -> Optional[SpeculativeReply]:
+        """
+        Bắt đầu generate reply trước khi có classification của lượt này
+        
+        System prompt dùng AI analysis gần nhất trong state (lượt trước) vì
+        classification hiện tại chưa có.
+        """
+        try:
+            future = submit_chat_completion(
+                self._build_reply_messages(history, state, state.get('last_ai_analysis')),
+                model=REPLY_MODEL,
+                max_tokens=REPLY_MAX_TOKENS,
+                temperature=REPLY_TEMPERATURE,
+                caller='ChatEngine'
+            )
+            return SpeculativeReply(future)
+        except Exception as e:
+            logger.warning(f"Could not start speculative reply: {e}")
+            return None
+
+    def _finish_speculative_reply(self, speculative: SpeculativeReply, message: str, history: List[Dict], state: Dict,
+                                  ai_context: Optional[Dict] = None,
+                                  turn_context: Optional[TurnAnalysisContext] = None) -> str:
+        """Chờ speculative reply, fallback sang rule-based response nếu lỗi"""
+        try:
+            response = speculative.result(timeout=clamp_timeout(AI_ANALYSIS_SETTINGS['timeout_seconds'] + 1.0))
+            return self._finalize_ai_response(response, history, ai_context, turn_context)
+        except Exception as e:
+            logger.error(f"Error generating speculative AI response: {e}")
+            speculative.outcome = 'failed'
+            return self._generate_fallback_response(message, history, state)
+
     def _create_system_prompt(self, state: Dict, ai_context: Optional[Dict] = None) -> str:
         """Create context-aware system prompt"""
         base_prompt = """Bạn là một chatbot hỗ trợ sức khỏe tâm thần, luôn thể hiện sự đồng cảm và chuyên nghiệp.
@@ -218,7 +515,8 @@ PHONG CÁCH:
         
         return base_prompt
 
-    def _handle_transition(self, assessment_type: str, reason: str, state: Dict, history: List[Dict], ai_context: Optional[Dict] = None) -> Dict:
+    def _handle_transition(self, assessment_type: str, reason: str, state: Dict, history: List[Dict], ai_context: Optional[Dict] = None,
+                           turn_context: Optional[TurnAnalysisContext] = None) -> Dict:
         """Handle transition to assessment phase"""
         
         # Update state for transition
@@ -251,23 +549,45 @@ PHONG CÁCH:
                 'assessment_type': assessment_type,
                 'reason': reason,
                 'ai_severity': ai_context.get('severity', 0.0) if ai_context else 0.0,
-                'transition_time': state['transition_time']
+                'transition_time': state['transition_time'],
+                **(turn_context.to_metadata() if turn_context else {})
             }
         }
 
+    def _build_closure_response(self, closure_message: str, reason: str, history: List[Dict], state: Dict,
+                                turn_context: Optional[TurnAnalysisContext] = None) -> Dict:
+        """Build response dict khi positive closure được kích hoạt"""
+        closure_update = self.closure_manager.update_conversation_with_closure(history, closure_message)
+        state.update(closure_update['state'])
+        
+        metadata = closure_update['metadata']
+        metadata.update({
+            'phase': 'chat',
+            'closure_reason': reason,
+            'message_count': state['message_count'],
+            **(turn_context.to_metadata() if turn_context else {})
+        })
+        
+        return {
+            'message': closure_message,
+            'history': closure_update['history'],
+            'state': state,
+            'metadata': metadata
+        }
+
     def _generate_fallback_response(self, message: str, history: List[Dict], state: Dict) -> str:
         """Generate fallback response when AI is not available"""
         
         message_count = len([msg for msg in history if msg.get('role') == 'user'])
         
         # Simple rule-based responses
-        message_lower = message.lower()
+        keyword_counts = scan_keywords(message.lower())
         
         if message_count == 1:
             return self.templates['greeting']
-        elif any(word in message_lower for word in ['cảm ơn', 'thank']):
+        elif keyword_counts.get('fallback.gratitude', 0):
             return "Tôi luôn sẵn sàng lắng nghe bạn. Bạn còn muốn chia sẻ điều gì khác không?"
-        elif any(word in message_lower for word in ['buồn', 'sad', 'khó khăn']):
+        elif keyword_counts.get('fallback.sadness', 0):
             return self.templates['understanding']
         else:
             return self.templates['encouragement']
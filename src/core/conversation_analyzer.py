@@ -4,53 +4,96 @@ Conversation Analyzer - Phân tích độ sâu cuộc trò chuyện và temporal
 """
 
 import re
+import hashlib
 import logging
 from typing import Dict, List, Optional, Tuple
 from datetime import datetime
 
+from src.utils.keyword_matcher import register_keyword_table, scan_keywords
+
 logger = logging.getLogger(__name__)
 
+# Personal sharing indicators
+PERSONAL_INDICATORS = {
+    'pronouns': ['tôi', 'mình', 'em', 'con', 'i', 'me', 'my', 'myself'],
+    'emotional_expressions': [
+        'cảm thấy', 'suy nghĩ', 'lo lắng', 'buồn', 'vui', 'giận',
+        'feel', 'think', 'worry', 'sad', 'happy', 'angry'
+    ],
+    'sharing_markers': [
+        'chia sẻ', 'nói thật', 'thực ra', 'thường', 'luôn luôn',
+        'share', 'honestly', 'actually', 'usually', 'always'
+    ],
+    'vulnerability_markers': [
+        'khó khăn', 'đau khổ', 'không biết', 'bối rối', 'hoang mang',
+        'difficult', 'struggling', 'confused', 'lost', 'helpless'
+    ]
+}
+
+register_keyword_table('depth', PERSONAL_INDICATORS)
+
+# Temporal indicators: (group name, pattern, severity)
+TEMPORAL_PATTERN_GROUPS = [
+    # Ngắn hạn (severity thấp)
+    ('short_term_vi', r'hôm nay|hôm qua|sáng nay|chiều nay|tối nay', 0.1),
+    ('short_term_en', r'today|yesterday|this morning|this afternoon|tonight', 0.1),
+    
+    # Trung hạn (severity trung bình)
+    ('medium_term_vi', r'tuần này|tuần trước|mấy ngày|vài ngày', 0.4),
+    ('medium_term_en', r'this week|last week|few days|several days', 0.4),
+    ('day_count_vi', r'\d+\s*ngày', 0.3),
+    
+    # Dài hạn (severity cao)
+    ('weeks_vi', r'2\s*tuần|hai tuần|mấy tuần', 0.8),
+    ('months_vi', r'tháng này|tháng trước|mấy tháng', 0.7),
+    ('weeks_en', r'2\s*weeks|two weeks|few weeks|few months', 0.8),
+    ('month_count', r'\d+\s*tháng|\d+\s*months', 0.8),
+    
+    # Rất dài hạn (severity rất cao)
+    ('persistent_vi', r'suốt|liên tục|mãi mãi|từ lúc|kể từ', 0.9),
+    ('persistent_en', r'constantly|continuously|always|since|ever since', 0.9),
+]
+
+TEMPORAL_SEVERITIES = {name: severity for name, _, severity in TEMPORAL_PATTERN_GROUPS}
+
+# Một alternation duy nhất, group name cho biết severity của match
+TEMPORAL_REGEX = re.compile(
+    r'\b(?:' + '|'.join(f'(?P<{name}>{pattern})' for name, pattern, _ in TEMPORAL_PATTERN_GROUPS) + r')\b'
+)
+
+# Chuẩn hóa thời lượng về số ngày
+DURATION_NUMBER_WORDS = {
+    'một': 1, 'hai': 2, 'ba': 3, 'bốn': 4, 'năm': 5, 'sáu': 6, 'bảy': 7, 'tám': 8, 'chín': 9, 'mười': 10,
+    'one': 1, 'two': 2, 'three': 3, 'four': 4, 'five': 5, 'six': 6, 'seven': 7, 'eight': 8, 'nine': 9, 'ten': 10,
+    'mấy': 3, 'vài': 3, 'few': 3, 'several': 3
+}
+DURATION_UNIT_DAYS = {
+    'ngày': 1, 'day': 1, 'days': 1,
+    'tuần': 7, 'week': 7, 'weeks': 7,
+    'tháng': 30, 'month': 30, 'months': 30,
+    'year': 365, 'years': 365
+}
+DURATION_REGEX = re.compile(
+    r'^(?P<count>\d+|' + '|'.join(DURATION_NUMBER_WORDS) + r')\s*(?P<unit>' + '|'.join(DURATION_UNIT_DAYS) + r')$'
+)
+
+# Version của incremental analysis state (lưu trong chat state)
+ANALYSIS_STATE_VERSION = 3
+
+# Độ dài tối đa của một temporal match, không tính chuỗi số / khoảng trắng
+# (phần không giới hạn của các pattern dạng \d+\s*ngày)
+TEMPORAL_LOOKBACK_CHARS = 32
+
 class ConversationAnalyzer:
     """Phân tích độ sâu cuộc trò chuyện và temporal indicators"""
     
     def __init__(self):
-        # Personal sharing indicators
-        self.personal_indicators = {
-            'pronouns': ['tôi', 'mình', 'em', 'con', 'i', 'me', 'my', 'myself'],
-            'emotional_expressions': [
-                'cảm thấy', 'suy nghĩ', 'lo lắng', 'buồn', 'vui', 'giận',
-                'feel', 'think', 'worry', 'sad', 'happy', 'angry'
-            ],
-            'sharing_markers': [
-                'chia sẻ', 'nói thật', 'thực ra', 'thường', 'luôn luôn',
-                'share', 'honestly', 'actually', 'usually', 'always'
-            ],
-            'vulnerability_markers': [
-                'khó khăn', 'đau khổ', 'không biết', 'bối rối', 'hoang mang',
-                'difficult', 'struggling', 'confused', 'lost', 'helpless'
-            ]
-        }
+        # Personal sharing indicators (đăng ký trong keyword automaton dùng chung)
+        self.personal_indicators = PERSONAL_INDICATORS
         
-        # Temporal indicators mapping
+        # Temporal indicators mapping (pattern -> severity)
         self.temporal_patterns = {
-            # Ngắn hạn (severity thấp)
-            r'\b(hôm nay|hôm qua|sáng nay|chiều nay|tối nay)\b': 0.1,
-            r'\b(today|yesterday|this morning|this afternoon|tonight)\b': 0.1,
-            
-            # Trung hạn (severity trung bình)
-            r'\b(tuần này|tuần trước|mấy ngày|vài ngày)\b': 0.4,
-            r'\b(this week|last week|few days|several days)\b': 0.4,
-            r'\b(\d+\s*ngày)\b': 0.3,
-            
-            # Dài hạn (severity cao)
-            r'\b(2\s*tuần|hai tuần|mấy tuần)\b': 0.8,
-            r'\b(tháng này|tháng trước|mấy tháng)\b': 0.7,
-            r'\b(2\s*weeks|two weeks|few weeks|few months)\b': 0.8,
-            r'\b(\d+\s*tháng|\d+\s*months)\b': 0.8,
-            
-            # Rất dài hạn (severity rất cao)
-            r'\b(suốt|liên tục|mãi mãi|từ lúc|kể từ)\b': 0.9,
-            r'\b(constantly|continuously|always|since|ever since)\b': 0.9,
+            rf'\b({pattern})\b': severity for _, pattern, severity in TEMPORAL_PATTERN_GROUPS
         }
 
     def analyze_message_depth(self, message: str) -> float:
@@ -66,6 +109,7 @@ class ConversationAnalyzer:
             return 0.0
         
         message_lower = message.lower()
+        keyword_counts = scan_keywords(message_lower)
         scores = []
         
         # 1. Độ dài tin nhắn (30% weight)
@@ -73,20 +117,17 @@ class ConversationAnalyzer:
         scores.append(('length', length_score, 0.3))
         
         # 2. Personal pronoun usage (25% weight)
-        pronoun_count = sum(1 for pronoun in self.personal_indicators['pronouns'] 
-                          if pronoun in message_lower)
+        pronoun_count = keyword_counts.get('depth.pronouns', 0)
         pronoun_score = min(pronoun_count / 3, 1.0)  # Normalize to 3 uses
         scores.append(('pronouns', pronoun_score, 0.25))
         
         # 3. Emotional expression (25% weight)
-        emotion_count = sum(1 for emotion in self.personal_indicators['emotional_expressions']
-                          if emotion in message_lower)
+        emotion_count = keyword_counts.get('depth.emotional_expressions', 0)
         emotion_score = min(emotion_count / 2, 1.0)  # Normalize to 2 expressions
         scores.append(('emotions', emotion_score, 0.25))
         
         # 4. Vulnerability markers (20% weight)
-        vulnerability_count = sum(1 for marker in self.personal_indicators['vulnerability_markers']
-                                if marker in message_lower)
+        vulnerability_count = keyword_counts.get('depth.vulnerability_markers', 0)
         vulnerability_score = min(vulnerability_count / 2, 1.0)
         scores.append(('vulnerability', vulnerability_score, 0.2))
         
@@ -137,6 +178,35 @@ class ConversationAnalyzer:
         # Cap at 1.0
         return min(progressive_depth, 1.0)
 
+    def _new_depth_state(self) -> Dict:
+        return {'message_depths': []}
+
+    def _update_depth_state(self, depth_state: Dict, message: str) -> None:
+        """
+        Lưu depth thô của tin nhắn mới (phần tốn kém - chỉ phân tích text một lần)
+        
+        Recency weight (1.0 + i/n * 0.5) phụ thuộc n, nên tổng có trọng số được
+        tính lại ở _depth_from_state theo đúng thứ tự của calculate_progressive_depth.
+        """
+        depth_state['message_depths'].append(self.analyze_message_depth(message))
+
+    def _depth_from_state(self, depth_state: Dict) -> float:
+        """Cùng công thức và thứ tự cộng float với calculate_progressive_depth"""
+        depths = depth_state['message_depths']
+        count = len(depths)
+        if count == 0:
+            return 0.0
+        
+        message_depths = [depth * (1.0 + (i / count) * 0.5) for i, depth in enumerate(depths)]
+        if count == 1:
+            return message_depths[0]
+        
+        weights = [1.0 + i * 0.3 for i in range(count)]
+        weighted_sum = sum(depth * weight for depth, weight in zip(message_depths, weights))
+        total_weight = sum(weights)
+        
+        return min(weighted_sum / total_weight, 1.0)
+
     def detect_temporal_indicators(self, text: str) -> List[str]:
         """
         Phát hiện các từ chỉ thời gian
@@ -146,24 +216,45 @@ class ConversationAnalyzer:
         
         Return: List temporal indicators ['2 tuần', 'gần đây', 'suốt tháng']
         """
-        if not text:
-            return []
+        indicators, _ = self.analyze_temporal_indicators(text)
+        return indicators
+
+    def analyze_temporal_indicators(self, text: str) -> Tuple[List[str], float]:
+        """
+        Phát hiện temporal indicators và tính duration severity trong một lần scan
+        
+        Params:
+            - text: Text để phân tích
         
-        indicators = []
-        text_lower = text.lower()
+        Return: (unique indicators, duration severity 0.0-1.0)
+        """
+        if not text:
+            return [], 0.0
         
-        for pattern, _ in self.temporal_patterns.items():
-            matches = re.findall(pattern, text_lower)
-            indicators.extend(matches)
+        matches = self.extract_temporal_matches(text)
         
         # Remove duplicates while preserving order
-        unique_indicators = []
-        for indicator in indicators:
-            if indicator not in unique_indicators:
-                unique_indicators.append(indicator)
+        unique_matches = {}
+        for match in matches:
+            unique_matches.setdefault(match['indicator'], match['severity'])
         
+        unique_indicators = list(unique_matches)
         logger.debug(f"Detected temporal indicators: {unique_indicators}")
-        return unique_indicators
+        return unique_indicators, self._score_severities(list(unique_matches.values()))
+
+    def extract_temporal_matches(self, text: str) -> List[Dict]:
+        """
+        Tất cả temporal matches theo thứ tự xuất hiện
+        
+        Params:
+            - text: Text để phân tích
+        
+        Return: [{'indicator': '2 tuần', 'category': 'weeks_vi', 'severity': 0.8, 'days': 14}, ...]
+        """
+        if not text:
+            return []
+        
+        return [_temporal_match_info(match) for match in TEMPORAL_REGEX.finditer(text.lower())]
 
     def score_duration_severity(self, indicators: List[str]) -> float:
         """
@@ -177,26 +268,183 @@ class ConversationAnalyzer:
         if not indicators:
             return 0.0
         
-        scores = []
         text_to_match = ' '.join(indicators).lower()
+        severities = [TEMPORAL_SEVERITIES[match.lastgroup] for match in TEMPORAL_REGEX.finditer(text_to_match)]
         
-        for pattern, severity in self.temporal_patterns.items():
-            if re.search(pattern, text_to_match):
-                scores.append(severity)
-        
-        if not scores:
+        return self._score_severities(severities, len(indicators))
+
+    def _score_severities(self, severities: List[float], indicator_count: Optional[int] = None) -> float:
+        """Max severity (worst case), bonus nếu có nhiều indicators"""
+        if not severities:
             return 0.0
         
         # Sử dụng max score (worst case scenario)
-        max_score = max(scores)
+        max_score = max(severities)
         
         # Bonus nếu có nhiều indicators
-        if len(indicators) > 1:
+        if (indicator_count if indicator_count is not None else len(severities)) > 1:
             max_score = min(max_score * 1.2, 1.0)
         
-        logger.debug(f"Duration severity: {indicators} -> {max_score:.2f}")
+        logger.debug(f"Duration severity: {severities} -> {max_score:.2f}")
         return max_score
 
+    @staticmethod
+    def normalize_duration_days(indicator: str) -> Optional[int]:
+        """
+        Chuyển thời lượng có số lượng thành số ngày
+        
+        Params:
+            - indicator: '2 tuần', 'hai tuần', '3 months', 'mấy ngày'
+        
+        Return: Số ngày, None nếu indicator không phải thời lượng (vd 'hôm nay', 'since')
+        """
+        match = DURATION_REGEX.match(indicator.strip().lower())
+        if not match:
+            return None
+        
+        count = match.group('count')
+        count = int(count) if count.isdigit() else DURATION_NUMBER_WORDS[count]
+        return count * DURATION_UNIT_DAYS[match.group('unit')]
+
+    def create_analysis_state(self) -> Dict:
+        """
+        Incremental analysis state rỗng (JSON-serializable, lưu được trong chat state)
+        
+        Return: Dict với running depth sums và temporal scan state
+        """
+        return {
+            'version': ANALYSIS_STATE_VERSION,
+            'message_count': 0,
+            'last_message_digest': '',
+            'depth': self._new_depth_state(),
+            'temporal': {
+                'text_length': 0,
+                'tail': '',
+                'tail_start': 0,
+                'rescan_from': 0,
+                'last_match_end': 0,
+                'indicators': [],
+                'pending': []
+            }
+        }
+
+    def update_analysis_state(self, analysis_state: Dict, message: str) -> Dict:
+        """
+        Thêm một user message vào analysis state - O(len(message))
+        
+        Params:
+            - analysis_state: State từ create_analysis_state()
+            - message: Nội dung user message mới
+        
+        Return: analysis_state (đã cập nhật tại chỗ)
+        """
+        index = analysis_state['message_count']
+        self._update_depth_state(analysis_state['depth'], message)
+        self._update_temporal_state(analysis_state['temporal'], message.lower(), is_first=index == 0)
+        
+        analysis_state['message_count'] = index + 1
+        analysis_state['last_message_digest'] = _message_digest(message)
+        return analysis_state
+
+    def sync_analysis_state(self, analysis_state: Optional[Dict], history: List[Dict]) -> Dict:
+        """
+        Đưa analysis state về đúng với history, chỉ phân tích các tin nhắn mới
+        
+        State không khớp (version khác, history bị cắt/sửa) thì build lại từ đầu.
+        
+        Params:
+            - analysis_state: State từ lượt trước (có thể None)
+            - history: Lịch sử cuộc trò chuyện hiện tại
+        
+        Return: Analysis state đã cập nhật
+        """
+        user_contents = [msg.get('content', '') for msg in history if msg.get('role') == 'user']
+        
+        if not self._state_matches(analysis_state, user_contents):
+            analysis_state = self.create_analysis_state()
+        
+        for message in user_contents[analysis_state['message_count']:]:
+            self.update_analysis_state(analysis_state, message)
+        
+        return analysis_state
+
+    def depth_from_analysis_state(self, analysis_state: Dict) -> float:
+        """Progressive depth - bằng calculate_progressive_depth(history)"""
+        return self._depth_from_state(analysis_state['depth'])
+
+    def temporal_indicators_from_analysis_state(self, analysis_state: Dict) -> List[str]:
+        """Temporal indicators - bằng detect_temporal_indicators(combined user text)"""
+        return list(self._unique_temporal_matches(analysis_state))
+
+    def duration_from_analysis_state(self, analysis_state: Dict) -> float:
+        """Duration severity của toàn bộ user text"""
+        return self._score_severities(list(self._unique_temporal_matches(analysis_state).values()))
+
+    def _unique_temporal_matches(self, analysis_state: Dict) -> Dict[str, float]:
+        """{indicator: severity} theo thứ tự xuất hiện, gồm cả pending matches"""
+        temporal_state = analysis_state['temporal']
+        unique_matches = {}
+        for indicator, severity in temporal_state['indicators'] + temporal_state['pending']:
+            unique_matches.setdefault(indicator, severity)
+        return unique_matches
+
+    def _state_matches(self, analysis_state: Optional[Dict], user_contents: List[str]) -> bool:
+        """State hợp lệ và là prefix của history hiện tại"""
+        if not isinstance(analysis_state, dict) or analysis_state.get('version') != ANALYSIS_STATE_VERSION:
+            return False
+        
+        count = analysis_state.get('message_count', -1)
+        if not isinstance(count, int) or count < 0 or count > len(user_contents):
+            return False
+        
+        if count == 0:
+            return True
+        return analysis_state.get('last_message_digest') == _message_digest(user_contents[count - 1])
+
+    def _update_temporal_state(self, temporal_state: Dict, message_lower: str, is_first: bool) -> None:
+        """
+        Scan TEMPORAL_REGEX cho phần text mới, giống finditer trên ' '.join(messages)
+        
+        Match bắt đầu trong vùng rescan (TEMPORAL_LOOKBACK_CHARS cuối cùng, mở rộng
+        qua chuỗi số / khoảng trắng cho \d+\s*) chỉ là tạm thời: khi có thêm text,
+        một match dài hơn bắt đầu sớm hơn có thể thay thế nó, nên vùng này được
+        scan lại ở tin nhắn sau. Match trước vùng rescan là cố định.
+        """
+        base = temporal_state['tail_start']
+        rescan_from = temporal_state['rescan_from']
+        segment = temporal_state['tail'] + ('' if is_first else ' ') + message_lower
+        text_length = base + len(segment)
+        
+        # Vị trí sớm nhất mà một match có thể bắt đầu và kéo dài sang tin nhắn sau
+        floor = rescan_from - base
+        rescan = max(text_length - TEMPORAL_LOOKBACK_CHARS - base, floor)
+        while rescan > floor and (segment[rescan - 1].isdigit() or segment[rescan - 1].isspace()):
+            rescan -= 1
+        
+        pos = max(rescan_from, temporal_state['last_match_end']) - base
+        committed = temporal_state['indicators']
+        committed_indicators = {indicator for indicator, _ in committed}
+        pending = []
+        
+        # pos > 0 giữ ký tự phía trước để \b được đánh giá như trên full text
+        for match in TEMPORAL_REGEX.finditer(segment, pos):
+            entry = [match.group(match.lastgroup), TEMPORAL_SEVERITIES[match.lastgroup]]
+            if match.start() < rescan:
+                if entry[0] not in committed_indicators:
+                    committed.append(entry)
+                    committed_indicators.add(entry[0])
+                temporal_state['last_match_end'] = base + match.end()
+            else:
+                pending.append(entry)
+        
+        temporal_state['pending'] = pending
+        
+        tail_offset = max(rescan - 1, 0)
+        temporal_state['text_length'] = text_length
+        temporal_state['rescan_from'] = base + rescan
+        temporal_state['tail_start'] = base + tail_offset
+        temporal_state['tail'] = segment[tail_offset:]
+
     def analyze_conversation_context(self, history: List[Dict]) -> Dict:
         """
         Phân tích toàn diện context của cuộc trò chuyện
@@ -223,8 +471,7 @@ class ConversationAnalyzer:
         
         # Calculate metrics
         depth_score = self.calculate_progressive_depth(history)
-        temporal_indicators = self.detect_temporal_indicators(combined_text)
-        duration_score = self.score_duration_severity(temporal_indicators)
+        temporal_indicators, duration_score = self.analyze_temporal_indicators(combined_text)
         
         # Additional metrics
         avg_length = sum(len(msg['content']) for msg in user_messages) / len(user_messages)
@@ -246,6 +493,20 @@ class ConversationAnalyzer:
             'personal_sharing_level': sharing_level
         }
 
+def _message_digest(message: str) -> str:
+    """Fingerprint ngắn của tin nhắn để kiểm tra state khớp với history"""
+    return hashlib.sha1(message.encode('utf-8')).hexdigest()[:16]
+
+def _temporal_match_info(match: 're.Match') -> Dict:
+    """Indicator, category, severity và số ngày của một TEMPORAL_REGEX match"""
+    indicator = match.group(match.lastgroup)
+    return {
+        'indicator': indicator,
+        'category': match.lastgroup,
+        'severity': TEMPORAL_SEVERITIES[match.lastgroup],
+        'days': ConversationAnalyzer.normalize_duration_days(indicator)
+    }
+
 # Convenience functions
 def analyze_message_depth(message: str) -> float:
     """Convenience function để phân tích một message"""
@@ -265,4 +526,13 @@ def detect_temporal_indicators(text: str) -> List[str]:
 def score_duration_severity(indicators: List[str]) -> float:
     """Convenience function để score duration severity"""
     analyzer = ConversationAnalyzer()
-    return analyzer.score_duration_severity(indicators)
\ No newline at end of file
+    return analyzer.score_duration_severity(indicators)
+
+def analyze_temporal_indicators(text: str) -> Tuple[List[str], float]:
+    """Convenience function: (temporal indicators, duration severity) trong một lần scan"""
+    analyzer = ConversationAnalyzer()
+    return analyzer.analyze_temporal_indicators(text)
+
+def normalize_duration_days(indicator: str) -> Optional[int]:
+    """Convenience function để chuyển thời lượng thành số ngày"""
+    return ConversationAnalyzer.normalize_duration_days(indicator)
\ No newline at end of file
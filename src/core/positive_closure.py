@@ -9,8 +9,27 @@ from typing import Dict, List, Optional, Tuple
 from datetime import datetime
 from dataclasses import dataclass
 
+from src.core.turn_context import TurnAnalysisContext
+from src.utils.keyword_matcher import register_keyword_table, scan_keywords
+
 logger = logging.getLogger(__name__)
 
+# Từ khóa cho stable pattern detection
+CLOSURE_KEYWORDS = {
+    # Từ khóa chỉ sự ổn định
+    'stable': [
+        'ổn', 'bình thường', 'không sao', 'tốt', 'khá ổn', 'được rồi',
+        'cũng tạm', 'không có gì', 'fine', 'okay', 'good', 'normal'
+    ],
+    # Từ khóa nghiêm trọng
+    'serious': [
+        'tự tử', 'chết', 'không thể chịu nổi', 'tuyệt vọng', 'không còn hy vọng',
+        'suicide', 'die', 'hopeless', 'can\'t take it', 'end it all'
+    ]
+}
+
+register_keyword_table('closure', CLOSURE_KEYWORDS)
+
 @dataclass
 class ClosureConfig:
     """Configuration cho positive closure system"""
@@ -62,18 +81,22 @@ class PositiveClosureManager:
             ]
         }
 
-    def should_trigger_closure(self, conversation_history: List[Dict], current_ai_analysis: Dict) -> Tuple[bool, str]:
+    def should_trigger_closure(self, conversation_history: List[Dict], current_ai_analysis: Optional[Dict],
+                               turn_context: Optional[TurnAnalysisContext] = None) -> Tuple[bool, str]:
         """
         Kiểm tra xem có nên kích hoạt positive closure không
         
         Args:
             conversation_history: Lịch sử cuộc trò chuyện
             current_ai_analysis: Kết quả AI analysis hiện tại
+            turn_context: Context của lượt chat - dùng analysis đã có, không gọi AI thêm
             
         Returns:
             (should_close, reason)
         """
         try:
+            current_ai_analysis = self._resolve_analysis(current_ai_analysis, turn_context)
+            
             user_messages = [msg for msg in conversation_history if msg.get('role') == 'user']
             message_count = len(user_messages)
             
@@ -112,18 +135,22 @@ class PositiveClosureManager:
             logger.error(f"Error checking closure trigger: {e}")
             return False, f"Lỗi kiểm tra: {e}"
 
-    def generate_closure_message(self, conversation_history: List[Dict], ai_analysis: Dict) -> str:
+    def generate_closure_message(self, conversation_history: List[Dict], ai_analysis: Optional[Dict],
+                                 turn_context: Optional[TurnAnalysisContext] = None) -> str:
         """
         Tạo tin nhắn closure tích cực
         
         Args:
             conversation_history: Lịch sử cuộc trò chuyện
             ai_analysis: Kết quả AI analysis
+            turn_context: Context của lượt chat (optional)
             
         Returns:
             Closure message
         """
         try:
+            ai_analysis = self._resolve_analysis(ai_analysis, turn_context)
+            
             # Phân tích context để tạo message phù hợp
             context_type = ai_analysis.get('type', 'normal_worry')
             severity = ai_analysis.get('severity', 0.0)
@@ -155,6 +182,14 @@ class PositiveClosureManager:
             logger.error(f"Error generating closure message: {e}")
             return self._get_fallback_closure_message()
 
+    def _resolve_analysis(self, ai_analysis: Optional[Dict], turn_context: Optional[TurnAnalysisContext]) -> Dict:
+        """Lấy AI analysis của lượt chat hiện tại mà không gọi lại AI"""
+        if ai_analysis:
+            return ai_analysis
+        if turn_context is not None and turn_context.classification is not None:
+            return turn_context.classification
+        return {}
+
     def _extract_recent_severities(self, conversation_history: List[Dict], window_size: int = 5) -> List[float]:
         """Trích xuất severity scores của các tin nhắn gần đây"""
         severities = []
@@ -191,33 +226,17 @@ class PositiveClosureManager:
         try:
             user_messages = [msg['content'] for msg in conversation_history if msg.get('role') == 'user']
             
-            # Từ khóa chỉ sự ổn định
-            stable_keywords = [
-                'ổn', 'bình thường', 'không sao', 'tốt', 'khá ổn', 'được rồi',
-                'cũng tạm', 'không có gì', 'fine', 'okay', 'good', 'normal'
-            ]
-            
-            # Từ khóa nghiêm trọng
-            serious_keywords = [
-                'tự tử', 'chết', 'không thể chịu nổi', 'tuyệt vọng', 'không còn hy vọng',
-                'suicide', 'die', 'hopeless', 'can\'t take it', 'end it all'
-            ]
-            
             stable_count = 0
             serious_count = 0
             
             for message in user_messages[-3:]:  # Chỉ xét 3 tin nhắn gần nhất
-                message_lower = message.lower()
+                keyword_counts = scan_keywords(message.lower())
                 
-                for keyword in stable_keywords:
-                    if keyword in message_lower:
-                        stable_count += 1
-                        break
+                if keyword_counts.get('closure.stable', 0):
+                    stable_count += 1
                 
-                for keyword in serious_keywords:
-                    if keyword in message_lower:
-                        serious_count += 1
-                        break
+                if keyword_counts.get('closure.serious', 0):
+                    serious_count += 1
             
             # Pattern ổn định nếu có keyword stable và không có keyword serious
             return stable_count > 0 and serious_count == 0
@@ -0,0 +1,288 @@
+"""
+Severity Prefilter - Ước lượng severity cục bộ trước khi gọi LLM
+Keyword, depth and temporal features gate the 70B context analysis
+"""
+
+import logging
+import random
+import threading
+from typing import Callable, Dict, List, Optional, Any
+
+from src.core.ai_classifier import AREA_KEYWORDS
+from src.core.conversation_analyzer import ConversationAnalyzer
+from src.services.rate_limiter import PRIORITY_CRITICAL, get_current_priority, llm_priority_scope
+from src.utils.keyword_matcher import fold_diacritics, register_keyword_table, scan_keywords
+
+logger = logging.getLogger(__name__)
+
+# Từ khóa riêng của prefilter (area / depth keywords dùng lại từ các table khác)
+PREFILTER_KEYWORDS = {
+    # Crisis terms - luôn escalate lên LLM
+    'crisis': [
+        'tự tử', 'tự sát', 'muốn chết', 'tự hại', 'tự làm đau', 'kết liễu', 'không muốn sống',
+        'chấm dứt cuộc sống', 'kết thúc tất cả', 'không muốn tồn tại', 'nhảy lầu', 'nhảy cầu',
+        'muốn biến mất', 'biến mất mãi mãi', 'cắt tay', 'rạch tay', 'cứa tay', 'uống thuốc ngủ',
+        'suicide', 'suicidal', 'kill myself', 'end my life', 'want to die', 'self-harm',
+        'hurt myself', 'end it all', 'better off dead', 'want to be alive', 'want to live anymore',
+        'want to exist', 'cutting myself', 'cut myself', 'no reason to live', 'disappear forever'
+    ],
+    # Distress mạnh
+    'distress': [
+        'tuyệt vọng', 'vô vọng', 'trầm cảm', 'vô dụng', 'vô giá trị', 'hoảng loạn', 'không chịu nổi',
+        'không thể chịu nổi', 'kiệt sức', 'suy sụp', 'mất ngủ',
+        'hopeless', 'depressed', 'worthless', 'panic attack', 'can\'t take it', 'exhausted',
+        'breaking down', 'insomnia'
+    ],
+    # Bằng chứng severity thấp (chào hỏi, cảm ơn, tâm trạng tốt) - chỉ khi có các từ này mới skip LLM
+    'low_severity': [
+        'xin chào', 'chào bạn', 'cảm ơn', 'cám ơn', 'tạm biệt', 'vui vẻ', 'khỏe', 'ổn rồi', 'bình thường',
+        'hello', 'good morning', 'thanks', 'thank you', 'bye', 'i\'m fine', 'i am fine', 'feeling good',
+        'doing well'
+    ]
+}
+
+# Crisis terms gõ không dấu, match với bản fold_diacritics() của tin nhắn. Chỉ giữ cụm từ
+# không nhầm với từ thông dụng khi bỏ dấu ('tu tu' cũng là 'từ từ', 'tu hai' là 'từ hai')
+PREFILTER_FOLDED_KEYWORDS = {
+    'crisis': [
+        'muon tu tu', 'dinh tu tu', 'se tu tu', 'nghi den tu tu', 'nghi toi tu tu', 'tu tu chet',
+        'tu sat', 'muon chet', 'tu lam dau', 'tu hai ban than', 'ket lieu', 'khong muon song',
+        'cham dut cuoc song', 'ket thuc tat ca', 'khong muon ton tai', 'nhay lau', 'nhay cau',
+        'muon bien mat', 'bien mat mai mai', 'cat tay', 'rach tay', 'cua tay', 'uong thuoc ngu'
+    ]
+}
+
+register_keyword_table('prefilter', PREFILTER_KEYWORDS)
+register_keyword_table('prefilter_folded', PREFILTER_FOLDED_KEYWORDS)
+
+CRISIS_SEVERITY = 0.95
+
+class SeverityPrefilter:
+    """
+    Local severity scorer
+
+    Trả về severity estimate kèm confidence band [lower, upper]. Khi upper thấp
+    hơn skip_below thì không cần LLM; crisis term (có dấu hoặc không dấu) thì
+    luôn gọi LLM. Tin nhắn không match từ khóa nào có band tối đa. Một phần nhỏ
+    các lượt bị skip (shadow_rate) vẫn gọi LLM để đo disagreement.
+    """
+
+    def __init__(self, settings: Optional[Dict] = None):
+        settings = settings or {}
+        self.enabled = settings.get('enabled', True)
+        self.skip_below = float(settings.get('skip_below', 0.35))
+        self.shadow_rate = float(settings.get('shadow_rate', 0.05))
+        self.analyzer = ConversationAnalyzer()
+        self._rng = random.Random(settings.get('seed'))
+        self._lock = threading.Lock()
+        self.stats = {
+            'evaluated': 0,
+            'skipped': 0,
+            'crisis_escalations': 0,
+            'shadow_samples': 0,
+            'llm_compared': 0,
+            'disagreements': 0,
+            'missed_escalations': 0,
+            'usage_deferred': 0,
+            'budget_deferred': 0
+        }
+
+    def estimate(self, message: str) -> Dict[str, Any]:
+        """
+        Ước lượng severity của tin nhắn
+
+        Params:
+            - message: Tin nhắn hiện tại
+
+        Return: {'severity', 'lower', 'upper', 'confidence', 'crisis', 'type', 'skip_llm', 'signals'}
+        """
+        message_lower = (message or '').lower()
+        keyword_counts = scan_keywords(message_lower)
+
+        # Tin nhắn không dấu / trộn dấu: match crisis trên bản đã bỏ dấu
+        folded_counts = scan_keywords(fold_diacritics(message_lower))
+        crisis = max(keyword_counts.get('prefilter.crisis', 0), folded_counts.get('prefilter_folded.crisis', 0))
+        low_evidence = keyword_counts.get('prefilter.low_severity', 0)
+        distress = keyword_counts.get('prefilter.distress', 0)
+        areas = [area for area in AREA_KEYWORDS if keyword_counts.get(f"classifier_areas.{area}", 0)]
+        emotions = keyword_counts.get('depth.emotional_expressions', 0)
+        vulnerability = keyword_counts.get('depth.vulnerability_markers', 0)
+        _, duration = self.analyzer.analyze_temporal_indicators(message_lower)
+        depth = self.analyzer.analyze_message_depth(message)
+
+        if crisis:
+            severity, lower, upper = CRISIS_SEVERITY, CRISIS_SEVERITY, 1.0
+        else:
+            # Thời gian kéo dài chỉ đáng kể khi đi kèm dấu hiệu cảm xúc
+            duration_weight = 0.15 if (areas or distress) else 0.05
+            severity = min(
+                0.1 + 0.12 * len(areas) + 0.15 * min(distress, 2) + 0.05 * min(vulnerability, 2)
+                + duration_weight * duration,
+                0.85
+            )
+            # Càng nhiều tín hiệu / tin nhắn càng dài thì band càng rộng
+            content_signals = len(areas) + distress + vulnerability + emotions
+            signal_count = content_signals + (1 if duration > 0 else 0)
+            if content_signals == 0 and not low_evidence:
+                # Không match gì (chỉ có từ chỉ thời gian) không có nghĩa là severity thấp
+                # (paraphrase, lỗi chính tả, ngôn ngữ khác) - band tối đa để LLM quyết định
+                lower, upper = 0.0, 1.0
+            else:
+                margin = 0.1 + 0.05 * min(signal_count, 4) + 0.1 * depth
+                lower = max(0.0, severity - margin)
+                upper = min(1.0, severity + margin)
+
+        return {
+            'severity': round(severity, 4),
+            'lower': round(lower, 4),
+            'upper': round(upper, 4),
+            'confidence': round(max(0.0, 1.0 - (upper - lower)), 4),
+            'crisis': bool(crisis),
+            'type': self._guess_type(crisis, distress, areas),
+            'skip_llm': self.enabled and not crisis and upper < self.skip_below,
+            'signals': {
+                'crisis': crisis,
+                'distress': distress,
+                'areas': areas,
+                'emotions': emotions,
+                'vulnerability': vulnerability,
+                'low_severity': low_evidence,
+                'duration': duration,
+                'depth': round(depth, 4)
+            }
+        }
+
+    def classify(self, message: str, history: List[Dict],
+                 classify_fn: Callable[[str, List[Dict]], Dict], allow_llm: bool = True,
+                 deferred_reason: Optional[str] = None) -> Dict:
+        """
+        Classification có prefilter: skip LLM khi estimate chắc chắn thấp
+
+        Params:
+            - message: Tin nhắn hiện tại
+            - history: Lịch sử cuộc trò chuyện
+            - classify_fn: LLM classification (classify_emotional_context)
+            - allow_llm: False khi lượt này không được dùng LLM (AI_USAGE_CONTROL) - dùng estimate
+            - deferred_reason: Lý do allow_llm = False; 'budget_exhausted' được đếm riêng
+
+        Return: Dict cùng format với classify_emotional_context()
+        """
+        if not allow_llm:
+            self._count('budget_deferred' if deferred_reason == 'budget_exhausted' else 'usage_deferred')
+            return self.local_classification(self.estimate(message))
+
+        if not self.enabled:
+            return classify_fn(message, history)
+
+        estimate = self.estimate(message)
+        self._count('evaluated')
+
+        if estimate['skip_llm']:
+            if self._rng.random() >= self.shadow_rate:
+                self._count('skipped')
+                return self.local_classification(estimate)
+            self._count('shadow_samples')
+        elif estimate['crisis']:
+            self._count('crisis_escalations')
+
+        # Crisis message vượt lên đầu LLM rate limit queue
+        priority = PRIORITY_CRITICAL if estimate['crisis'] else get_current_priority()
+        with llm_priority_scope(priority):
+            result = classify_fn(message, history)
+        # Failure response (confidence 0) hoặc local model thay LLM thì không phải LLM label
+        llm_labelled = result.get('confidence', 0.0) > 0.0 and result.get('source') != 'local_model'
+
+        if llm_labelled:
+            self._record_comparison(estimate, result.get('severity', 0.0))
+        elif estimate['crisis'] and result.get('severity', 0.0) < estimate['severity']:
+            # Không để safe default / local model che mất crisis message
+            logger.warning("No LLM analysis for crisis message, using prefilter estimate")
+            return self.local_classification(estimate)
+
+        return result
+
+    def local_classification(self, estimate: Dict) -> Dict:
+        """Classification result từ estimate, không gọi LLM"""
+        if estimate['crisis']:
+            reasoning = 'Local prefilter: crisis term detected'
+        else:
+            reasoning = 'Local prefilter: no significant distress signals'
+        return {
+            'severity': estimate['severity'],
+            'type': estimate['type'],
+            'reasoning': reasoning,
+            'confidence': estimate['confidence'],
+            'source': 'prefilter'
+        }
+
+    def _record_comparison(self, estimate: Dict, llm_severity: float) -> None:
+        """Disagreement = LLM severity nằm ngoài confidence band"""
+        with self._lock:
+            self.stats['llm_compared'] += 1
+            if not estimate['lower'] <= llm_severity <= estimate['upper']:
+                self.stats['disagreements'] += 1
+            if estimate['skip_llm'] and llm_severity >= self.skip_below:
+                self.stats['missed_escalations'] += 1
+
+    @staticmethod
+    def _guess_type(crisis: int, distress: int, areas: List[str]) -> str:
+        if crisis:
+            return 'suicide_risk'
+        if distress and 'depression' in areas:
+            return 'depression_signs'
+        if distress and 'anxiety' in areas:
+            return 'clinical_anxiety'
+        if 'stress' in areas:
+            return 'situational_stress'
+        if 'depression' in areas:
+            return 'normal_sadness'
+        return 'normal_worry'
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Skip rate + disagreement rate so với LLM"""
+        with self._lock:
+            stats = dict(self.stats)
+        stats['enabled'] = self.enabled
+        stats['skip_below'] = self.skip_below
+        stats['skip_rate'] = round(stats['skipped'] / stats['evaluated'], 4) if stats['evaluated'] else 0.0
+        stats['disagreement_rate'] = (
+            round(stats['disagreements'] / stats['llm_compared'], 4) if stats['llm_compared'] else 0.0
+        )
+        return stats
+
+    def _count(self, name: str) -> None:
+        with self._lock:
+            self.stats[name] += 1
+
+# Global instance
+_severity_prefilter = None
+_prefilter_lock = threading.Lock()
+
+def get_severity_prefilter() -> SeverityPrefilter:
+    """Lazy global prefilter từ PREFILTER_SETTINGS"""
+    global _severity_prefilter
+
+    if _severity_prefilter is None:
+        with _prefilter_lock:
+            if _severity_prefilter is None:
+                try:
+                    from config import PREFILTER_SETTINGS
+                    settings = PREFILTER_SETTINGS
+                except ImportError:
+                    settings = {}
+                _severity_prefilter = SeverityPrefilter(settings)
+    return _severity_prefilter
+
+def estimate_severity(message: str) -> Dict[str, Any]:
+    """Convenience function để ước lượng severity cục bộ"""
+    return get_severity_prefilter().estimate(message)
+
+def classify_with_prefilter(message: str, history: List[Dict],
+                            classify_fn: Callable[[str, List[Dict]], Dict], allow_llm: bool = True,
+                            deferred_reason: Optional[str] = None) -> Dict:
+    """Convenience function: classification qua global prefilter"""
+    return get_severity_prefilter().classify(message, history, classify_fn, allow_llm, deferred_reason)
+
+def get_prefilter_stats() -> Dict[str, Any]:
+    """Convenience function for health endpoints"""
+    return get_severity_prefilter().get_stats()
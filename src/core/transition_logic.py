@@ -9,6 +9,9 @@ from datetime import datetime
 
 from src.services.ai_context_analyzer import classify_emotional_context
 from src.core.conversation_analyzer import ConversationAnalyzer
+from src.core.turn_context import TurnAnalysisContext
+from src.core.severity_prefilter import classify_with_prefilter
+from src.utils.metrics import track_stage
 
 logger = logging.getLogger(__name__)
 
@@ -38,13 +41,17 @@ class SimplifiedTransitionLogic:
             'situational_stress': 'dass21_stress'  # Default fallback
         }
 
-    def analyze_with_ai_context(self, text: str, conversation_history: List[Dict]) -> Dict:
+    def analyze_with_ai_context(self, text: str, conversation_history: List[Dict],
+                                turn_context: Optional[TurnAnalysisContext] = None,
+                                stage: str = 'transition') -> Dict:
         """
         Thay thế keyword matching bằng AI analysis
         
         Params:
             - text: Tin nhắn hiện tại
             - conversation_history: Lịch sử cuộc trò chuyện
+            - turn_context: Context của lượt chat, dùng lại AI classification nếu có
+            - stage: Tên bước gọi analysis (ghi vào turn_context)
         
         Return: {
             'severity': float,
@@ -54,8 +61,11 @@ class SimplifiedTransitionLogic:
         }
         """
         try:
-            # Gọi AI context analyzer
-            ai_result = classify_emotional_context(text, conversation_history)
+            # Gọi AI context analyzer (một lần mỗi lượt chat nếu có turn_context)
+            if turn_context is not None and turn_context.matches(text, conversation_history):
+                ai_result = turn_context.get_classification(stage)
+            else:
+                ai_result = classify_with_prefilter(text, conversation_history, classify_emotional_context)
             
             # Validate và process results
             severity = max(0.0, min(1.0, ai_result.get('severity', 0.0)))
@@ -90,18 +100,26 @@ class SimplifiedTransitionLogic:
                 'needs_followup': True
             }
 
-    def calculate_conversation_depth(self, history: List[Dict]) -> float:
+    def calculate_conversation_depth(self, history: List[Dict],
+                                     turn_context: Optional[TurnAnalysisContext] = None) -> float:
         """
         Đánh giá độ sâu cuộc trò chuyện
         
         Params:
             - history: Lịch sử tin nhắn
+            - turn_context: Context của lượt chat, dùng lại depth score nếu đã tính
         
         Return: Depth score 0.0-1.0
         """
+        if turn_context is not None and turn_context.history is history and turn_context.depth_score is not None:
+            return turn_context.depth_score
+        
         try:
-            # Gọi conversation analyzer
-            depth_score = self.conversation_analyzer.calculate_progressive_depth(history)
+            # Gọi conversation analyzer (incremental state nếu có)
+            if turn_context is not None and turn_context.history is history and turn_context.analysis_state is not None:
+                depth_score = self.conversation_analyzer.depth_from_analysis_state(turn_context.analysis_state)
+            else:
+                depth_score = self.conversation_analyzer.calculate_progressive_depth(history)
             
             # Apply business rules
             user_messages = [msg for msg in history if msg.get('role') == 'user']
@@ -112,22 +130,30 @@ class SimplifiedTransitionLogic:
                 depth_score *= 0.5  # Penalize very short conversations
             
             # Normalize score
-            return max(0.0, min(1.0, depth_score))
+            depth_score = max(0.0, min(1.0, depth_score))
+            if turn_context is not None and turn_context.history is history:
+                turn_context.depth_score = depth_score
+            return depth_score
             
         except Exception as e:
             logger.error(f"Error calculating conversation depth: {e}")
             return 0.0
 
-    def extract_duration_indicators(self, history: List[Dict]) -> float:
+    def extract_duration_indicators(self, history: List[Dict],
+                                    turn_context: Optional[TurnAnalysisContext] = None) -> float:
         """
         Phát hiện dấu hiệu về thời gian kéo dài
         
         Params:
             - history: Lịch sử tin nhắn
+            - turn_context: Context của lượt chat, dùng incremental analysis state nếu có
         
         Return: Duration score 0.0-1.0
         """
         try:
+            if turn_context is not None and turn_context.history is history and turn_context.analysis_state is not None:
+                return self.conversation_analyzer.duration_from_analysis_state(turn_context.analysis_state)
+            
             # Combine text từ tất cả user messages
             user_messages = [msg for msg in history if msg.get('role') == 'user']
             if not user_messages:
@@ -136,8 +162,7 @@ class SimplifiedTransitionLogic:
             combined_text = ' '.join([msg['content'] for msg in user_messages])
             
             # Gọi conversation analyzer
-            temporal_indicators = self.conversation_analyzer.detect_temporal_indicators(combined_text)
-            duration_score = self.conversation_analyzer.score_duration_severity(temporal_indicators)
+            _, duration_score = self.conversation_analyzer.analyze_temporal_indicators(combined_text)
             
             return duration_score
             
@@ -253,13 +278,15 @@ class SimplifiedTransitionLogic:
         
         return prefix + question
 
-    def should_transition_to_assessment(self, current_message: str, conversation_history: List[Dict]) -> Tuple[bool, str, str]:
+    def should_transition_to_assessment(self, current_message: str, conversation_history: List[Dict],
+                                        turn_context: Optional[TurnAnalysisContext] = None) -> Tuple[bool, str, str]:
         """
         Main entry point - quyết định có nên chuyển sang assessment không
         
         Params:
             - current_message: Tin nhắn hiện tại
             - conversation_history: Lịch sử cuộc trò chuyện
+            - turn_context: Context của lượt chat (optional)
         
         Return: (should_transition, assessment_type, reasoning)
         """
@@ -270,15 +297,16 @@ class SimplifiedTransitionLogic:
                 return False, '', f"Cần thêm {self.thresholds['minimum_messages'] - len(user_messages)} tin nhắn nữa"
             
             # 1. AI Context Analysis (50% weight)
-            ai_analysis = self.analyze_with_ai_context(current_message, conversation_history)
+            ai_analysis = self.analyze_with_ai_context(current_message, conversation_history, turn_context)
             ai_severity = ai_analysis['severity']
             context_type = ai_analysis['type']
             
-            # 2. Conversation Depth Analysis (30% weight)
-            depth_score = self.calculate_conversation_depth(conversation_history)
-            
-            # 3. Duration Analysis (20% weight)
-            duration_score = self.extract_duration_indicators(conversation_history)
+            with track_stage('depth_duration'):
+                # 2. Conversation Depth Analysis (30% weight)
+                depth_score = self.calculate_conversation_depth(conversation_history, turn_context)
+                
+                # 3. Duration Analysis (20% weight)
+                duration_score = self.extract_duration_indicators(conversation_history, turn_context)
             
             # 4. Make decision
             should_transition, base_assessment_type = self.simplified_transition_decision(
@@ -332,13 +360,15 @@ class TransitionManager:
     def __init__(self):
         self.logic = SimplifiedTransitionLogic()
     
-    def should_transition(self, messages: List[Dict], conversation_state: Dict) -> Tuple[bool, str, str]:
+    def should_transition(self, messages: List[Dict], conversation_state: Dict,
+                          turn_context: Optional[TurnAnalysisContext] = None) -> Tuple[bool, str, str]:
         """
         Main method cho transition check
         
         Params:
             - messages: Conversation history
             - conversation_state: Current state
+            - turn_context: Context của lượt chat (optional)
         
         Return: (should_transition, assessment_type, reasoning)
         """
@@ -352,9 +382,22 @@ class TransitionManager:
         
         current_message = user_messages[-1]['content']
         
-        return self.logic.should_transition_to_assessment(current_message, messages)
+        # Incremental depth/duration: chỉ phân tích tin nhắn mới, state đi theo chat state
+        if turn_context is not None and turn_context.history is messages:
+            try:
+                with track_stage('analysis_state_sync'):
+                    analysis_state = self.logic.conversation_analyzer.sync_analysis_state(
+                        conversation_state.get('conversation_analysis'), messages
+                    )
+                conversation_state['conversation_analysis'] = analysis_state
+                turn_context.analysis_state = analysis_state
+            except Exception as e:
+                logger.error(f"Error updating conversation analysis state: {e}")
+        
+        return self.logic.should_transition_to_assessment(current_message, messages, turn_context)
     
-    def generate_followup_question(self, messages: List[Dict]) -> str:
+    def generate_followup_question(self, messages: List[Dict],
+                                   turn_context: Optional[TurnAnalysisContext] = None) -> str:
         """Generate smart followup question"""
         if not messages:
             return "Bạn có thể chia sẻ thêm với tôi không?"
@@ -364,8 +407,8 @@ class TransitionManager:
             return "Hãy cho tôi biết thêm về cảm giác của bạn."
         
         current_message = user_messages[-1]['content']
-        ai_analysis = self.logic.analyze_with_ai_context(current_message, messages)
-        current_depth = self.logic.calculate_conversation_depth(messages)
+        ai_analysis = self.logic.analyze_with_ai_context(current_message, messages, turn_context, stage='followup')
+        current_depth = self.logic.calculate_conversation_depth(messages, turn_context)
         
         return self.logic.generate_smart_followup(ai_analysis, current_depth)
 
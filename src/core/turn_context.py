@@ -0,0 +1,78 @@
+"""
+Turn Context - Kết quả phân tích dùng chung cho một lượt chat
+Computed once per user message and shared by every stage of the turn
+"""
+
+import logging
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional
+
+from src.services.ai_context_analyzer import classify_emotional_context
+from src.core.severity_prefilter import classify_with_prefilter
+from src.utils.metrics import track_stage
+
+logger = logging.getLogger(__name__)
+
+@dataclass
+class TurnAnalysisContext:
+    """
+    Per-turn analysis cache
+
+    ChatEngine, TransitionManager, follow-up generation và PositiveClosureManager
+    đều cần cùng một AI classification cho cùng một tin nhắn. Object này gọi AI
+    tối đa một lần và giữ kết quả cho các bước còn lại của lượt chat.
+    """
+    message: str
+    history: List[Dict]
+    classification: Optional[Dict] = None
+    depth_score: Optional[float] = None
+    analysis_state: Optional[Dict] = None
+    # False khi AI_USAGE_CONTROL không cho phép LLM analysis ở lượt này
+    llm_allowed: bool = True
+    # Lý do khi llm_allowed = False ('budget_exhausted', 'interval', 'cooldown', ...)
+    llm_deferred_reason: Optional[str] = None
+    classification_calls: int = 0
+    classification_reuses: int = 0
+    stages: List[str] = field(default_factory=list)
+
+    def get_classification(self, stage: str = 'unknown') -> Dict:
+        """
+        Lấy AI classification cho tin nhắn hiện tại, chỉ gọi AI lần đầu
+
+        Severity prefilter có thể trả kết quả cục bộ (source='prefilter') thay cho LLM
+        khi tin nhắn chắc chắn severity thấp hoặc khi llm_allowed = False.
+
+        Params:
+            - stage: Tên bước đang cần kết quả (để debug)
+
+        Return: Kết quả từ classify_emotional_context()
+        """
+        if self.classification is None:
+            self.classification_calls += 1
+            with track_stage('classification'):
+                self.classification = classify_with_prefilter(
+                    self.message, self.history, classify_emotional_context,
+                    allow_llm=self.llm_allowed, deferred_reason=self.llm_deferred_reason
+                )
+            logger.debug(f"Turn classification computed by stage '{stage}'")
+        else:
+            self.classification_reuses += 1
+        self.stages.append(stage)
+        return self.classification
+
+    def matches(self, message: str, history: List[Dict]) -> bool:
+        """Check context được tạo cho đúng tin nhắn và lịch sử này"""
+        return self.message == message and self.history is history
+
+    def to_metadata(self) -> Dict:
+        """Thông tin để đưa vào response metadata"""
+        return {
+            'llm_classifications': self.classification_calls,
+            'classification_source': self.classification.get('source', 'llm') if self.classification else None,
+            'classification_reuses': self.classification_reuses,
+            'classification_stages': list(self.stages)
+        }
+
+def create_turn_context(message: str, history: List[Dict]) -> TurnAnalysisContext:
+    """Create a fresh analysis context for one chat turn"""
+    return TurnAnalysisContext(message=message, history=history)
@@ -6,44 +6,58 @@ Thay thế keyword matching bằng AI analysis thông minh
 import json
 import logging
 import re
-from typing import Dict, List, Optional, Any
-from src.services.together_client import get_together_client
+from typing import Dict, List, Optional, Any, Tuple
+from config import AI_ANALYSIS_SETTINGS
+from src.services.together_client import (
+    generate_chat_completion, agenerate_chat_completion, is_llm_available, is_llm_configured,
+    is_mock_llm_enabled
+)
+from src.services.circuit_breaker import CircuitOpenError
+from src.services.usage_ledger import SessionBudgetExceeded, is_session_budget_available
+from src.services.analysis_cache import AnalysisCache, create_analysis_cache
 
 logger = logging.getLogger(__name__)
 
 class AIContextAnalyzer:
     """Service chuyên phân tích ngữ cảnh cảm xúc bằng AI"""
     
-    def __init__(self):
-        self.client = None
+    def __init__(self, settings: Optional[Dict] = None):
         self.initialized = False
+        self.settings = settings or AI_ANALYSIS_SETTINGS
+        self.cache: Optional[AnalysisCache] = create_analysis_cache(self.settings)
+        # Local model (primary / shadow / fallback) + ghi LLM labels để train offline
+        # Import lazy: NumPy chỉ được load khi local model được bật
+        self.local_engine = None
+        if self.settings.get('local_model_mode', 'off') != 'off':
+            from src.services.local_classifier import LocalClassifierEngine
+            self.local_engine = LocalClassifierEngine(self.settings)
+        self.label_recorder = None
+        if self.settings.get('label_log_path'):
+            from src.services.local_classifier import LabelRecorder
+            self.label_recorder = LabelRecorder(self.settings['label_log_path'])
         
     def initialize_ai_analyzer(self) -> bool:
         """
         Khởi tạo AI analyzer service
+        
+        Chỉ kiểm tra cấu hình LLM, không gửi test request - client được tạo lazy
+        ở lần gọi đầu tiên, connection được warm-up ở background (start_llm_warmup).
         Return: True nếu khởi tạo thành công
         """
+        if self.initialized:
+            return True
+        
         try:
-            self.client = get_together_client()
-            if self.client is None:
-                logger.error("Failed to get Together AI client")
+            if not is_llm_configured():
+                logger.error("No LLM transport configured (API key / httpx / together SDK)")
                 return False
-                
-            # Test connection với một request đơn giản
-            test_response = self.client.chat.completions.create(
-                model="meta-llama/Llama-3.3-70B-Instruct-Turbo-Free",
-                messages=[{"role": "user", "content": "test"}],
-                max_tokens=10,
-                temperature=0.3
-            )
             
-            if test_response:
-                self.initialized = True
-                logger.info("AI Context Analyzer initialized successfully")
-                return True
+            self.initialized = True
+            if is_mock_llm_enabled():
+                logger.info("AI Context Analyzer initialized with mock LLM")
             else:
-                logger.error("AI test request failed")
-                return False
+                logger.info("AI Context Analyzer initialized")
+            return True
                 
         except Exception as e:
             logger.error(f"Error initializing AI analyzer: {e}")
@@ -64,39 +78,122 @@ class AIContextAnalyzer:
             'confidence': float
         }
         """
+        result, cache_key, params = self._prepare_request(text, history)
+        if result is not None:
+            return result
+        
+        try:
+            # Gọi AI qua pooled client (sync facade)
+            response = generate_chat_completion(**params)
+        except Exception as e:
+            return self._finish_response(None, cache_key, text, history, error=e)
+        return self._finish_response(response, cache_key, text, history)
+
+    async def aclassify_emotional_context(self, text: str, history: List[Dict]) -> Dict:
+        """
+        Async version của classify_emotional_context
+        
+        Không block thread trong lúc chờ AI - dùng cho async callers
+        (streaming, concurrent fan-out). Chỉ khác bản sync ở transport call.
+        """
+        result, cache_key, params = self._prepare_request(text, history)
+        if result is not None:
+            return result
+        
+        try:
+            response = await agenerate_chat_completion(**params)
+        except Exception as e:
+            return self._finish_response(None, cache_key, text, history, error=e)
+        return self._finish_response(response, cache_key, text, history)
+
+    def _prepare_request(self, text: str, history: List[Dict]) -> Tuple[Optional[Dict], Optional[str], Optional[Dict]]:
+        """
+        Các bước trước LLM call: cache, local model, circuit breaker, ngân sách, prompt
+        
+        Return: (result, cache_key, params) - result khác None thì trả luôn không gọi LLM,
+                ngược lại params là kwargs cho (a)generate_chat_completion
+        """
         if not self.initialized:
-            logger.warning("AI analyzer not initialized, returning default values")
-            return {
-                'severity': 0.0,
-                'type': 'normal_worry',
-                'reasoning': 'AI analyzer not available',
-                'confidence': 0.0
-            }
+            return self._get_unavailable_response(text, history), None, None
+        
+        cache_key, cached = self._cache_lookup(text, history)
+        if cached is not None:
+            return cached, cache_key, None
+        
+        if self.local_engine is not None:
+            local_result = self.local_engine.try_primary(text, history)
+            if local_result is not None:
+                return local_result, cache_key, None
+        
+        # Provider đang lỗi - trả local / default ngay thay vì chờ timeout
+        if not is_llm_available():
+            error = CircuitOpenError("Together AI circuit is open")
+            return self._get_failure_response(error, text, history), cache_key, None
+        
+        # Session đã hết ngân sách LLM - local analysis
+        if not is_session_budget_available():
+            error = SessionBudgetExceeded("Session LLM budget exhausted")
+            return self._get_failure_response(error, text, history), cache_key, None
         
         try:
             # Tạo prompt có cấu trúc
             prompt = self.create_context_analysis_prompt(text, history)
-            
-            # Gọi AI
-            response = self.client.chat.completions.create(
-                model="meta-llama/Llama-3.3-70B-Instruct-Turbo-Free",
-                messages=[{"role": "user", "content": prompt}],
-                max_tokens=200,
-                temperature=0.3
-            )
-            
-            # Parse response
-            ai_response = response.choices[0].message.content
-            return self.parse_ai_analysis_response(ai_response)
-            
         except Exception as e:
             logger.error(f"Error in AI emotional context analysis: {e}")
-            return {
-                'severity': 0.0,
-                'type': 'normal_worry',
-                'reasoning': f'AI analysis failed: {str(e)}',
-                'confidence': 0.0
-            }
+            return self._get_failure_response(e, text, history), cache_key, None
+        return None, cache_key, self._completion_params(prompt)
+
+    def _finish_response(self, response: Any, cache_key: Optional[str], text: str, history: List[Dict],
+                         error: Optional[Exception] = None) -> Dict:
+        """Các bước sau LLM call: parse response hoặc xử lý lỗi transport"""
+        try:
+            if error is not None:
+                raise error
+            return self._finalize_analysis(response, cache_key, text, history)
+        except Exception as e:
+            logger.error(f"Error in AI emotional context analysis: {e}")
+            return self._get_failure_response(e, text, history)
+
+    def _cache_lookup(self, text: str, history: List[Dict]):
+        """Cache lookup - retry, reload và các endpoint phụ dùng lại kết quả"""
+        if self.cache is None:
+            return None, None
+        
+        cache_key = AnalysisCache.make_key(
+            text, history, self.settings['model'], self.settings['temperature']
+        )
+        return cache_key, self.cache.get(cache_key)
+
+    def _completion_params(self, prompt: str) -> Dict:
+        return {
+            'messages': [{"role": "user", "content": prompt}],
+            'model': self.settings['model'],
+            'max_tokens': self.settings['max_tokens'],
+            'temperature': self.settings['temperature'],
+            'timeout': self.settings['timeout_seconds'],
+            'caller': 'AIContextAnalyzer'
+        }
+
+    def _finalize_analysis(self, response: Any, cache_key: Optional[str], text: str, history: List[Dict]) -> Dict:
+        """Parse response, lưu cache / label log nếu parse thành công"""
+        if response is None:
+            raise RuntimeError("No response from Together AI")
+        
+        ai_response = response.choices[0].message.content
+        result = self.parse_ai_analysis_response(ai_response)
+        
+        if result == self._get_default_response():
+            return self._local_fallback(text, history) or result
+        
+        # Chỉ cache kết quả parse thành công
+        if cache_key is not None:
+            self.cache.set(cache_key, result)
+        if self.label_recorder is not None:
+            self.label_recorder.record(text, history, result, self.settings['model'])
+        if self.local_engine is not None:
+            self.local_engine.compare_shadow(text, history, result)
+        
+        return result
 
     def create_context_analysis_prompt(self, text: str, history: List[Dict]) -> str:
         """
@@ -198,6 +295,55 @@ CHỈ TRẢ LỜI JSON, KHÔNG GIẢI THÍCH THÊM.
             logger.error(f"Error parsing AI response: {e}")
             return self._get_default_response()
 
+    def get_cache_stats(self) -> Dict:
+        """Cache statistics cho health/monitoring endpoints"""
+        if self.cache is None:
+            return {'enabled': False}
+        stats = self.cache.get_stats()
+        stats['enabled'] = True
+        return stats
+
+    def get_local_model_stats(self) -> Dict:
+        """Local classifier statistics cho health/monitoring endpoints"""
+        if self.local_engine is None:
+            return {'mode': 'off'}
+        return self.local_engine.get_stats()
+
+    def _local_fallback(self, text: str, history: List[Dict]) -> Optional[Dict]:
+        """Local prediction khi LLM không dùng được (None nếu local model tắt)"""
+        if self.local_engine is None:
+            return None
+        return self.local_engine.try_fallback(text, history)
+
+    def _get_unavailable_response(self, text: str, history: List[Dict]) -> Dict:
+        """Analyzer chưa khởi tạo: dùng local model nếu có, không thì default"""
+        local_result = self._local_fallback(text, history)
+        if local_result is not None:
+            return local_result
+        
+        logger.warning("AI analyzer not initialized, returning default values")
+        return {
+            'severity': 0.0,
+            'type': 'normal_worry',
+            'reasoning': 'AI analyzer not available',
+            'confidence': 0.0
+        }
+
+    def _get_failure_response(self, error: Exception, text: Optional[str] = None,
+                              history: Optional[List[Dict]] = None) -> Dict:
+        """Return local prediction hoặc safe defaults khi gọi AI thất bại"""
+        if text is not None:
+            local_result = self._local_fallback(text, history or [])
+            if local_result is not None:
+                return local_result
+        
+        return {
+            'severity': 0.0,
+            'type': 'normal_worry',
+            'reasoning': f'AI analysis failed: {str(error)}',
+            'confidence': 0.0
+        }
+
     def _get_default_response(self) -> Dict:
         """Return default response when parsing fails"""
         return {
@@ -216,4 +362,16 @@ def initialize_ai_analyzer() -> bool:
 
 def classify_emotional_context(text: str, history: List[Dict]) -> Dict:
     """Convenience function to use global analyzer"""
-    return ai_context_analyzer.classify_emotional_context(text, history)
\ No newline at end of file
+    return ai_context_analyzer.classify_emotional_context(text, history)
+
+async def aclassify_emotional_context(text: str, history: List[Dict]) -> Dict:
+    """Async convenience function to use global analyzer"""
+    return await ai_context_analyzer.aclassify_emotional_context(text, history)
+
+def get_analysis_cache_stats() -> Dict:
+    """Cache statistics of the global analyzer"""
+    return ai_context_analyzer.get_cache_stats()
+
+def get_local_model_stats() -> Dict:
+    """Local classifier statistics of the global analyzer"""
+    return ai_context_analyzer.get_local_model_stats()
\ No newline at end of file
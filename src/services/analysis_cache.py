@@ -0,0 +1,260 @@
+"""
+Analysis Cache - Cache kết quả AI context analysis
+TTL + LRU cache with in-process and SQLite (shared across workers) backends
+"""
+
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, List, Optional, Any, Tuple
+
+logger = logging.getLogger(__name__)
+
+class MemoryCacheBackend:
+    """In-process LRU backend (một cache riêng cho mỗi worker)"""
+
+    name = 'memory'
+
+    def __init__(self, max_entries: int = 1000):
+        self.max_entries = max_entries
+        self._entries: 'OrderedDict[str, Tuple[str, float]]' = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[Tuple[str, float]]:
+        """Return (value, expires_at) và đánh dấu key là mới dùng"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+            return entry
+
+    def set(self, key: str, value: str, expires_at: float) -> int:
+        """Store entry, return số entry bị evict do vượt max_entries"""
+        with self._lock:
+            self._entries[key] = (value, expires_at)
+            self._entries.move_to_end(key)
+
+            evicted = 0
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                evicted += 1
+            return evicted
+
+    def delete(self, key: str) -> None:
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def size(self) -> int:
+        with self._lock:
+            return len(self._entries)
+
+class SQLiteCacheBackend:
+    """SQLite backend - một file cache dùng chung giữa các gunicorn workers"""
+
+    name = 'sqlite'
+
+    def __init__(self, path: str, max_entries: int = 1000):
+        self.path = path
+        self.max_entries = max_entries
+        self._local = threading.local()
+
+        directory = os.path.dirname(path)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory, exist_ok=True)
+
+        conn = self._connection()
+        conn.execute(
+            'CREATE TABLE IF NOT EXISTS analysis_cache ('
+            'key TEXT PRIMARY KEY, value TEXT NOT NULL, '
+            'expires_at REAL NOT NULL, last_access REAL NOT NULL)'
+        )
+        conn.execute('CREATE INDEX IF NOT EXISTS idx_analysis_cache_access ON analysis_cache(last_access)')
+        conn.commit()
+
+    def _connection(self) -> sqlite3.Connection:
+        """Một connection cho mỗi thread"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5.0)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+        return conn
+
+    def get(self, key: str) -> Optional[Tuple[str, float]]:
+        conn = self._connection()
+        row = conn.execute(
+            'SELECT value, expires_at FROM analysis_cache WHERE key = ?', (key,)
+        ).fetchone()
+        if row is not None:
+            conn.execute('UPDATE analysis_cache SET last_access = ? WHERE key = ?', (time.time(), key))
+            conn.commit()
+        return row
+
+    def set(self, key: str, value: str, expires_at: float) -> int:
+        conn = self._connection()
+        conn.execute(
+            'INSERT OR REPLACE INTO analysis_cache (key, value, expires_at, last_access) VALUES (?, ?, ?, ?)',
+            (key, value, expires_at, time.time())
+        )
+
+        # Xóa entries hết hạn trước, sau đó evict theo LRU
+        conn.execute('DELETE FROM analysis_cache WHERE expires_at < ?', (time.time(),))
+        overflow = conn.execute('SELECT COUNT(*) FROM analysis_cache').fetchone()[0] - self.max_entries
+        evicted = 0
+        if overflow > 0:
+            cursor = conn.execute(
+                'DELETE FROM analysis_cache WHERE key IN '
+                '(SELECT key FROM analysis_cache ORDER BY last_access ASC LIMIT ?)',
+                (overflow,)
+            )
+            evicted = cursor.rowcount
+        conn.commit()
+        return evicted
+
+    def delete(self, key: str) -> None:
+        conn = self._connection()
+        conn.execute('DELETE FROM analysis_cache WHERE key = ?', (key,))
+        conn.commit()
+
+    def clear(self) -> None:
+        conn = self._connection()
+        conn.execute('DELETE FROM analysis_cache')
+        conn.commit()
+
+    def size(self) -> int:
+        return self._connection().execute('SELECT COUNT(*) FROM analysis_cache').fetchone()[0]
+
+class AnalysisCache:
+    """Content-addressed TTL cache cho kết quả classify_emotional_context"""
+
+    def __init__(self, backend, ttl_seconds: int = 300):
+        self.backend = backend
+        self.ttl_seconds = ttl_seconds
+        self._stats_lock = threading.Lock()
+        self.stats = {
+            'hits': 0,
+            'misses': 0,
+            'evictions': 0,
+            'expirations': 0,
+            'errors': 0
+        }
+
+    @staticmethod
+    def make_key(text: str, history: List[Dict], model: str, temperature: float, history_window: int = 3) -> str:
+        """
+        Tạo cache key từ nội dung thực sự được gửi lên AI
+
+        Params:
+            - text: Tin nhắn hiện tại
+            - history: Lịch sử cuộc trò chuyện
+            - model: Tên model
+            - temperature: Sampling temperature
+            - history_window: Số user messages gần nhất đưa vào prompt
+
+        Return: SHA-256 hex digest
+        """
+        user_messages = [msg.get('content', '') for msg in history if msg.get('role') == 'user']
+        payload = {
+            'text': normalize_text(text),
+            'history': [normalize_text(content) for content in user_messages[-history_window:]],
+            'model': model,
+            'temperature': round(float(temperature), 4)
+        }
+        raw = json.dumps(payload, ensure_ascii=False, sort_keys=True)
+        return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+    def get(self, key: str) -> Optional[Dict]:
+        """Return cached analysis hoặc None nếu miss / hết hạn"""
+        try:
+            entry = self.backend.get(key)
+        except Exception as e:
+            logger.error(f"Analysis cache read failed: {e}")
+            self._count('errors')
+            return None
+
+        if entry is None:
+            self._count('misses')
+            return None
+
+        value, expires_at = entry
+        if expires_at < time.time():
+            # Best effort - entry hết hạn sẽ bị ghi đè / evict sau nếu delete lỗi
+            try:
+                self.backend.delete(key)
+            except Exception as e:
+                logger.debug(f"Analysis cache expired entry delete failed: {e}")
+            self._count('expirations')
+            self._count('misses')
+            return None
+
+        self._count('hits')
+        return json.loads(value)
+
+    def set(self, key: str, analysis: Dict) -> None:
+        """Lưu analysis với TTL mặc định"""
+        try:
+            value = json.dumps(analysis, ensure_ascii=False)
+            evicted = self.backend.set(key, value, time.time() + self.ttl_seconds)
+            if evicted:
+                self._count('evictions', evicted)
+        except Exception as e:
+            logger.error(f"Analysis cache write failed: {e}")
+            self._count('errors')
+
+    def clear(self) -> None:
+        self.backend.clear()
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Hit/miss/eviction counters cho monitoring"""
+        with self._stats_lock:
+            stats = dict(self.stats)
+        lookups = stats['hits'] + stats['misses']
+        stats['hit_rate'] = stats['hits'] / lookups if lookups else 0.0
+        stats['backend'] = self.backend.name
+        stats['ttl_seconds'] = self.ttl_seconds
+        try:
+            stats['size'] = self.backend.size()
+        except Exception:
+            stats['size'] = None
+        return stats
+
+    def _count(self, name: str, amount: int = 1) -> None:
+        with self._stats_lock:
+            self.stats[name] += amount
+
+def normalize_text(text: str) -> str:
+    """Lowercase và gộp khoảng trắng để retry / reload trùng key"""
+    return ' '.join((text or '').lower().split())
+
+def create_analysis_cache(settings: Dict) -> Optional[AnalysisCache]:
+    """
+    Tạo cache từ AI_ANALYSIS_SETTINGS
+
+    Return: AnalysisCache hoặc None nếu caching bị tắt
+    """
+    if not settings.get('enable_caching', False):
+        return None
+
+    max_entries = settings.get('cache_max_entries', 1000)
+    backend_name = settings.get('cache_backend', 'memory')
+
+    if backend_name == 'sqlite':
+        try:
+            backend = SQLiteCacheBackend(settings.get('cache_path', 'cache/analysis_cache.sqlite3'), max_entries)
+        except Exception as e:
+            logger.error(f"SQLite analysis cache unavailable, using memory backend: {e}")
+            backend = MemoryCacheBackend(max_entries)
+    else:
+        backend = MemoryCacheBackend(max_entries)
+
+    return AnalysisCache(backend, ttl_seconds=settings.get('cache_duration', 300))
@@ -0,0 +1,189 @@
+"""
+Circuit Breaker - Bảo vệ app khi Together AI chậm hoặc down
+Failure-rate / slow-call tripping with half-open probing
+"""
+
+import logging
+import threading
+import time
+from collections import deque
+from typing import Any, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'
+
+class CircuitOpenError(RuntimeError):
+    """LLM call bị chặn vì circuit đang open"""
+
+class CircuitBreaker:
+    """
+    Circuit breaker cho LLM backend
+
+    - closed: mọi call đi qua, kết quả được ghi vào rolling window
+    - open: chặn ngay (caller dùng rule-based path), sau open_seconds chuyển half-open
+    - half_open: cho tối đa half_open_max_calls probe; probe thành công -> closed,
+      thất bại -> open lại
+
+    Circuit trip khi trong window có đủ min_requests và failure rate hoặc
+    tỉ lệ call chậm (> slow_call_seconds) vượt ngưỡng.
+    """
+
+    def __init__(self, settings: Optional[Dict] = None, name: str = 'together_ai'):
+        settings = settings or {}
+        self.name = name
+        self.enabled = settings.get('enabled', True)
+        self.window_seconds = float(settings.get('window_seconds', 60))
+        self.min_requests = int(settings.get('min_requests', 5))
+        self.failure_rate_threshold = float(settings.get('failure_rate_threshold', 0.5))
+        self.slow_call_seconds = float(settings.get('slow_call_seconds', 10))
+        self.slow_call_rate_threshold = float(settings.get('slow_call_rate_threshold', 0.8))
+        self.open_seconds = float(settings.get('open_seconds', 30))
+        self.half_open_max_calls = int(settings.get('half_open_max_calls', 1))
+
+        self._lock = threading.Lock()
+        self._state = CLOSED
+        self._opened_at = 0.0
+        self._half_open_in_flight = 0
+        self._calls: 'deque' = deque()  # (timestamp, success, latency)
+        self.stats = {
+            'rejected': 0,
+            'trips': 0,
+            'probes': 0
+        }
+        self.last_trip_reason = ''
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            return self._current_state()
+
+    def _current_state(self) -> str:
+        """State hiện tại, chuyển open -> half_open khi hết open_seconds (cần giữ lock)"""
+        if self._state == OPEN and time.monotonic() - self._opened_at >= self.open_seconds:
+            self._state = HALF_OPEN
+            self._half_open_in_flight = 0
+            logger.info(f"Circuit '{self.name}' half-open, probing backend")
+        return self._state
+
+    def allow_request(self) -> bool:
+        """
+        Check có được gọi LLM không
+
+        Return: True nếu call được phép (closed hoặc còn slot probe khi half-open)
+        """
+        if not self.enabled:
+            return True
+
+        with self._lock:
+            state = self._current_state()
+            if state == CLOSED:
+                return True
+            if state == HALF_OPEN and self._half_open_in_flight < self.half_open_max_calls:
+                self._half_open_in_flight += 1
+                self.stats['probes'] += 1
+                return True
+            self.stats['rejected'] += 1
+            return False
+
+    def is_available(self) -> bool:
+        """Check không tốn probe slot - dùng để chọn path trước khi gọi"""
+        if not self.enabled:
+            return True
+        with self._lock:
+            state = self._current_state()
+            return state == CLOSED or (state == HALF_OPEN and self._half_open_in_flight < self.half_open_max_calls)
+
+    def release(self) -> None:
+        """Call bị hủy trước khi có kết quả - trả lại probe slot, không tính là lỗi"""
+        if not self.enabled:
+            return
+        with self._lock:
+            if self._state == HALF_OPEN:
+                self._half_open_in_flight = max(0, self._half_open_in_flight - 1)
+
+    def record_success(self, latency: float) -> None:
+        self._record(True, latency)
+
+    def record_failure(self, latency: float) -> None:
+        self._record(False, latency)
+
+    def _record(self, success: bool, latency: float) -> None:
+        if not self.enabled:
+            return
+
+        with self._lock:
+            state = self._current_state()
+            slow = latency > self.slow_call_seconds
+
+            if state == HALF_OPEN:
+                self._half_open_in_flight = max(0, self._half_open_in_flight - 1)
+                if success and not slow:
+                    self._close()
+                else:
+                    self._trip('probe failed' if not success else 'probe too slow')
+                return
+
+            if state == OPEN:
+                # Call bắt đầu trước khi trip - không ảnh hưởng state
+                return
+
+            now = time.monotonic()
+            self._calls.append((now, success, latency))
+            while self._calls and now - self._calls[0][0] > self.window_seconds:
+                self._calls.popleft()
+
+            total = len(self._calls)
+            if total < self.min_requests:
+                return
+
+            failures = sum(1 for _, ok, _ in self._calls if not ok)
+            slow_calls = sum(1 for _, _, elapsed in self._calls if elapsed > self.slow_call_seconds)
+
+            if failures / total >= self.failure_rate_threshold:
+                self._trip(f"failure rate {failures}/{total}")
+            elif slow_calls / total >= self.slow_call_rate_threshold:
+                self._trip(f"slow call rate {slow_calls}/{total}")
+
+    def _trip(self, reason: str) -> None:
+        self._state = OPEN
+        self._opened_at = time.monotonic()
+        self._half_open_in_flight = 0
+        self._calls.clear()
+        self.stats['trips'] += 1
+        self.last_trip_reason = reason
+        logger.warning(f"Circuit '{self.name}' opened: {reason}")
+
+    def _close(self) -> None:
+        self._state = CLOSED
+        self._calls.clear()
+        logger.info(f"Circuit '{self.name}' closed, backend recovered")
+
+    def reset(self) -> None:
+        with self._lock:
+            self._close()
+
+    def get_stats(self) -> Dict[str, Any]:
+        """State + counters cho /api/chat/health"""
+        with self._lock:
+            state = self._current_state()
+            total = len(self._calls)
+            failures = sum(1 for _, ok, _ in self._calls if not ok)
+            stats = dict(self.stats)
+            stats.update({
+                'name': self.name,
+                'enabled': self.enabled,
+                'state': state,
+                'window_calls': total,
+                'window_failure_rate': round(failures / total, 3) if total else 0.0,
+                'last_trip_reason': self.last_trip_reason,
+                'retry_in_seconds': round(max(0.0, self.open_seconds - (time.monotonic() - self._opened_at)), 1)
+                if state == OPEN else 0.0
+            })
+        return stats
+
+def create_circuit_breaker(settings: Optional[Dict] = None, name: str = 'together_ai') -> CircuitBreaker:
+    """Create circuit breaker từ CIRCUIT_BREAKER_SETTINGS"""
+    return CircuitBreaker(settings, name=name)
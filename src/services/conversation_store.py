@@ -0,0 +1,355 @@
+"""
+Conversation Store - Lưu history, state và cached analyses phía server
+Session-keyed store with in-process and SQLite/WAL backends, TTL per session
+"""
+
+import copy
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, List, Optional, Any
+
+logger = logging.getLogger(__name__)
+
+class MemoryConversationBackend:
+    """In-process backend (mỗi worker một store riêng), LRU theo session"""
+
+    name = 'memory'
+
+    def __init__(self, max_sessions: int = 10000):
+        self.max_sessions = max_sessions
+        self._sessions: 'OrderedDict[str, Dict]' = OrderedDict()
+        self._lock = threading.Lock()
+
+    def load(self, session_id: str) -> Optional[Dict]:
+        """
+        Return bản copy của record: history là list mới (message dicts không bị sửa),
+        state và analyses được deepcopy vì chat engine cập nhật chúng tại chỗ
+        """
+        with self._lock:
+            record = self._sessions.get(session_id)
+            if record is None:
+                return None
+            self._sessions.move_to_end(session_id)
+            return {
+                'history': list(record['history']),
+                'state': copy.deepcopy(record['state']),
+                'analyses': copy.deepcopy(record['analyses']),
+                'updated_at': record['updated_at']
+            }
+
+    def append(self, session_id: str, messages: List[Dict], state: Dict, analyses: Dict, now: float) -> int:
+        """Thêm messages mới và thay state / analyses, return số session bị evict"""
+        with self._lock:
+            record = self._sessions.get(session_id)
+            if record is None:
+                record = {'history': [], 'created_at': now}
+                self._sessions[session_id] = record
+            record['history'].extend(messages)
+            record['state'] = copy.deepcopy(state)
+            record['analyses'] = copy.deepcopy(analyses)
+            record['updated_at'] = now
+            self._sessions.move_to_end(session_id)
+
+            evicted = 0
+            while len(self._sessions) > self.max_sessions:
+                self._sessions.popitem(last=False)
+                evicted += 1
+            return evicted
+
+    def delete(self, session_id: str) -> None:
+        with self._lock:
+            self._sessions.pop(session_id, None)
+
+    def purge_expired(self, cutoff: float) -> int:
+        with self._lock:
+            expired = [key for key, record in self._sessions.items() if record['updated_at'] < cutoff]
+            for key in expired:
+                del self._sessions[key]
+            return len(expired)
+
+    def size(self) -> int:
+        with self._lock:
+            return len(self._sessions)
+
+class SQLiteConversationBackend:
+    """
+    SQLite/WAL backend - dùng chung giữa các gunicorn workers
+
+    Mỗi lượt chat chỉ INSERT các message mới và UPDATE một dòng state,
+    không ghi lại toàn bộ history.
+    """
+
+    name = 'sqlite'
+
+    def __init__(self, path: str, max_sessions: int = 10000):
+        self.path = path
+        self.max_sessions = max_sessions
+        self._local = threading.local()
+
+        directory = os.path.dirname(path)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory, exist_ok=True)
+
+        conn = self._connection()
+        conn.execute(
+            'CREATE TABLE IF NOT EXISTS conversations ('
+            'session_id TEXT PRIMARY KEY, state TEXT NOT NULL, analyses TEXT NOT NULL, '
+            'message_count INTEGER NOT NULL, created_at REAL NOT NULL, updated_at REAL NOT NULL)'
+        )
+        conn.execute(
+            'CREATE TABLE IF NOT EXISTS conversation_messages ('
+            'session_id TEXT NOT NULL, seq INTEGER NOT NULL, message TEXT NOT NULL, '
+            'PRIMARY KEY (session_id, seq)) WITHOUT ROWID'
+        )
+        conn.execute('CREATE INDEX IF NOT EXISTS idx_conversations_updated ON conversations(updated_at)')
+        conn.commit()
+
+    def _connection(self) -> sqlite3.Connection:
+        """Một connection cho mỗi thread"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5.0)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+        return conn
+
+    def load(self, session_id: str) -> Optional[Dict]:
+        conn = self._connection()
+        row = conn.execute(
+            'SELECT state, analyses, updated_at FROM conversations WHERE session_id = ?', (session_id,)
+        ).fetchone()
+        if row is None:
+            return None
+
+        messages = conn.execute(
+            'SELECT message FROM conversation_messages WHERE session_id = ? ORDER BY seq', (session_id,)
+        ).fetchall()
+        return {
+            'history': [json.loads(message) for (message,) in messages],
+            'state': json.loads(row[0]),
+            'analyses': json.loads(row[1]),
+            'updated_at': row[2]
+        }
+
+    def append(self, session_id: str, messages: List[Dict], state: Dict, analyses: Dict, now: float) -> int:
+        conn = self._connection()
+        with conn:
+            row = conn.execute(
+                'SELECT message_count FROM conversations WHERE session_id = ?', (session_id,)
+            ).fetchone()
+            start = row[0] if row else 0
+
+            conn.executemany(
+                'INSERT OR REPLACE INTO conversation_messages (session_id, seq, message) VALUES (?, ?, ?)',
+                [(session_id, start + offset, json.dumps(message, ensure_ascii=False, default=str))
+                 for offset, message in enumerate(messages)]
+            )
+            conn.execute(
+                'INSERT INTO conversations (session_id, state, analyses, message_count, created_at, updated_at) '
+                'VALUES (?, ?, ?, ?, ?, ?) '
+                'ON CONFLICT(session_id) DO UPDATE SET state = excluded.state, analyses = excluded.analyses, '
+                'message_count = excluded.message_count, updated_at = excluded.updated_at',
+                (session_id, json.dumps(state, ensure_ascii=False, default=str),
+                 json.dumps(analyses, ensure_ascii=False, default=str), start + len(messages), now, now)
+            )
+
+            evicted = 0
+            overflow = conn.execute('SELECT COUNT(*) FROM conversations').fetchone()[0] - self.max_sessions
+            if overflow > 0:
+                oldest = [key for (key,) in conn.execute(
+                    'SELECT session_id FROM conversations ORDER BY updated_at ASC LIMIT ?', (overflow,)
+                )]
+                evicted = self._delete_sessions(conn, oldest)
+        return evicted
+
+    def delete(self, session_id: str) -> None:
+        conn = self._connection()
+        with conn:
+            self._delete_sessions(conn, [session_id])
+
+    def purge_expired(self, cutoff: float) -> int:
+        conn = self._connection()
+        with conn:
+            expired = [key for (key,) in conn.execute(
+                'SELECT session_id FROM conversations WHERE updated_at < ?', (cutoff,)
+            )]
+            return self._delete_sessions(conn, expired)
+
+    def size(self) -> int:
+        return self._connection().execute('SELECT COUNT(*) FROM conversations').fetchone()[0]
+
+    @staticmethod
+    def _delete_sessions(conn: sqlite3.Connection, session_ids: List[str]) -> int:
+        for session_id in session_ids:
+            conn.execute('DELETE FROM conversation_messages WHERE session_id = ?', (session_id,))
+            conn.execute('DELETE FROM conversations WHERE session_id = ?', (session_id,))
+        return len(session_ids)
+
+class ConversationStore:
+    """
+    History + state + cached analyses của mỗi chat session
+
+    Client chỉ gửi tin nhắn mới và nhận bot reply mới (delta protocol),
+    nên request / response có kích thước cố định thay vì tăng theo hội thoại.
+    Session không hoạt động quá ttl_seconds sẽ hết hạn.
+    """
+
+    def __init__(self, backend, ttl_seconds: float = 1800, purge_interval_seconds: float = 60):
+        self.backend = backend
+        self.ttl_seconds = ttl_seconds
+        self.purge_interval_seconds = purge_interval_seconds
+        self._last_purge = time.time()
+        self._stats_lock = threading.Lock()
+        self.stats = {
+            'loads': 0,
+            'misses': 0,
+            'appends': 0,
+            'expirations': 0,
+            'evictions': 0,
+            'errors': 0
+        }
+
+    def load(self, session_id: str) -> Optional[Dict]:
+        """
+        Lấy conversation của session
+
+        Params:
+            - session_id: session['session_id']
+
+        Return: {'history', 'state', 'analyses', 'updated_at'} hoặc None nếu chưa có / hết hạn
+        """
+        try:
+            record = self.backend.load(session_id)
+        except Exception as e:
+            logger.error(f"Conversation store read failed: {e}")
+            self._count('errors')
+            return None
+
+        if record is None:
+            self._count('misses')
+            return None
+
+        if record['updated_at'] < time.time() - self.ttl_seconds:
+            self.delete(session_id)
+            self._count('expirations')
+            self._count('misses')
+            return None
+
+        self._count('loads')
+        return record
+
+    def append(self, session_id: str, messages: List[Dict], state: Dict,
+               analyses: Optional[Dict] = None) -> bool:
+        """
+        Ghi các message mới của lượt chat và state sau lượt chat
+
+        Params:
+            - session_id: session['session_id']
+            - messages: Messages mới (user message + bot reply)
+            - state: Chat state sau lượt chat
+            - analyses: Cached analyses (vd incremental conversation analysis)
+
+        Return: True nếu ghi thành công
+        """
+        now = time.time()
+        try:
+            evicted = self.backend.append(session_id, messages, state, analyses or {}, now)
+            if evicted:
+                self._count('evictions', evicted)
+            self._count('appends')
+        except Exception as e:
+            logger.error(f"Conversation store write failed: {e}")
+            self._count('errors')
+            return False
+
+        if now - self._last_purge >= self.purge_interval_seconds:
+            self._last_purge = now
+            self.purge_expired()
+        return True
+
+    def delete(self, session_id: str) -> None:
+        try:
+            self.backend.delete(session_id)
+        except Exception as e:
+            logger.error(f"Conversation store delete failed: {e}")
+            self._count('errors')
+
+    def purge_expired(self) -> int:
+        """Xóa các session hết hạn, return số session bị xóa"""
+        try:
+            expired = self.backend.purge_expired(time.time() - self.ttl_seconds)
+        except Exception as e:
+            logger.error(f"Conversation store purge failed: {e}")
+            self._count('errors')
+            return 0
+        if expired:
+            self._count('expirations', expired)
+        return expired
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Counters cho /api/chat/health"""
+        with self._stats_lock:
+            stats = dict(self.stats)
+        stats['backend'] = self.backend.name
+        stats['ttl_seconds'] = self.ttl_seconds
+        try:
+            stats['sessions'] = self.backend.size()
+        except Exception:
+            stats['sessions'] = None
+        return stats
+
+    def _count(self, name: str, amount: int = 1) -> None:
+        with self._stats_lock:
+            self.stats[name] += amount
+
+def create_conversation_store(settings: Dict, ttl_seconds: Optional[float] = None) -> ConversationStore:
+    """
+    Tạo store từ CONVERSATION_STORE_SETTINGS
+
+    Params:
+        - settings: CONVERSATION_STORE_SETTINGS
+        - ttl_seconds: TTL mặc định (PERMANENT_SESSION_LIFETIME) khi settings không đặt ttl_seconds
+    """
+    max_sessions = settings.get('max_sessions', 10000)
+    backend_name = settings.get('backend', 'memory')
+
+    if backend_name == 'sqlite':
+        try:
+            backend = SQLiteConversationBackend(settings.get('path', 'cache/conversations.sqlite3'), max_sessions)
+        except Exception as e:
+            logger.error(f"SQLite conversation store unavailable, using memory backend: {e}")
+            backend = MemoryConversationBackend(max_sessions)
+    else:
+        backend = MemoryConversationBackend(max_sessions)
+
+    ttl = settings.get('ttl_seconds') or ttl_seconds or 1800
+    return ConversationStore(backend, ttl_seconds=ttl, purge_interval_seconds=settings.get('purge_interval_seconds', 60))
+
+# Global instance
+_conversation_store = None
+_store_lock = threading.Lock()
+
+def get_conversation_store(ttl_seconds: Optional[float] = None) -> ConversationStore:
+    """Lazy global store; ttl_seconds chỉ dùng lần tạo đầu tiên"""
+    global _conversation_store
+
+    if _conversation_store is None:
+        with _store_lock:
+            if _conversation_store is None:
+                try:
+                    from config import CONVERSATION_STORE_SETTINGS
+                    settings = CONVERSATION_STORE_SETTINGS
+                except ImportError:
+                    settings = {}
+                _conversation_store = create_conversation_store(settings, ttl_seconds)
+    return _conversation_store
+
+def get_conversation_store_stats() -> Dict[str, Any]:
+    """Convenience function for health endpoints"""
+    return get_conversation_store().get_stats()
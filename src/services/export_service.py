@@ -10,23 +10,30 @@ from typing import Dict, List, Optional, Any, Union
 from datetime import datetime
 from io import BytesIO
 import base64
+import importlib.util
 
-# For PDF generation
-try:
-    from reportlab.lib.pagesizes import letter, A4
+# For PDF generation - reportlab chỉ được import ở lần export PDF đầu tiên
+REPORTLAB_AVAILABLE = importlib.util.find_spec('reportlab') is not None
+if not REPORTLAB_AVAILABLE:
+    logging.warning("ReportLab not available. PDF export will be disabled.")
+
+_reportlab_loaded = False
+
+def _load_reportlab() -> None:
+    """Import các reportlab names dùng bởi PDF builders vào module globals"""
+    global _reportlab_loaded
+    global A4, getSampleStyleSheet, ParagraphStyle, inch, colors, TA_CENTER
+    global SimpleDocTemplate, Paragraph, Spacer, Table, TableStyle, PageBreak
+    
+    if _reportlab_loaded:
+        return
+    from reportlab.lib.pagesizes import A4
     from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
     from reportlab.lib.units import inch
     from reportlab.lib import colors
-    from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, Table, TableStyle
-    from reportlab.platypus import PageBreak, Image as RLImage
-    from reportlab.lib.enums import TA_LEFT, TA_CENTER, TA_RIGHT
-    from reportlab.graphics.shapes import Drawing
-    from reportlab.graphics.charts.piecharts import Pie
-    from reportlab.graphics.charts.barcharts import VerticalBarChart
-    REPORTLAB_AVAILABLE = True
-except ImportError:
-    REPORTLAB_AVAILABLE = False
-    logging.warning("ReportLab not available. PDF export will be disabled.")
+    from reportlab.lib.enums import TA_CENTER
+    from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, Table, TableStyle, PageBreak
+    _reportlab_loaded = True
 
 logger = logging.getLogger(__name__)
 
@@ -173,6 +180,7 @@ class ExportService:
             raise RuntimeError("PDF export not available - ReportLab not installed")
         
         try:
+            _load_reportlab()
             buffer = BytesIO()
             
             # Create PDF document
@@ -0,0 +1,143 @@
+"""
+Hedged Requests - Gửi request dự phòng khi LLM call chậm bất thường
+Cuts tail latency from provider stalls by racing a duplicate after the rolling p95
+"""
+
+import logging
+import threading
+from collections import deque
+from typing import Deque, Dict, Optional, Any
+
+from src.utils.metrics import get_metrics_registry
+
+logger = logging.getLogger(__name__)
+
+try:
+    from config import LLM_HEDGING_SETTINGS
+except ImportError:
+    LLM_HEDGING_SETTINGS = {'enabled': False}
+
+LLM_HEDGES = get_metrics_registry().counter(
+    'llm_hedged_requests_total', 'Duplicate LLM requests fired after the latency percentile', ('caller', 'outcome')
+)
+
+class HedgingPolicy:
+    """
+    Quyết định khi nào gửi request dự phòng cho từng call type (caller)
+
+    Latency của các call thành công được giữ trong cửa sổ trượt theo caller;
+    khi một call chạy lâu hơn percentile (mặc định p95) của caller đó thì gửi
+    thêm một request giống hệt, lấy kết quả về trước. Số hedge bị giới hạn
+    bởi max_hedge_ratio (credit tích lũy theo số request) để chi phí có trần.
+    """
+
+    def __init__(self, settings: Optional[Dict] = None):
+        settings = settings or {}
+        self.enabled = settings.get('enabled', False)
+        self.percentile = float(settings.get('percentile', 0.95))
+        self.max_hedge_ratio = float(settings.get('max_hedge_ratio', 0.1))
+        self.min_samples = int(settings.get('min_samples', 20))
+        self.window_size = int(settings.get('window_size', 200))
+        self.min_delay_seconds = float(settings.get('min_delay_seconds', 0.05))
+        # Credit tối đa tích lũy được - tránh dồn hedge sau thời gian dài không cần
+        self.max_credit = max(1.0, float(settings.get('max_burst', 5)))
+
+        self._latencies: Dict[str, Deque[float]] = {}
+        self._delays: Dict[str, Optional[float]] = {}
+        self._credit = 0.0
+        self._lock = threading.Lock()
+        self.stats = {
+            'requests': 0,
+            'hedged': 0,
+            'hedge_won': 0,
+            'capped': 0
+        }
+
+    def record_latency(self, caller: Optional[str], seconds: float) -> None:
+        """Ghi latency của một call thành công"""
+        key = caller or 'unknown'
+        with self._lock:
+            window = self._latencies.get(key)
+            if window is None:
+                window = self._latencies[key] = deque(maxlen=self.window_size)
+            window.append(seconds)
+            # Percentile được tính lại lười ở _current_delay()
+            self._delays.pop(key, None)
+
+    def hedge_delay(self, caller: Optional[str]) -> Optional[float]:
+        """
+        Thời gian chờ trước khi hedge cho một request mới của caller
+
+        Mỗi lần gọi là một request (tích credit cho hedge cap).
+
+        Return: Số giây, hoặc None khi hedging tắt / chưa đủ latency samples
+        """
+        if not self.enabled:
+            return None
+        key = caller or 'unknown'
+        with self._lock:
+            self.stats['requests'] += 1
+            self._credit = min(self.max_credit, self._credit + self.max_hedge_ratio)
+            return self._current_delay(key)
+
+    def _current_delay(self, key: str) -> Optional[float]:
+        """Percentile latency của caller (cache đến latency sample tiếp theo), gọi khi đã giữ lock"""
+        if key not in self._delays:
+            window = self._latencies.get(key)
+            if not window or len(window) < self.min_samples:
+                return None
+            ordered = sorted(window)
+            index = min(len(ordered) - 1, int(self.percentile * len(ordered)))
+            self._delays[key] = max(self.min_delay_seconds, ordered[index])
+        return self._delays[key]
+
+    def try_hedge(self, caller: Optional[str]) -> bool:
+        """Lấy một credit để gửi hedge, False khi đã chạm max_hedge_ratio"""
+        with self._lock:
+            if self._credit < 1.0:
+                self.stats['capped'] += 1
+                allowed = False
+            else:
+                self._credit -= 1.0
+                self.stats['hedged'] += 1
+                allowed = True
+        LLM_HEDGES.inc(caller=caller or 'unknown', outcome='fired' if allowed else 'capped')
+        return allowed
+
+    def record_outcome(self, caller: Optional[str], hedge_won: bool) -> None:
+        """Ghi lại request nào thắng sau khi đã hedge"""
+        if hedge_won:
+            with self._lock:
+                self.stats['hedge_won'] += 1
+        LLM_HEDGES.inc(caller=caller or 'unknown', outcome='hedge_won' if hedge_won else 'primary_won')
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            stats = dict(self.stats)
+            delays = {key: self._current_delay(key) for key in self._latencies}
+            stats['delays'] = {key: round(delay, 3) for key, delay in delays.items() if delay is not None}
+            stats['samples'] = {key: len(window) for key, window in self._latencies.items()}
+        stats.update({
+            'enabled': self.enabled,
+            'percentile': self.percentile,
+            'max_hedge_ratio': self.max_hedge_ratio
+        })
+        return stats
+
+# Global instance
+_hedging_policy = None
+_policy_lock = threading.Lock()
+
+def get_hedging_policy() -> HedgingPolicy:
+    """Lazy global policy từ LLM_HEDGING_SETTINGS"""
+    global _hedging_policy
+
+    if _hedging_policy is None:
+        with _policy_lock:
+            if _hedging_policy is None:
+                _hedging_policy = HedgingPolicy(LLM_HEDGING_SETTINGS)
+    return _hedging_policy
+
+def get_hedging_stats() -> Dict[str, Any]:
+    """Convenience function for health endpoints"""
+    return get_hedging_policy().get_stats()
@@ -0,0 +1,476 @@
+"""
+Local Classifier - Emotion classifier chạy trên CPU, distill từ LLM labels
+Hashed character n-grams + logistic regression (NumPy only), versioned weights file
+"""
+
+import json
+import logging
+import os
+import threading
+import time
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional, Any, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Format của weights file - tăng khi đổi feature extraction hoặc layout
+MODEL_FORMAT_VERSION = 1
+
+CONTEXT_TYPES = [
+    'normal_worry', 'normal_sadness', 'situational_stress',
+    'clinical_anxiety', 'depression_signs', 'chronic_stress', 'suicide_risk'
+]
+
+LOCAL_MODEL_MODES = ('off', 'primary', 'shadow', 'fallback')
+
+# Hash seeds để n-gram của tin nhắn hiện tại và của history không trùng bucket
+MESSAGE_SEED = 0x9E3779B1
+HISTORY_SEED = 0x85EBCA77
+HASH_MULTIPLIER = np.uint64(0x01000193)
+HASH_MASK = np.uint64(0xFFFFFFFF)
+
+class HashedNgramFeaturizer:
+    """
+    Character n-grams hashed vào n_features buckets
+
+    Hash là polynomial hash trên code points, tính vector hóa bằng NumPy nên
+    ổn định giữa các process (không phụ thuộc PYTHONHASHSEED) và không cần
+    vòng lặp Python theo từng ký tự.
+    """
+
+    def __init__(self, n_features: int = 2 ** 15, ngram_range: Tuple[int, int] = (2, 4),
+                 history_messages: int = 3, history_weight: float = 0.5):
+        self.n_features = n_features
+        self.ngram_range = tuple(ngram_range)
+        self.history_messages = history_messages
+        self.history_weight = history_weight
+
+    def _hash_ngrams(self, text: str, seed: int) -> np.ndarray:
+        """Bucket index của mọi n-gram trong text"""
+        padded = f" {' '.join(text.lower().split())} "
+        codes = np.frombuffer(padded.encode('utf-32-le'), dtype=np.uint32).astype(np.uint64)
+
+        buckets = []
+        min_n, max_n = self.ngram_range
+        hashes = np.full(len(codes), seed, dtype=np.uint64)
+        for n in range(1, max_n + 1):
+            if n > len(codes):
+                break
+            # hashes[i] = hash của codes[i:i+n]
+            hashes = ((hashes[:len(codes) - n + 1] * HASH_MULTIPLIER) ^ codes[n - 1:]) & HASH_MASK
+            if n >= min_n:
+                buckets.append(((hashes ^ np.uint64(n)) * HASH_MULTIPLIER & HASH_MASK) % np.uint64(self.n_features))
+
+        if not buckets:
+            return np.empty(0, dtype=np.int64)
+        return np.concatenate(buckets).astype(np.int64)
+
+    def transform(self, text: str, history: Optional[List[Dict]] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Sparse feature vector cho một tin nhắn
+
+        Params:
+            - text: Tin nhắn hiện tại
+            - history: Lịch sử cuộc trò chuyện (chỉ dùng user messages gần nhất)
+
+        Return: (indices, values) - indices unique, values đã L2-normalize
+        """
+        indices = [self._hash_ngrams(text or '', MESSAGE_SEED)]
+        weights = [np.ones(len(indices[0]))]
+
+        user_messages = [msg.get('content', '') for msg in (history or []) if msg.get('role') == 'user']
+        if self.history_messages and user_messages:
+            context = ' '.join(user_messages[-self.history_messages:])
+            history_indices = self._hash_ngrams(context, HISTORY_SEED)
+            indices.append(history_indices)
+            weights.append(np.full(len(history_indices), self.history_weight))
+
+        all_indices = np.concatenate(indices)
+        if len(all_indices) == 0:
+            return all_indices, np.empty(0)
+
+        unique, inverse = np.unique(all_indices, return_inverse=True)
+        values = np.bincount(inverse, weights=np.concatenate(weights))
+        # Sublinear tf rồi L2-normalize
+        values = np.log1p(values)
+        values /= np.linalg.norm(values)
+        return unique, values
+
+    def to_config(self) -> Dict:
+        return {
+            'n_features': self.n_features,
+            'ngram_range': list(self.ngram_range),
+            'history_messages': self.history_messages,
+            'history_weight': self.history_weight
+        }
+
+class LocalEmotionClassifier:
+    """
+    Logistic regression trên hashed n-grams
+
+    Hai head dùng chung features: softmax cho 'type' và sigmoid (soft target)
+    cho 'severity'. Output cùng format với parse_ai_analysis_response().
+    """
+
+    def __init__(self, featurizer: Optional[HashedNgramFeaturizer] = None, labels: Optional[List[str]] = None):
+        self.featurizer = featurizer or HashedNgramFeaturizer()
+        self.labels = list(labels or CONTEXT_TYPES)
+        n_features = self.featurizer.n_features
+        self.type_weights = np.zeros((n_features, len(self.labels)))
+        self.type_bias = np.zeros(len(self.labels))
+        self.severity_weights = np.zeros(n_features)
+        self.severity_bias = 0.0
+        self.metadata: Dict[str, Any] = {}
+
+    def predict(self, text: str, history: Optional[List[Dict]] = None) -> Dict:
+        """
+        Phân loại một tin nhắn
+
+        Return: {'severity', 'type', 'reasoning', 'confidence', 'source'}
+        """
+        indices, values = self.featurizer.transform(text, history)
+        type_scores = values @ self.type_weights[indices] + self.type_bias
+        severity_score = float(values @ self.severity_weights[indices]) + self.severity_bias
+
+        probabilities = _softmax(type_scores)
+        best = int(np.argmax(probabilities))
+        return {
+            'severity': round(float(_sigmoid(severity_score)), 4),
+            'type': self.labels[best],
+            'reasoning': f"Local model {self.metadata.get('model_version', 'untrained')}",
+            'confidence': round(float(probabilities[best]), 4),
+            'source': 'local_model'
+        }
+
+    def fit(self, examples: List[Dict], epochs: int = 15, learning_rate: float = 0.5,
+            l2: float = 1e-5, batch_size: int = 64, seed: int = 42) -> Dict[str, float]:
+        """
+        Train từ recorded LLM labels
+
+        Params:
+            - examples: [{'text', 'history', 'label': {'severity', 'type', 'confidence'}}]
+            - epochs / learning_rate / l2 / batch_size: Mini-batch SGD settings
+            - seed: Random seed cho shuffle
+
+        Return: Training metrics (loss cuối, số examples)
+        """
+        rows = [self.featurizer.transform(example['text'], example.get('history')) for example in examples]
+        label_index = {label: i for i, label in enumerate(self.labels)}
+        type_targets = np.array([label_index.get(example['label']['type'], 0) for example in examples])
+        severity_targets = np.array([float(example['label']['severity']) for example in examples])
+        # Label có confidence cao được tin hơn
+        sample_weights = np.array([max(float(example['label'].get('confidence', 1.0)), 0.1) for example in examples])
+
+        rng = np.random.default_rng(seed)
+        n_labels = len(self.labels)
+        loss = 0.0
+        for epoch in range(epochs):
+            order = rng.permutation(len(rows))
+            step = learning_rate / (1.0 + 0.5 * epoch)
+            total_loss = 0.0
+            for start in range(0, len(order), batch_size):
+                batch = order[start:start + batch_size]
+                indices, values, row_ids = _stack_rows([rows[i] for i in batch])
+                weights = sample_weights[batch]
+                scale = step / weights.sum()
+
+                # Forward
+                type_scores = np.zeros((len(batch), n_labels))
+                np.add.at(type_scores, row_ids, values[:, None] * self.type_weights[indices])
+                type_scores += self.type_bias
+                severity_scores = np.bincount(
+                    row_ids, weights=values * self.severity_weights[indices], minlength=len(batch)
+                ) + self.severity_bias
+
+                probabilities = np.apply_along_axis(_softmax, 1, type_scores)
+                predicted_severity = _sigmoid(severity_scores)
+                targets = np.eye(n_labels)[type_targets[batch]]
+
+                total_loss += float(np.sum(weights * (
+                    -np.log(probabilities[np.arange(len(batch)), type_targets[batch]] + 1e-12)
+                    + _binary_cross_entropy(predicted_severity, severity_targets[batch])
+                )))
+
+                # Backward (cross-entropy gradients)
+                type_error = (probabilities - targets) * weights[:, None]
+                severity_error = (predicted_severity - severity_targets[batch]) * weights
+
+                type_gradient = np.zeros_like(self.type_weights)
+                np.add.at(type_gradient, indices, values[:, None] * type_error[row_ids])
+                severity_gradient = np.bincount(
+                    indices, weights=values * severity_error[row_ids], minlength=self.featurizer.n_features
+                )
+
+                self.type_weights -= scale * type_gradient + step * l2 * self.type_weights
+                self.type_bias -= scale * type_error.sum(axis=0)
+                self.severity_weights -= scale * severity_gradient + step * l2 * self.severity_weights
+                self.severity_bias -= scale * float(severity_error.sum())
+
+            loss = total_loss / sample_weights.sum()
+            logger.debug(f"Epoch {epoch + 1}/{epochs}: loss={loss:.4f}")
+
+        return {'loss': round(loss, 4), 'examples': len(examples)}
+
+    def evaluate(self, examples: List[Dict]) -> Dict[str, float]:
+        """Type accuracy + severity MAE so với LLM labels"""
+        if not examples:
+            return {'type_accuracy': 0.0, 'severity_mae': 0.0, 'examples': 0}
+        predictions = [self.predict(example['text'], example.get('history')) for example in examples]
+        correct = sum(1 for prediction, example in zip(predictions, examples)
+                      if prediction['type'] == example['label']['type'])
+        errors = [abs(prediction['severity'] - float(example['label']['severity']))
+                  for prediction, example in zip(predictions, examples)]
+        return {
+            'type_accuracy': round(correct / len(examples), 4),
+            'severity_mae': round(sum(errors) / len(errors), 4),
+            'examples': len(examples)
+        }
+
+    def save(self, path: str, model_version: str, extra_metadata: Optional[Dict] = None) -> None:
+        """
+        Ghi weights file (.npz, không dùng pickle)
+
+        Params:
+            - path: Đường dẫn file
+            - model_version: Version ghi vào metadata, hiện trong reasoning / health
+            - extra_metadata: Metrics, số examples, ...
+        """
+        self.metadata = {
+            'format_version': MODEL_FORMAT_VERSION,
+            'model_version': model_version,
+            'labels': self.labels,
+            'featurizer': self.featurizer.to_config(),
+            'created_at': datetime.now().isoformat(),
+            **(extra_metadata or {})
+        }
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        # float32 đủ chính xác và giảm một nửa kích thước file
+        np.savez_compressed(
+            path,
+            metadata=np.array(json.dumps(self.metadata, ensure_ascii=False)),
+            type_weights=self.type_weights.astype(np.float32),
+            type_bias=self.type_bias.astype(np.float32),
+            severity_weights=self.severity_weights.astype(np.float32),
+            severity_bias=np.array([self.severity_bias], dtype=np.float32)
+        )
+
+    @classmethod
+    def load(cls, path: str) -> 'LocalEmotionClassifier':
+        """Load weights file, raise ValueError nếu format không khớp"""
+        with np.load(path, allow_pickle=False) as data:
+            metadata = json.loads(str(data['metadata']))
+            if metadata.get('format_version') != MODEL_FORMAT_VERSION:
+                raise ValueError(
+                    f"Unsupported local model format {metadata.get('format_version')} "
+                    f"(expected {MODEL_FORMAT_VERSION})"
+                )
+            featurizer_config = metadata['featurizer']
+            featurizer = HashedNgramFeaturizer(
+                n_features=featurizer_config['n_features'],
+                ngram_range=tuple(featurizer_config['ngram_range']),
+                history_messages=featurizer_config['history_messages'],
+                history_weight=featurizer_config['history_weight']
+            )
+            model = cls(featurizer, metadata['labels'])
+            model.type_weights = data['type_weights'].astype(np.float64)
+            model.type_bias = data['type_bias'].astype(np.float64)
+            model.severity_weights = data['severity_weights'].astype(np.float64)
+            model.severity_bias = float(data['severity_bias'][0])
+        model.metadata = metadata
+        return model
+
+class LocalClassifierEngine:
+    """
+    Chạy local model cạnh AIContextAnalyzer theo mode
+
+    - primary: dùng local prediction khi đủ confidence, còn lại gọi LLM
+    - shadow: luôn dùng LLM, local prediction chỉ để đo agreement
+    - fallback: chỉ dùng local khi LLM lỗi / circuit open
+    """
+
+    def __init__(self, settings: Dict):
+        self.mode = settings.get('local_model_mode', 'off')
+        self.model_path = settings.get('local_model_path', 'models/emotion_classifier_v1.npz')
+        self.min_confidence = float(settings.get('local_model_min_confidence', 0.8))
+        self.model: Optional[LocalEmotionClassifier] = None
+        self._load_attempted = False
+        self._lock = threading.Lock()
+        self.stats = {
+            'predictions': 0,
+            'primary_hits': 0,
+            'fallbacks': 0,
+            'shadow_compared': 0,
+            'shadow_type_agreements': 0,
+            'shadow_severity_error_sum': 0.0,
+            'predict_seconds_total': 0.0
+        }
+
+    @property
+    def enabled(self) -> bool:
+        return self.mode in ('primary', 'shadow', 'fallback')
+
+    def get_model(self) -> Optional[LocalEmotionClassifier]:
+        """Load model một lần; None nếu không có weights file"""
+        if not self._load_attempted:
+            with self._lock:
+                if not self._load_attempted:
+                    self._load_attempted = True
+                    try:
+                        self.model = LocalEmotionClassifier.load(self.model_path)
+                        logger.info(f"Local classifier {self.model.metadata.get('model_version')} "
+                                    f"loaded from {self.model_path}")
+                    except FileNotFoundError:
+                        logger.warning(f"Local classifier weights not found: {self.model_path}")
+                    except Exception as e:
+                        logger.error(f"Error loading local classifier: {e}")
+        return self.model
+
+    def predict(self, text: str, history: List[Dict]) -> Optional[Dict]:
+        """Local prediction, None nếu model không khả dụng"""
+        model = self.get_model()
+        if model is None:
+            return None
+        try:
+            started = time.perf_counter()
+            result = model.predict(text, history)
+            self._count('predict_seconds_total', time.perf_counter() - started)
+            self._count('predictions')
+            return result
+        except Exception as e:
+            logger.error(f"Local classifier prediction failed: {e}")
+            return None
+
+    def try_primary(self, text: str, history: List[Dict]) -> Optional[Dict]:
+        """Primary mode: return local result nếu đủ confidence"""
+        if self.mode != 'primary':
+            return None
+        result = self.predict(text, history)
+        if result is not None and result['confidence'] >= self.min_confidence:
+            self._count('primary_hits')
+            return result
+        return None
+
+    def try_fallback(self, text: str, history: List[Dict]) -> Optional[Dict]:
+        """Khi LLM lỗi: mọi mode đều dùng local model nếu có"""
+        if not self.enabled:
+            return None
+        result = self.predict(text, history)
+        if result is not None:
+            self._count('fallbacks')
+        return result
+
+    def compare_shadow(self, text: str, history: List[Dict], llm_result: Dict) -> None:
+        """Shadow mode: so local prediction với LLM label"""
+        if self.mode != 'shadow':
+            return
+        result = self.predict(text, history)
+        if result is None:
+            return
+        with self._lock:
+            self.stats['shadow_compared'] += 1
+            if result['type'] == llm_result.get('type'):
+                self.stats['shadow_type_agreements'] += 1
+            self.stats['shadow_severity_error_sum'] += abs(result['severity'] - llm_result.get('severity', 0.0))
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            stats = dict(self.stats)
+        compared = stats.pop('shadow_compared')
+        agreements = stats.pop('shadow_type_agreements')
+        error_sum = stats.pop('shadow_severity_error_sum')
+        predict_seconds = stats.pop('predict_seconds_total')
+        stats.update({
+            'mode': self.mode,
+            'model_version': self.model.metadata.get('model_version') if self.model else None,
+            'shadow_compared': compared,
+            'shadow_type_agreement': round(agreements / compared, 4) if compared else None,
+            'shadow_severity_mae': round(error_sum / compared, 4) if compared else None,
+            'avg_predict_ms': round(predict_seconds * 1000 / stats['predictions'], 4) if stats['predictions'] else None
+        })
+        return stats
+
+    def _count(self, name: str, amount: float = 1) -> None:
+        with self._lock:
+            self.stats[name] += amount
+
+class LabelRecorder:
+    """
+    Ghi (message, history) -> parsed LLM label vào JSONL để train offline
+
+    Chỉ lưu user messages gần nhất của history (đúng phần prompt dùng).
+    """
+
+    def __init__(self, path: str, history_messages: int = 3):
+        self.path = path
+        self.history_messages = history_messages
+        self._lock = threading.Lock()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+    def record(self, text: str, history: List[Dict], label: Dict, model: str) -> None:
+        user_messages = [
+            {'role': 'user', 'content': msg.get('content', '')}
+            for msg in history if msg.get('role') == 'user'
+        ][-self.history_messages:]
+        line = json.dumps({
+            'text': text,
+            'history': user_messages,
+            'label': {key: label.get(key) for key in ('severity', 'type', 'confidence')},
+            'model': model,
+            'recorded_at': datetime.now().isoformat()
+        }, ensure_ascii=False)
+        try:
+            with self._lock, open(self.path, 'a', encoding='utf-8') as f:
+                f.write(line + '\n')
+        except OSError as e:
+            logger.error(f"Failed to record analysis label: {e}")
+
+def load_label_examples(paths: Iterable[str], min_confidence: float = 0.0) -> List[Dict]:
+    """
+    Đọc recorded labels, bỏ dòng lỗi, label của failure response và trùng lặp
+
+    Params:
+        - paths: Các file JSONL của LabelRecorder
+        - min_confidence: Bỏ label có LLM confidence thấp hơn
+    """
+    examples = []
+    seen = set()
+    for path in paths:
+        with open(path, encoding='utf-8') as f:
+            for line in f:
+                try:
+                    example = json.loads(line)
+                    label = example['label']
+                    if label.get('type') not in CONTEXT_TYPES or float(label.get('confidence') or 0.0) <= min_confidence:
+                        continue
+                    key = (example['text'], json.dumps(example.get('history', []), ensure_ascii=False))
+                except (ValueError, KeyError, TypeError):
+                    continue
+                if key in seen:
+                    continue
+                seen.add(key)
+                examples.append(example)
+    return examples
+
+def _stack_rows(rows: List[Tuple[np.ndarray, np.ndarray]]) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Gộp sparse rows thành (indices, values, row_ids)"""
+    indices = np.concatenate([row[0] for row in rows])
+    values = np.concatenate([row[1] for row in rows])
+    row_ids = np.repeat(np.arange(len(rows)), [len(row[0]) for row in rows])
+    return indices, values, row_ids
+
+def _softmax(scores: np.ndarray) -> np.ndarray:
+    exp = np.exp(scores - np.max(scores))
+    return exp / exp.sum()
+
+def _sigmoid(x):
+    return 1.0 / (1.0 + np.exp(-x))
+
+def _binary_cross_entropy(predicted: np.ndarray, target: np.ndarray) -> np.ndarray:
+    predicted = np.clip(predicted, 1e-7, 1 - 1e-7)
+    return -(target * np.log(predicted) + (1 - target) * np.log(1 - predicted))
@@ -0,0 +1,306 @@
+"""
+Mock LLM - Together/OpenAI-compatible stand-in cho development và load testing
+In-process httpx transport + standalone server, configurable latency and errors
+
+Chạy server riêng:
+    python -m src.services.mock_llm --port 8089
+rồi đặt TOGETHER_BASE_URL=http://127.0.0.1:8089/v1 (API key bất kỳ).
+"""
+
+import asyncio
+import hashlib
+import json
+import logging
+import math
+import random
+import re
+import threading
+import time
+import uuid
+from typing import Dict, Iterator, List, Optional, Any
+
+logger = logging.getLogger(__name__)
+
+# Từ khóa dùng để tạo severity giả nhưng nhất quán với nội dung tin nhắn
+SEVERITY_KEYWORDS = [
+    (0.95, 'suicide_risk', ['tự tử', 'muốn chết', 'tự hại', 'kill myself', 'suicide', 'end my life']),
+    (0.75, 'depression_signs', ['tuyệt vọng', 'vô vọng', 'trầm cảm', 'mất hứng thú', 'hopeless', 'depressed']),
+    (0.7, 'clinical_anxiety', ['hoảng loạn', 'lo âu', 'bất an', 'panic', 'anxiety']),
+    (0.6, 'chronic_stress', ['áp lực', 'quá tải', 'kiệt sức', 'overwhelmed', 'burnout']),
+    (0.45, 'situational_stress', ['căng thẳng', 'stress', 'deadline', 'thi cử']),
+    (0.35, 'normal_sadness', ['buồn', 'chán', 'sad']),
+    (0.25, 'normal_worry', ['lo lắng', 'lo', 'worried', 'mệt', 'tired'])
+]
+
+MOCK_REPLIES = [
+    "Cảm ơn bạn đã chia sẻ với tôi. Nghe có vẻ như bạn đang trải qua nhiều điều. Bạn có thể kể thêm về điều khiến bạn cảm thấy như vậy không?",
+    "Tôi hiểu, điều đó chắc hẳn không dễ dàng với bạn. Cảm giác này đã kéo dài bao lâu rồi?",
+    "Tôi đang lắng nghe bạn. Gần đây có điều gì đặc biệt xảy ra khiến bạn cảm thấy như vậy không?",
+    "Bạn đã rất dũng cảm khi nói ra điều này. Những lúc như vậy, điều gì thường giúp bạn cảm thấy dễ chịu hơn?"
+]
+
+class LatencyModel:
+    """
+    Phân phối latency cho mock responses
+
+    - fixed: luôn latency_ms
+    - lognormal: median latency_ms, độ lệch latency_sigma
+    - spike: fixed/lognormal + với xác suất spike_probability thêm spike_ms (tail latency)
+    """
+
+    def __init__(self, settings: Dict, rng: random.Random):
+        self.distribution = settings.get('latency_distribution', 'fixed')
+        self.latency_ms = float(settings.get('latency_ms', 300))
+        self.sigma = float(settings.get('latency_sigma', 0.5))
+        self.spike_probability = float(settings.get('spike_probability', 0.0))
+        self.spike_ms = float(settings.get('spike_ms', 5000))
+        self._rng = rng
+
+    def sample(self) -> float:
+        """Return latency tính bằng giây"""
+        if self.distribution in ('lognormal', 'spike_lognormal'):
+            latency_ms = self._rng.lognormvariate(math.log(max(self.latency_ms, 1.0)), self.sigma)
+        else:
+            latency_ms = self.latency_ms
+
+        if self.spike_probability > 0 and self._rng.random() < self.spike_probability:
+            latency_ms += self.spike_ms
+
+        return latency_ms / 1000.0
+
+class MockLLMBackend:
+    """Tạo response giả theo loại prompt (context analysis / symptom score / chat reply)"""
+
+    def __init__(self, settings: Optional[Dict] = None):
+        self.settings = settings or {}
+        seed = self.settings.get('seed')
+        self._rng = random.Random(seed)
+        self._rng_lock = threading.Lock()
+        self.latency = LatencyModel(self.settings, self._rng)
+        self.error_rate = float(self.settings.get('error_rate', 0.0))
+        self.error_status = int(self.settings.get('error_status', 503))
+        self.tokens_per_second = float(self.settings.get('tokens_per_second', 40))
+        self.stats = {
+            'requests': 0,
+            'stream_requests': 0,
+            'injected_errors': 0
+        }
+
+    def plan_request(self, payload: Dict) -> Dict:
+        """
+        Quyết định latency / lỗi / nội dung cho một request
+
+        Return: {'latency': float, 'error': bool, 'text': str}
+        """
+        with self._rng_lock:
+            self.stats['requests'] += 1
+            if payload.get('stream'):
+                self.stats['stream_requests'] += 1
+            latency = self.latency.sample()
+            error = self.error_rate > 0 and self._rng.random() < self.error_rate
+            if error:
+                self.stats['injected_errors'] += 1
+
+        return {
+            'latency': latency,
+            'error': error,
+            'text': '' if error else self.generate_text(payload.get('messages', []))
+        }
+
+    def generate_text(self, messages: List[Dict]) -> str:
+        """Nội dung response dựa trên loại prompt"""
+        prompt = messages[-1].get('content', '') if messages else ''
+
+        if 'CHỈ TRẢ LỜI JSON' in prompt or '"severity"' in prompt:
+            return json.dumps(self._analyze(self._extract_current_message(prompt)), ensure_ascii=False)
+
+        if 'Return ONLY a JSON object mapping every symptom id' in prompt:
+            score = min(4, int(round(self._analyze(prompt.split('CONVERSATION TEXT:')[-1])['severity'] * 4)))
+            item_ids = re.findall(r'^- (\w+):', prompt, re.MULTILINE)
+            return json.dumps({item_id: score for item_id in item_ids})
+
+        if 'Return ONLY a single number' in prompt:
+            severity = self._analyze(prompt)['severity']
+            return str(min(4, int(round(severity * 4))))
+
+        # Chat reply: chọn theo nội dung để cùng input -> cùng output
+        digest = hashlib.md5(prompt.encode('utf-8')).digest()
+        return MOCK_REPLIES[digest[0] % len(MOCK_REPLIES)]
+
+    def error_body(self) -> Dict:
+        return {'error': {'message': 'Mock LLM injected error', 'type': 'mock_error', 'code': self.error_status}}
+
+    def completion_body(self, payload: Dict, text: str) -> Dict:
+        """OpenAI-compatible chat.completion JSON"""
+        prompt_tokens = sum(estimate_tokens(msg.get('content', '')) for msg in payload.get('messages', []))
+        completion_tokens = estimate_tokens(text)
+        return {
+            'id': f"mock-{uuid.uuid4().hex[:12]}",
+            'object': 'chat.completion',
+            'created': int(time.time()),
+            'model': payload.get('model', 'mock-llm'),
+            'choices': [{
+                'index': 0,
+                'message': {'role': 'assistant', 'content': text},
+                'finish_reason': 'stop'
+            }],
+            'usage': {
+                'prompt_tokens': prompt_tokens,
+                'completion_tokens': completion_tokens,
+                'total_tokens': prompt_tokens + completion_tokens
+            }
+        }
+
+    def stream_chunks(self, payload: Dict, text: str) -> Iterator[str]:
+        """SSE lines cho stream=true (một token mỗi chunk)"""
+        chunk_id = f"mock-{uuid.uuid4().hex[:12]}"
+        for token in split_tokens(text):
+            chunk = {
+                'id': chunk_id,
+                'object': 'chat.completion.chunk',
+                'model': payload.get('model', 'mock-llm'),
+                'choices': [{'index': 0, 'delta': {'content': token}, 'finish_reason': None}]
+            }
+            yield f"data: {json.dumps(chunk, ensure_ascii=False)}\n\n"
+        yield "data: [DONE]\n\n"
+
+    def token_delay(self) -> float:
+        return 1.0 / self.tokens_per_second if self.tokens_per_second > 0 else 0.0
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._rng_lock:
+            return dict(self.stats)
+
+    def _analyze(self, text: str) -> Dict:
+        text_lower = text.lower()
+        for severity, context_type, keywords in SEVERITY_KEYWORDS:
+            if any(keyword in text_lower for keyword in keywords):
+                return {
+                    'severity': severity,
+                    'type': context_type,
+                    'reasoning': 'Mock analysis based on keywords',
+                    'confidence': 0.8
+                }
+        return {
+            'severity': 0.1,
+            'type': 'normal_worry',
+            'reasoning': 'Mock analysis - no concerning signals',
+            'confidence': 0.6
+        }
+
+    @staticmethod
+    def _extract_current_message(prompt: str) -> str:
+        match = re.search(r'TIN NHẮN HIỆN T\w+:\s*"(.*?)"', prompt, re.DOTALL)
+        return match.group(1) if match else prompt
+
+def estimate_tokens(text: str) -> int:
+    """Ước lượng số token (~4 ký tự / token)"""
+    return max(1, len(text or '') // 4)
+
+def split_tokens(text: str) -> List[str]:
+    """Tách text thành các 'token' (từ + khoảng trắng phía sau)"""
+    return re.findall(r'\S+\s*', text) or [text]
+
+def create_mock_transport(settings: Optional[Dict] = None):
+    """
+    httpx.MockTransport cho AsyncTogetherClient - không cần network
+
+    Return: httpx.MockTransport (raise ImportError nếu thiếu httpx)
+    """
+    import httpx
+
+    backend = MockLLMBackend(settings)
+
+    async def handler(request: 'httpx.Request') -> 'httpx.Response':
+        if not request.url.path.endswith('/chat/completions'):
+            return httpx.Response(404, json={'error': {'message': 'Not found'}})
+
+        payload = json.loads(request.content or b'{}')
+        plan = backend.plan_request(payload)
+        await asyncio.sleep(plan['latency'])
+
+        if plan['error']:
+            return httpx.Response(backend.error_status, json=backend.error_body())
+
+        if not payload.get('stream'):
+            return httpx.Response(200, json=backend.completion_body(payload, plan['text']))
+
+        async def stream():
+            delay = backend.token_delay()
+            for line in backend.stream_chunks(payload, plan['text']):
+                yield line.encode('utf-8')
+                if delay:
+                    await asyncio.sleep(delay)
+
+        return httpx.Response(200, content=stream(), headers={'Content-Type': 'text/event-stream'})
+
+    transport = httpx.MockTransport(handler)
+    transport.backend = backend
+    return transport
+
+def create_mock_llm_app(settings: Optional[Dict] = None):
+    """Flask app cho standalone mock server (/v1/chat/completions)"""
+    from flask import Flask, Response, jsonify, request, stream_with_context
+
+    backend = MockLLMBackend(settings)
+    app = Flask(__name__)
+
+    @app.route('/v1/chat/completions', methods=['POST'])
+    def chat_completions():
+        payload = request.get_json(silent=True) or {}
+        plan = backend.plan_request(payload)
+        time.sleep(plan['latency'])
+
+        if plan['error']:
+            return jsonify(backend.error_body()), backend.error_status
+
+        if not payload.get('stream'):
+            return jsonify(backend.completion_body(payload, plan['text']))
+
+        def stream():
+            delay = backend.token_delay()
+            for line in backend.stream_chunks(payload, plan['text']):
+                yield line
+                if delay:
+                    time.sleep(delay)
+
+        return Response(stream_with_context(stream()), mimetype='text/event-stream')
+
+    @app.route('/health', methods=['GET'])
+    def health():
+        return jsonify({'status': 'healthy', 'stats': backend.get_stats()})
+
+    return app
+
+def main() -> None:
+    import argparse
+
+    try:
+        from config import MOCK_LLM_SETTINGS
+        settings = dict(MOCK_LLM_SETTINGS)
+    except ImportError:
+        settings = {}
+
+    parser = argparse.ArgumentParser(description='Local Together/OpenAI-compatible mock LLM server')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8089)
+    parser.add_argument('--latency-distribution', choices=['fixed', 'lognormal', 'spike', 'spike_lognormal'])
+    parser.add_argument('--latency-ms', type=float)
+    parser.add_argument('--error-rate', type=float)
+    parser.add_argument('--tokens-per-second', type=float)
+    args = parser.parse_args()
+
+    overrides = {
+        'latency_distribution': args.latency_distribution,
+        'latency_ms': args.latency_ms,
+        'error_rate': args.error_rate,
+        'tokens_per_second': args.tokens_per_second
+    }
+    settings.update({key: value for key, value in overrides.items() if value is not None})
+
+    logging.basicConfig(level=logging.INFO)
+    logger.info(f"Mock LLM server on http://{args.host}:{args.port}/v1 with {settings}")
+    create_mock_llm_app(settings).run(host=args.host, port=args.port, threaded=True)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,190 @@
+"""
+Questionnaire Registry - Bộ câu hỏi được build một lần khi khởi động
+Pre-serialized JSON payloads with ETags, plus an integrity hash over all questionnaires
+"""
+
+import copy
+import hashlib
+import json
+import logging
+from collections import namedtuple
+from typing import Dict, List, Optional, Any
+
+logger = logging.getLogger(__name__)
+
+# body: JSON bytes đã serialize sẵn, etag: hash của body
+CachedPayload = namedtuple('CachedPayload', ['body', 'etag'])
+
+def serialize_json(data: Any) -> bytes:
+    """Compact UTF-8 JSON (tiếng Việt không bị escape thành \\uXXXX)"""
+    return json.dumps(data, ensure_ascii=False, separators=(',', ':'), sort_keys=True).encode('utf-8')
+
+def splice_json(data: Dict, key: str, raw_json: bytes) -> bytes:
+    """
+    Serialize data rồi thêm field key với giá trị JSON đã serialize sẵn
+
+    Dùng cho response có vài field động (session_id, started_at) quanh một
+    phần lớn tĩnh (questionnaire) - phần tĩnh không bị serialize lại.
+    """
+    head = serialize_json(data)
+    separator = b',' if len(head) > 2 else b''
+    return head[:-1] + separator + serialize_json(key) + b':' + raw_json + b'}'
+
+def _make_payload(data: Any) -> CachedPayload:
+    body = serialize_json(data)
+    return CachedPayload(body, hashlib.sha256(body).hexdigest()[:32])
+
+class QuestionnaireRegistry:
+    """
+    Nguồn duy nhất cho questionnaire data của Assessment API
+
+    Mọi response tĩnh (danh sách loại đánh giá, bộ câu hỏi, từng câu hỏi) được
+    serialize một lần lúc build; request chỉ trả lại bytes có sẵn và ETag.
+    """
+
+    def __init__(self, questionnaires: Dict[str, Dict]):
+        """
+        Params:
+            - questionnaires: {assessment_type: questionnaire} (STANDARD_QUESTIONNAIRES schema)
+        """
+        # Copy để thay đổi sau này ở dict nguồn không làm lệch cached payloads
+        self._questionnaires = copy.deepcopy(questionnaires)
+        self._type_hashes: Dict[str, str] = {}
+        self._questionnaire_payloads: Dict[str, CachedPayload] = {}
+        self._questionnaire_json: Dict[str, bytes] = {}
+        self._first_question_json: Dict[str, bytes] = {}
+        self._question_payloads: Dict[str, List[CachedPayload]] = {}
+
+        for assessment_type, questionnaire in self._questionnaires.items():
+            self._type_hashes[assessment_type] = hashlib.sha256(serialize_json(questionnaire)).hexdigest()
+            self._build_type(assessment_type, questionnaire)
+
+        # Integrity hash: đổi khi bất kỳ questionnaire nào đổi
+        digest = hashlib.sha256()
+        for assessment_type in sorted(self._type_hashes):
+            digest.update(f"{assessment_type}:{self._type_hashes[assessment_type]}\n".encode('utf-8'))
+        self.integrity_hash = digest.hexdigest()
+        self.version = self.integrity_hash[:12]
+
+        self._types_payload = _make_payload({
+            'success': True,
+            'assessment_types': {
+                assessment_type: {
+                    'name': assessment_type.upper(),
+                    'title': questionnaire['title'],
+                    'description': questionnaire['description'],
+                    'question_count': questionnaire['question_count'],
+                    'estimated_time': questionnaire['estimated_time'],
+                    'category': questionnaire['category']
+                }
+                for assessment_type, questionnaire in self._questionnaires.items()
+            },
+            'total_types': len(self._questionnaires),
+            'registry_version': self.version
+        })
+        logger.info(f"Questionnaire registry built: {len(self._questionnaires)} types, version {self.version}")
+
+    def _build_type(self, assessment_type: str, questionnaire: Dict) -> None:
+        questions = questionnaire['questions']
+        summary = {
+            'title': questionnaire['title'],
+            'description': questionnaire['description'],
+            'instructions': questionnaire['instructions'],
+            'question_count': questionnaire['question_count'],
+            'estimated_time': questionnaire['estimated_time'],
+            'questions': questions,
+            'scoring': questionnaire['scoring']
+        }
+        self._questionnaire_json[assessment_type] = serialize_json(summary)
+        self._questionnaire_payloads[assessment_type] = _make_payload({
+            'success': True,
+            'assessment_type': assessment_type,
+            'questionnaire': summary,
+            'registry_version': self._type_hashes[assessment_type][:12]
+        })
+        self._first_question_json[assessment_type] = serialize_json({
+            'index': 0,
+            'total': questionnaire['question_count'],
+            'question': questions[0],
+            'instructions': questionnaire['instructions']
+        }) if questions else b'null'
+        self._question_payloads[assessment_type] = [
+            _make_payload({
+                'success': True,
+                'question': question,
+                'index': index,
+                'total': len(questions),
+                'progress': round((index / len(questions)) * 100, 1)
+            })
+            for index, question in enumerate(questions)
+        ]
+
+    def __contains__(self, assessment_type: str) -> bool:
+        return assessment_type in self._questionnaires
+
+    def types(self) -> List[str]:
+        return list(self._questionnaires)
+
+    def get(self, assessment_type: str) -> Optional[Dict]:
+        """Questionnaire dict (read-only - không sửa kết quả)"""
+        return self._questionnaires.get(assessment_type)
+
+    def types_payload(self) -> CachedPayload:
+        """Response của GET /types"""
+        return self._types_payload
+
+    def questionnaire_payload(self, assessment_type: str) -> Optional[CachedPayload]:
+        """Response của GET /questionnaire/<type>"""
+        return self._questionnaire_payloads.get(assessment_type)
+
+    def question_payload(self, assessment_type: str, index: int) -> Optional[CachedPayload]:
+        """Response của GET /question/<type>/<index>, None nếu index không hợp lệ"""
+        payloads = self._question_payloads.get(assessment_type)
+        if payloads is None or index < 0 or index >= len(payloads):
+            return None
+        return payloads[index]
+
+    def question_count(self, assessment_type: str) -> int:
+        return len(self._question_payloads.get(assessment_type, []))
+
+    def questionnaire_json(self, assessment_type: str) -> bytes:
+        """Phần 'questionnaire' của POST /start (poll mode), đã serialize"""
+        return self._questionnaire_json[assessment_type]
+
+    def first_question_json(self, assessment_type: str) -> bytes:
+        """Phần 'current_question' của POST /start (chat mode), đã serialize"""
+        return self._first_question_json[assessment_type]
+
+    def check_consistency(self, sources: Dict[str, Dict[str, Dict]]) -> List[str]:
+        """
+        So question count / max score với các nguồn questionnaire khác
+
+        Params:
+            - sources: {source_name: {assessment_type: {'question_count', 'max_score'}}}
+
+        Return: Danh sách khác biệt (đã log warning)
+        """
+        issues = []
+        for source_name, source in sources.items():
+            for assessment_type, questionnaire in self._questionnaires.items():
+                expected = source.get(assessment_type)
+                if expected is None:
+                    continue
+                actual = {
+                    'question_count': len(questionnaire['questions']),
+                    'max_score': questionnaire['scoring']['max_score']
+                }
+                for key, value in actual.items():
+                    if expected.get(key) is not None and expected[key] != value:
+                        issues.append(f"{source_name}.{assessment_type}.{key} = {expected[key]}, registry has {value}")
+        for issue in issues:
+            logger.warning(f"Questionnaire source mismatch: {issue}")
+        return issues
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            'types': len(self._questionnaires),
+            'version': self.version,
+            'integrity_hash': self.integrity_hash,
+            'payload_bytes': sum(len(payload.body) for payload in self._questionnaire_payloads.values())
+        }
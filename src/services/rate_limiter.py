@@ -0,0 +1,401 @@
+"""
+LLM Rate Limiter - Token bucket + priority queue trước LLM provider
+Smooths bursts of chat traffic into the provider's rate limit, safety-critical work first
+"""
+
+import asyncio
+import contextvars
+import heapq
+import itertools
+import logging
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Optional, Any
+
+from src.utils.metrics import get_metrics_registry
+
+logger = logging.getLogger(__name__)
+
+try:
+    from config import LLM_RATE_LIMIT_SETTINGS
+except ImportError:
+    LLM_RATE_LIMIT_SETTINGS = {'enabled': False}
+
+# Priority: số nhỏ hơn được phục vụ trước
+PRIORITY_CRITICAL = 0      # Crisis / suicide_risk re-analysis
+PRIORITY_TRANSITION = 1    # Classification cho transition decision
+PRIORITY_INTERACTIVE = 2   # Reply, assessment scoring (mặc định)
+PRIORITY_BACKGROUND = 3    # Follow-up questions, conversation summaries
+
+PRIORITY_NAMES = {
+    PRIORITY_CRITICAL: 'critical',
+    PRIORITY_TRANSITION: 'transition',
+    PRIORITY_INTERACTIVE: 'interactive',
+    PRIORITY_BACKGROUND: 'background'
+}
+
+QUEUE_WAIT_BUCKETS = (0.001, 0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.0, 5.0, 10.0, 30.0)
+
+LLM_QUEUE_WAIT_SECONDS = get_metrics_registry().histogram(
+    'llm_queue_wait_seconds', 'Time LLM calls waited for a rate limit token', ('priority',), QUEUE_WAIT_BUCKETS
+)
+LLM_QUEUE_REJECTIONS = get_metrics_registry().counter(
+    'llm_queue_rejections_total', 'LLM calls dropped by the rate limiter queue', ('priority', 'reason')
+)
+
+class LLMQueueRejected(RuntimeError):
+    """LLM call bị rate limiter từ chối (queue đầy, bị preempt hoặc chờ quá lâu)"""
+
+class MemoryTokenBucket:
+    """Token bucket trong process"""
+
+    name = 'memory'
+
+    def __init__(self, rate: float, burst: int):
+        self.rate = rate
+        self.capacity = float(max(1, burst))
+        self._tokens = self.capacity
+        self._updated_at = time.monotonic()
+        self._lock = threading.Lock()
+
+    def try_take(self) -> float:
+        """
+        Lấy một token
+
+        Return: 0.0 nếu lấy được, ngược lại số giây đến khi có token tiếp theo
+        """
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.capacity, self._tokens + (now - self._updated_at) * self.rate)
+            self._updated_at = now
+            if self._tokens >= 1.0:
+                self._tokens -= 1.0
+                return 0.0
+            return (1.0 - self._tokens) / self.rate
+
+class SQLiteTokenBucket:
+    """
+    Token bucket dùng chung giữa các gunicorn workers (SQLite/WAL)
+
+    Lỗi SQLite thì cho request đi qua (fail open) - limiter không được
+    làm hỏng chat khi file bị khóa quá lâu.
+    """
+
+    name = 'sqlite'
+
+    def __init__(self, path: str, rate: float, burst: int, bucket_name: str = 'together_ai'):
+        self.path = path
+        self.rate = rate
+        self.capacity = float(max(1, burst))
+        self.bucket_name = bucket_name
+        self._local = threading.local()
+
+        directory = os.path.dirname(path)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory, exist_ok=True)
+
+        conn = self._connection()
+        conn.execute(
+            'CREATE TABLE IF NOT EXISTS token_buckets ('
+            'name TEXT PRIMARY KEY, tokens REAL NOT NULL, updated_at REAL NOT NULL)'
+        )
+        conn.execute(
+            'INSERT OR IGNORE INTO token_buckets (name, tokens, updated_at) VALUES (?, ?, ?)',
+            (self.bucket_name, self.capacity, time.time())
+        )
+        conn.commit()
+
+    def _connection(self) -> sqlite3.Connection:
+        """Một connection cho mỗi thread"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=1.0, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+        return conn
+
+    def try_take(self) -> float:
+        try:
+            conn = self._connection()
+            conn.execute('BEGIN IMMEDIATE')
+            try:
+                row = conn.execute(
+                    'SELECT tokens, updated_at FROM token_buckets WHERE name = ?', (self.bucket_name,)
+                ).fetchone()
+                # Wall clock: monotonic clock không so sánh được giữa các process
+                now = time.time()
+                tokens, updated_at = row if row else (self.capacity, now)
+                tokens = min(self.capacity, tokens + max(0.0, now - updated_at) * self.rate)
+                wait = 0.0
+                if tokens >= 1.0:
+                    tokens -= 1.0
+                else:
+                    wait = (1.0 - tokens) / self.rate
+                conn.execute(
+                    'INSERT OR REPLACE INTO token_buckets (name, tokens, updated_at) VALUES (?, ?, ?)',
+                    (self.bucket_name, tokens, now)
+                )
+                conn.execute('COMMIT')
+                return wait
+            except Exception:
+                conn.execute('ROLLBACK')
+                raise
+        except Exception as e:
+            logger.error(f"Shared rate limit bucket error, allowing request: {e}")
+            return 0.0
+
+class _Waiter:
+    """Một LLM call đang chờ token (sync: threading.Event, async: asyncio.Future)"""
+
+    __slots__ = ('priority', 'seq', 'enqueued_at', 'granted', 'rejected', 'event', 'future', 'loop')
+
+    def __init__(self, priority: int, seq: int, loop: Optional[asyncio.AbstractEventLoop] = None):
+        self.priority = priority
+        self.seq = seq
+        self.enqueued_at = time.monotonic()
+        self.granted = False
+        self.rejected: Optional[str] = None
+        self.loop = loop
+        self.event = None if loop else threading.Event()
+        self.future = loop.create_future() if loop else None
+
+    @property
+    def done(self) -> bool:
+        return self.granted or self.rejected is not None
+
+    def wake(self) -> None:
+        if self.loop is None:
+            self.event.set()
+        else:
+            self.loop.call_soon_threadsafe(self._resolve)
+
+    def _resolve(self) -> None:
+        if not self.future.done():
+            self.future.set_result(None)
+
+class LLMRateLimiter:
+    """
+    Token bucket + bounded priority queue cho mọi LLM call
+
+    Call được phục vụ ngay khi bucket còn token và không ai đang chờ; ngược
+    lại vào queue theo priority (FIFO trong cùng priority). Queue đầy thì call
+    mới đẩy call có priority thấp nhất ra ngoài (preempt) hoặc bị từ chối.
+    Call bị từ chối / chờ quá lâu được xử lý như khi circuit open (fallback).
+    """
+
+    def __init__(self, settings: Optional[Dict] = None):
+        settings = settings or {}
+        self.enabled = settings.get('enabled', True)
+        self.rate = float(settings.get('requests_per_second', 8.0))
+        self.burst = int(settings.get('burst', 16))
+        self.max_queue = int(settings.get('max_queue', 100))
+        self.max_wait_seconds = float(settings.get('max_wait_seconds', 10.0))
+
+        if settings.get('backend', 'memory') == 'sqlite':
+            self.bucket = SQLiteTokenBucket(settings.get('path', 'cache/llm_rate_limit.sqlite3'), self.rate, self.burst)
+        else:
+            self.bucket = MemoryTokenBucket(self.rate, self.burst)
+
+        self._heap: List = []
+        self._seq = itertools.count()
+        self._queued = 0
+        self._lock = threading.Lock()
+        self.stats = {
+            'admitted': 0,
+            'queued': 0,
+            'rejected_full': 0,
+            'preempted': 0,
+            'timeouts': 0
+        }
+
+    def _enqueue(self, waiter: _Waiter) -> bool:
+        """Thêm waiter vào queue, preempt waiter priority thấp nhất nếu queue đầy"""
+        victim = None
+        with self._lock:
+            if self._queued >= self.max_queue:
+                candidates = [entry[2] for entry in self._heap if not entry[2].done]
+                lowest = max(candidates, key=lambda w: (w.priority, w.seq), default=None)
+                if lowest is None or lowest.priority <= waiter.priority:
+                    self.stats['rejected_full'] += 1
+                    waiter.rejected = 'queue_full'
+                    return False
+                lowest.rejected = 'preempted'
+                self._queued -= 1
+                self.stats['preempted'] += 1
+                victim = lowest
+            heapq.heappush(self._heap, (waiter.priority, waiter.seq, waiter))
+            self._queued += 1
+            self.stats['queued'] += 1
+        if victim is not None:
+            victim.wake()
+        return True
+
+    def _dispatch(self) -> float:
+        """
+        Cấp token cho các waiter theo thứ tự priority
+
+        Return: Số giây đến token tiếp theo nếu còn waiter, 0.0 nếu queue rỗng
+        """
+        woken = []
+        wait = 0.0
+        with self._lock:
+            while self._heap:
+                waiter = self._heap[0][2]
+                if waiter.done:
+                    heapq.heappop(self._heap)
+                    continue
+                wait = self.bucket.try_take()
+                if wait > 0:
+                    break
+                heapq.heappop(self._heap)
+                waiter.granted = True
+                self._queued -= 1
+                woken.append(waiter)
+        for waiter in woken:
+            waiter.wake()
+        return wait
+
+    def _try_fast_path(self) -> bool:
+        """Không ai chờ và bucket còn token - đi luôn"""
+        with self._lock:
+            if self._queued == 0 and self.bucket.try_take() == 0.0:
+                self.stats['admitted'] += 1
+                return True
+        return False
+
+    def _give_up(self, waiter: _Waiter, reason: str) -> None:
+        with self._lock:
+            if waiter.done:
+                return
+            waiter.rejected = reason
+            self._queued -= 1
+            if reason == 'timeout':
+                self.stats['timeouts'] += 1
+
+    def _finish(self, waiter: _Waiter) -> bool:
+        name = PRIORITY_NAMES.get(waiter.priority, str(waiter.priority))
+        if waiter.granted:
+            with self._lock:
+                self.stats['admitted'] += 1
+            LLM_QUEUE_WAIT_SECONDS.observe(time.monotonic() - waiter.enqueued_at, priority=name)
+            return True
+        LLM_QUEUE_REJECTIONS.inc(priority=name, reason=waiter.rejected or 'unknown')
+        logger.warning(f"LLM call dropped by rate limiter ({waiter.rejected}, priority={name})")
+        return False
+
+    def _max_wait(self, timeout: Optional[float]) -> float:
+        return self.max_wait_seconds if timeout is None else min(self.max_wait_seconds, float(timeout))
+
+    def acquire(self, priority: int = PRIORITY_INTERACTIVE, timeout: Optional[float] = None) -> bool:
+        """
+        Chờ token (blocking, dùng cho SDK path)
+
+        Params:
+            - priority: PRIORITY_* của call
+            - timeout: Thời gian chờ tối đa (thường là timeout của LLM call)
+
+        Return: False nếu bị từ chối (queue đầy / preempted / chờ quá lâu)
+        """
+        if not self.enabled or self._try_fast_path():
+            return True
+
+        waiter = _Waiter(priority, next(self._seq))
+        if self._enqueue(waiter):
+            expires_at = waiter.enqueued_at + self._max_wait(timeout)
+            while True:
+                wait = self._dispatch()
+                if waiter.done:
+                    break
+                remaining = expires_at - time.monotonic()
+                if remaining <= 0:
+                    self._give_up(waiter, 'timeout')
+                    break
+                waiter.event.wait(min(wait, remaining) if wait > 0 else remaining)
+        return self._finish(waiter)
+
+    async def acquire_async(self, priority: int = PRIORITY_INTERACTIVE, timeout: Optional[float] = None) -> bool:
+        """Async version của acquire (background event loop của together_client)"""
+        if not self.enabled or self._try_fast_path():
+            return True
+
+        waiter = _Waiter(priority, next(self._seq), loop=asyncio.get_running_loop())
+        if self._enqueue(waiter):
+            expires_at = waiter.enqueued_at + self._max_wait(timeout)
+            try:
+                while True:
+                    wait = self._dispatch()
+                    if waiter.done:
+                        break
+                    remaining = expires_at - time.monotonic()
+                    if remaining <= 0:
+                        self._give_up(waiter, 'timeout')
+                        break
+                    await asyncio.wait({waiter.future}, timeout=min(wait, remaining) if wait > 0 else remaining)
+                    if waiter.future.done():
+                        waiter.future = waiter.loop.create_future()
+            except asyncio.CancelledError:
+                self._give_up(waiter, 'cancelled')
+                raise
+        return self._finish(waiter)
+
+    def queue_depth(self) -> Dict[str, int]:
+        """Số call đang chờ theo priority"""
+        depth = {name: 0 for name in PRIORITY_NAMES.values()}
+        with self._lock:
+            for _, _, waiter in self._heap:
+                if not waiter.done:
+                    name = PRIORITY_NAMES.get(waiter.priority, str(waiter.priority))
+                    depth[name] = depth.get(name, 0) + 1
+        return depth
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            stats = dict(self.stats)
+            stats['waiting'] = self._queued
+        stats.update({
+            'enabled': self.enabled,
+            'backend': self.bucket.name,
+            'requests_per_second': self.rate,
+            'burst': self.burst,
+            'max_queue': self.max_queue
+        })
+        return stats
+
+# Priority của LLM calls trong thread / task hiện tại
+_current_priority: contextvars.ContextVar = contextvars.ContextVar('llm_priority', default=None)
+
+@contextmanager
+def llm_priority_scope(priority: int) -> Iterator[int]:
+    """Đặt priority cho mọi LLM call bên trong block"""
+    token = _current_priority.set(priority)
+    try:
+        yield priority
+    finally:
+        _current_priority.reset(token)
+
+def get_current_priority() -> int:
+    """Priority hiện tại (mặc định PRIORITY_INTERACTIVE)"""
+    priority = _current_priority.get()
+    return PRIORITY_INTERACTIVE if priority is None else priority
+
+# Global instance
+_rate_limiter = None
+_limiter_lock = threading.Lock()
+
+def get_llm_rate_limiter() -> LLMRateLimiter:
+    """Lazy global limiter từ LLM_RATE_LIMIT_SETTINGS"""
+    global _rate_limiter
+
+    if _rate_limiter is None:
+        with _limiter_lock:
+            if _rate_limiter is None:
+                _rate_limiter = LLMRateLimiter(LLM_RATE_LIMIT_SETTINGS)
+    return _rate_limiter
+
+def get_rate_limiter_stats() -> Dict[str, Any]:
+    """Convenience function for health endpoints"""
+    return get_llm_rate_limiter().get_stats()
@@ -3,16 +3,85 @@ Together AI Client - Service for interacting with Together AI API
 Compatible with new AI-powered transition logic
 """
 
+import asyncio
+import concurrent.futures
+import hashlib
+import importlib.util
+import json
 import logging
-from typing import Dict, List, Optional, Any
+import queue
+import threading
+import time
+import weakref
+from types import SimpleNamespace
+from typing import Dict, List, Optional, Any, AsyncIterator, Iterator
 import os
 
+from src.services.circuit_breaker import CircuitOpenError, create_circuit_breaker
+from src.utils.deadline import clamp_timeout
+from src.utils.metrics import get_metrics_registry, record_llm_request
+from src.services.usage_ledger import SessionBudgetExceeded, get_usage_ledger, get_current_session_id
+from src.services.rate_limiter import LLMQueueRejected, get_llm_rate_limiter, get_current_priority
+from src.services.hedging import get_hedging_policy
+
 logger = logging.getLogger(__name__)
 
+try:
+    import httpx
+    HTTPX_AVAILABLE = True
+except ImportError:
+    httpx = None
+    HTTPX_AVAILABLE = False
+
+try:
+    from config import (
+        AI_ANALYSIS_SETTINGS, LLM_CLIENT_SETTINGS, CIRCUIT_BREAKER_SETTINGS,
+        DEVELOPMENT_SETTINGS, MOCK_LLM_SETTINGS
+    )
+except ImportError:
+    AI_ANALYSIS_SETTINGS = {'timeout_seconds': 30}
+    CIRCUIT_BREAKER_SETTINGS = {}
+    DEVELOPMENT_SETTINGS = {'mock_ai_responses': False}
+    MOCK_LLM_SETTINGS = {}
+    LLM_CLIENT_SETTINGS = {
+        'base_url': 'https://api.together.xyz/v1',
+        'use_async_transport': True,
+        'max_connections': 20,
+        'max_keepalive_connections': 10,
+        'keepalive_expiry': 30.0,
+        'connect_timeout': 5.0,
+        'coalesce_identical_requests': True
+    }
+
 # Global client instance
 _together_client = None
 _client_initialized = False
 
+# Async clients (một connection pool cho mỗi event loop) + background event loop
+_async_clients = weakref.WeakKeyDictionary()
+_async_client_lock = threading.Lock()
+_loop_runner = None
+_loop_runner_lock = threading.Lock()
+
+# Circuit breaker dùng chung cho mọi LLM call
+_circuit_breaker = create_circuit_breaker(CIRCUIT_BREAKER_SETTINGS)
+
+# Số LLM call thực sự gửi đi (benchmarks / monitoring)
+_call_stats = {'calls': 0, 'failures': 0}
+_call_stats_lock = threading.Lock()
+
+# Single-flight: request giống hệt nhau đang chạy trên cùng event loop dùng chung một task
+_inflight_calls = weakref.WeakKeyDictionary()
+_coalesce_stats = {'requests': 0, 'coalesced': 0}
+
+LLM_COALESCED = get_metrics_registry().counter(
+    'llm_coalesced_requests_total', 'LLM requests served by an identical in-flight request', ('caller',)
+)
+
+# Background warm-up (không chặn import / app creation)
+_warmup_state = {'status': 'pending', 'error': None, 'http_status': None, 'duration_ms': None, 'finished_at': None}
+_warmup_lock = threading.Lock()
+
 def get_together_client():
     """
     Get Together AI client instance
@@ -30,15 +99,7 @@ def get_together_client():
         from together import Together
         
         # Get API key from environment or config
-        api_key = os.getenv('TOGETHER_API_KEY')
-        if not api_key:
-            try:
-                from config import TOGETHER_API_KEY
-                api_key = TOGETHER_API_KEY
-            except ImportError:
-                logger.error("Together API key not found in environment or config")
-                return None
-        
+        api_key = _resolve_api_key()
         if not api_key:
             logger.error("Together API key is empty")
             return None
@@ -57,6 +118,711 @@ def get_together_client():
         logger.error(f"Failed to initialize Together AI client: {e}")
         return None
 
+def _resolve_api_key() -> Optional[str]:
+    """Get API key from environment or config"""
+    api_key = os.getenv('TOGETHER_API_KEY')
+    if not api_key:
+        try:
+            from config import TOGETHER_API_KEY
+            api_key = TOGETHER_API_KEY
+        except ImportError:
+            logger.error("Together API key not found in environment or config")
+            return None
+    return api_key
+
+def _default_model() -> str:
+    return os.getenv('TOGETHER_MODEL', 'meta-llama/Llama-3.3-70B-Instruct-Turbo-Free')
+
+def _to_namespace(data: Any) -> Any:
+    """Convert JSON response to attribute access giống SDK (response.choices[0].message.content)"""
+    if isinstance(data, dict):
+        return SimpleNamespace(**{key: _to_namespace(value) for key, value in data.items()})
+    if isinstance(data, list):
+        return [_to_namespace(item) for item in data]
+    return data
+
+class AsyncTogetherClient:
+    """
+    Asyncio client cho Together OpenAI-compatible REST API
+    
+    Dùng một httpx.AsyncClient với connection pool giới hạn và HTTP keep-alive,
+    nên nhiều conversation đồng thời dùng chung một số ít connection.
+    """
+    
+    def __init__(self, api_key: str, settings: Optional[Dict] = None, transport: Any = None):
+        self.settings = settings or LLM_CLIENT_SETTINGS
+        self.base_url = self.settings['base_url'].rstrip('/')
+        self.default_timeout = float(AI_ANALYSIS_SETTINGS.get('timeout_seconds', 30))
+        
+        limits = httpx.Limits(
+            max_connections=self.settings['max_connections'],
+            max_keepalive_connections=self.settings['max_keepalive_connections'],
+            keepalive_expiry=self.settings['keepalive_expiry']
+        )
+        self._http = httpx.AsyncClient(
+            base_url=self.base_url,
+            headers={
+                'Authorization': f'Bearer {api_key}',
+                'Content-Type': 'application/json'
+            },
+            limits=limits,
+            timeout=httpx.Timeout(self.default_timeout, connect=self.settings['connect_timeout']),
+            transport=transport
+        )
+    
+    async def chat_completion(self, payload: Dict, timeout: Optional[float] = None) -> Any:
+        """
+        POST /chat/completions
+        
+        Args:
+            payload: Request body (model, messages, max_tokens, ...)
+            timeout: Per-call timeout in seconds (mặc định AI_ANALYSIS_SETTINGS['timeout_seconds'])
+            
+        Returns:
+            Response với attribute access giống SDK
+        """
+        request_timeout = httpx.Timeout(timeout or self.default_timeout, connect=self.settings['connect_timeout'])
+        response = await self._http.post('/chat/completions', json=payload, timeout=request_timeout)
+        response.raise_for_status()
+        return _to_namespace(response.json())
+    
+    async def stream_chat_completion(self, payload: Dict, timeout: Optional[float] = None) -> AsyncIterator[str]:
+        """
+        POST /chat/completions với stream=true
+        
+        Yields:
+            Text delta của từng SSE chunk
+        """
+        request_timeout = httpx.Timeout(timeout or self.default_timeout, connect=self.settings['connect_timeout'])
+        body = dict(payload, stream=True)
+        
+        async with self._http.stream('POST', '/chat/completions', json=body, timeout=request_timeout) as response:
+            response.raise_for_status()
+            async for line in response.aiter_lines():
+                if not line.startswith('data:'):
+                    continue
+                data = line[len('data:'):].strip()
+                if data == '[DONE]':
+                    break
+                
+                chunk = json.loads(data)
+                choices = chunk.get('choices') or []
+                if not choices:
+                    continue
+                delta = choices[0].get('delta') or {}
+                text = delta.get('content') or choices[0].get('text')
+                if text:
+                    yield text
+    
+    async def warm_up(self, timeout: float = 5.0) -> int:
+        """
+        GET /models để mở sẵn connection (DNS + TLS) trong pool, không tốn token
+        
+        Returns:
+            HTTP status code (mọi response đều nghĩa là connection đã sẵn sàng)
+        """
+        response = await self._http.get('/models', timeout=httpx.Timeout(timeout, connect=timeout))
+        return response.status_code
+    
+    async def aclose(self) -> None:
+        await self._http.aclose()
+
+class _EventLoopRunner:
+    """Background event loop thread - sync code submit coroutine vào đây"""
+    
+    def __init__(self):
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self._run, name='llm-event-loop', daemon=True)
+        self.thread.start()
+    
+    def _run(self):
+        asyncio.set_event_loop(self.loop)
+        self.loop.run_forever()
+    
+    def submit(self, coro) -> 'concurrent.futures.Future':
+        return asyncio.run_coroutine_threadsafe(coro, self.loop)
+    
+    def run(self, coro, timeout: Optional[float] = None) -> Any:
+        future = self.submit(coro)
+        try:
+            return future.result(timeout=timeout)
+        except Exception:
+            future.cancel()
+            raise
+
+def _get_loop_runner() -> _EventLoopRunner:
+    global _loop_runner
+    
+    if _loop_runner is None:
+        with _loop_runner_lock:
+            if _loop_runner is None:
+                _loop_runner = _EventLoopRunner()
+    return _loop_runner
+
+def run_sync(coro, timeout: Optional[float] = None) -> Any:
+    """
+    Chạy coroutine trên background event loop và chờ kết quả
+    
+    Sync facade cho Flask worker threads: I/O được multiplex trên một loop với
+    pooled connections, caller chỉ block trên future.
+    """
+    return _get_loop_runner().run(coro, timeout=timeout)
+
+def is_llm_configured() -> bool:
+    """
+    True nếu có transport để gọi LLM (mock, httpx + API key, hoặc SDK + API key)
+    
+    Chỉ kiểm tra cấu hình - không tạo client và không gửi request.
+    """
+    if async_transport_available():
+        return True
+    return bool(_resolve_api_key()) and importlib.util.find_spec('together') is not None
+
+def start_llm_warmup(timeout: float = 5.0) -> bool:
+    """
+    Warm-up LLM connection pool trên background event loop
+    
+    Tạo pooled async client và mở sẵn connection tới provider. Không block
+    caller; kết quả xem qua get_llm_warmup_status() (readiness endpoint).
+    
+    Args:
+        timeout: Timeout của warm-up request
+        
+    Returns:
+        True nếu warm-up được bắt đầu (False nếu đã chạy hoặc không có async transport)
+    """
+    with _warmup_lock:
+        if _warmup_state['status'] != 'pending':
+            return False
+        if not async_transport_available():
+            _warmup_state.update(status='skipped', finished_at=time.time())
+            return False
+        _warmup_state['status'] = 'running'
+    
+    async def warm_up():
+        started = time.perf_counter()
+        try:
+            status_code = await get_async_client().warm_up(timeout)
+            _finish_warmup('ready', started, http_status=status_code)
+        except Exception as e:
+            error = str(e) or type(e).__name__
+            logger.warning(f"LLM warm-up failed: {error}")
+            _finish_warmup('failed', started, error=error)
+    
+    _get_loop_runner().submit(warm_up())
+    return True
+
+def _finish_warmup(status: str, started: float, **fields) -> None:
+    with _warmup_lock:
+        _warmup_state.update(
+            status=status,
+            duration_ms=round((time.perf_counter() - started) * 1000, 1),
+            finished_at=time.time(),
+            **fields
+        )
+
+def get_llm_warmup_status() -> Dict[str, Any]:
+    """pending | running | ready | failed | skipped, kèm error / duration"""
+    with _warmup_lock:
+        return dict(_warmup_state)
+
+def is_mock_llm_enabled() -> bool:
+    """True khi DEVELOPMENT_SETTINGS['mock_ai_responses'] bật (in-process mock transport)"""
+    return bool(DEVELOPMENT_SETTINGS.get('mock_ai_responses', False)) and HTTPX_AVAILABLE
+
+def async_transport_available() -> bool:
+    """True nếu có thể dùng pooled async transport (httpx + API key, hoặc mock mode)"""
+    if is_mock_llm_enabled():
+        return True
+    return (HTTPX_AVAILABLE and LLM_CLIENT_SETTINGS.get('use_async_transport', True)
+            and bool(_resolve_api_key()))
+
+def get_async_client() -> Optional[AsyncTogetherClient]:
+    """
+    Get pooled async client cho event loop đang chạy
+    
+    httpx connections gắn với event loop tạo ra chúng, nên mỗi loop có một
+    pool riêng. Sync facade luôn dùng background loop nên chỉ có một pool.
+    
+    Returns:
+        AsyncTogetherClient or None if httpx / API key not available
+    """
+    if not async_transport_available():
+        return None
+    
+    loop = asyncio.get_running_loop()
+    client = _async_clients.get(loop)
+    if client is None:
+        with _async_client_lock:
+            client = _async_clients.get(loop)
+            if client is None:
+                if is_mock_llm_enabled():
+                    from src.services.mock_llm import create_mock_transport
+                    client = AsyncTogetherClient('mock-key', transport=create_mock_transport(MOCK_LLM_SETTINGS))
+                    logger.info("Async Together AI client using in-process mock LLM")
+                else:
+                    client = AsyncTogetherClient(_resolve_api_key())
+                    logger.info("Async Together AI client initialized "
+                                f"(max_connections={LLM_CLIENT_SETTINGS['max_connections']})")
+                _async_clients[loop] = client
+    return client
+
+def _build_completion_params(messages: List[Dict], model: Optional[str], max_tokens: Optional[int],
+                             temperature: Optional[float], **kwargs) -> Dict:
+    """Prepare API parameters với defaults từ environment"""
+    if model is None:
+        model = _default_model()
+    if max_tokens is None:
+        max_tokens = int(os.getenv('AI_MAX_TOKENS', '200'))
+    if temperature is None:
+        temperature = float(os.getenv('AI_TEMPERATURE', '0.7'))
+    
+    params = {
+        'model': model,
+        'messages': messages,
+        'max_tokens': max_tokens,
+        'temperature': temperature
+    }
+    params.update(kwargs)
+    return params
+
+def _resolve_timeout(timeout: Optional[float] = None) -> float:
+    """Timeout mặc định từ config, giới hạn bởi deadline của request hiện tại"""
+    return clamp_timeout(timeout or AI_ANALYSIS_SETTINGS.get('timeout_seconds', 30))
+
+def _usage_tokens(response: Any) -> tuple:
+    """(prompt_tokens, completion_tokens) từ response.usage, (0, 0) nếu không có"""
+    usage = getattr(response, 'usage', None)
+    if usage is None:
+        return 0, 0
+    return int(getattr(usage, 'prompt_tokens', 0) or 0), int(getattr(usage, 'completion_tokens', 0) or 0)
+
+def _admit_call(session_id: Optional[str], caller: Optional[str],
+                priority: Optional[int] = None, timeout: Optional[float] = None) -> Optional[str]:
+    """
+    Kiểm tra ngân sách session, rate limiter rồi circuit breaker trước khi gửi LLM call
+    
+    Params:
+        - priority: PRIORITY_* của call (mặc định llm_priority_scope hiện tại)
+        - timeout: Thời gian chờ tối đa trong rate limit queue
+    
+    Return: None nếu được gửi, 'budget' / 'rate_limit' / 'circuit' nếu bị từ chối
+    """
+    ledger = get_usage_ledger()
+    if not ledger.try_reserve(session_id, caller):
+        return 'budget'
+    # Circuit open thì không chờ token vô ích
+    if not _circuit_breaker.is_available():
+        ledger.refund(session_id, caller)
+        return 'circuit'
+    if not get_llm_rate_limiter().acquire(get_current_priority() if priority is None else priority, timeout):
+        ledger.refund(session_id, caller)
+        return 'rate_limit'
+    if not _circuit_breaker.allow_request():
+        ledger.refund(session_id, caller)
+        return 'circuit'
+    return None
+
+async def _aadmit_call(session_id: Optional[str], caller: Optional[str],
+                       priority: Optional[int] = None, timeout: Optional[float] = None) -> Optional[str]:
+    """Async version của _admit_call (chờ token không block background loop)"""
+    ledger = get_usage_ledger()
+    if not ledger.try_reserve(session_id, caller):
+        return 'budget'
+    if not _circuit_breaker.is_available():
+        ledger.refund(session_id, caller)
+        return 'circuit'
+    try:
+        admitted = await get_llm_rate_limiter().acquire_async(
+            get_current_priority() if priority is None else priority, timeout
+        )
+    except asyncio.CancelledError:
+        ledger.refund(session_id, caller)
+        raise
+    if not admitted:
+        ledger.refund(session_id, caller)
+        return 'rate_limit'
+    if not _circuit_breaker.allow_request():
+        ledger.refund(session_id, caller)
+        return 'circuit'
+    return None
+
+def _remaining_timeout(timeout: Optional[float], queued_at: float) -> Optional[float]:
+    """Phần timeout còn lại sau khi chờ trong rate limit queue"""
+    if timeout is None:
+        return None
+    return max(0.001, timeout - (time.perf_counter() - queued_at))
+
+def _record_call(success: bool, started: float, caller: Optional[str] = None,
+                 response: Any = None, completion_tokens: int = 0, session_id: Optional[str] = None) -> None:
+    """
+    Ghi kết quả + latency của một LLM call vào circuit breaker, metrics và usage ledger
+    
+    Params:
+        - caller: Component gọi LLM (label của /metrics)
+        - response: Completion response (token usage)
+        - completion_tokens: Số chunk đã stream (stream không có usage)
+        - session_id: Session bị tính token
+    """
+    latency = time.perf_counter() - started
+    with _call_stats_lock:
+        _call_stats['calls'] += 1
+        if not success:
+            _call_stats['failures'] += 1
+    prompt_tokens, usage_completion = _usage_tokens(response)
+    record_llm_request(caller, success, latency, prompt_tokens, usage_completion or completion_tokens)
+    get_usage_ledger().record_tokens(session_id, prompt_tokens, usage_completion or completion_tokens)
+    if success:
+        _circuit_breaker.record_success(latency)
+    else:
+        _circuit_breaker.record_failure(latency)
+
+def get_llm_call_stats() -> Dict[str, int]:
+    """Tổng số LLM call đã hoàn thành (kể cả lỗi) từ khi process start"""
+    with _call_stats_lock:
+        return dict(_call_stats)
+
+def get_circuit_breaker():
+    """Circuit breaker của Together AI backend"""
+    return _circuit_breaker
+
+def is_llm_available() -> bool:
+    """False khi circuit open - caller nên dùng rule-based path ngay"""
+    return _circuit_breaker.is_available()
+
+def get_circuit_breaker_stats() -> Dict[str, Any]:
+    """Circuit state cho health endpoints"""
+    return _circuit_breaker.get_stats()
+
+class _InflightCall:
+    """Một LLM request đang chạy và số caller đang chờ kết quả của nó"""
+    
+    __slots__ = ('task', 'waiters')
+    
+    def __init__(self, task: 'asyncio.Task'):
+        self.task = task
+        self.waiters = 0
+
+def _request_key(params: Dict) -> str:
+    """Hash của (model, messages, params) - request giống hệt nhau có cùng key"""
+    payload = json.dumps(params, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+async def _single_flight(params: Dict, caller: Optional[str], start_call) -> Optional[Any]:
+    """
+    Chạy start_call() một lần cho mọi request giống hệt nhau đang in-flight
+    
+    Caller đến sau chờ cùng task (không tốn thêm budget / rate limit token).
+    Task chỉ bị hủy khi caller cuối cùng bỏ đi, nên một speculative reply bị
+    hủy không làm hỏng request của caller khác.
+    
+    Params:
+        - params: Completion params (dùng làm key)
+        - caller: Component gọi LLM (label của /metrics)
+        - start_call: Coroutine function gửi request thật
+    """
+    calls = _inflight_calls.setdefault(asyncio.get_running_loop(), {})
+    key = _request_key(params)
+    call = calls.get(key)
+    
+    with _call_stats_lock:
+        _coalesce_stats['requests'] += 1
+        if call is not None:
+            _coalesce_stats['coalesced'] += 1
+    
+    if call is None:
+        call = _InflightCall(asyncio.ensure_future(start_call()))
+        calls[key] = call
+        call.task.add_done_callback(lambda _task: calls.pop(key, None) if calls.get(key) is call else None)
+    else:
+        LLM_COALESCED.inc(caller=caller or 'unknown')
+        logger.debug(f"Coalesced identical LLM request ({caller or 'unknown'})")
+    
+    call.waiters += 1
+    try:
+        return await asyncio.shield(call.task)
+    finally:
+        call.waiters -= 1
+        if call.waiters == 0 and not call.task.done():
+            call.task.cancel()
+
+def get_coalescing_stats() -> Dict[str, Any]:
+    """Số request đã được gộp vào request giống hệt đang in-flight"""
+    with _call_stats_lock:
+        stats = dict(_coalesce_stats)
+    stats['in_flight'] = sum(len(calls) for calls in list(_inflight_calls.values()))
+    stats['enabled'] = LLM_CLIENT_SETTINGS.get('coalesce_identical_requests', True)
+    return stats
+
+def _sdk_chat_completion(params: Dict) -> Optional[Any]:
+    """Synchronous SDK call (fallback khi không có async transport)"""
+    client = get_together_client()
+    if not client:
+        logger.error("Together AI client not available")
+        return None
+    return client.chat.completions.create(**params)
+
+async def agenerate_chat_completion(
+    messages: List[Dict],
+    model: Optional[str] = None,
+    max_tokens: Optional[int] = None,
+    temperature: Optional[float] = None,
+    timeout: Optional[float] = None,
+    caller: Optional[str] = None,
+    session_id: Optional[str] = None,
+    priority: Optional[int] = None,
+    **kwargs
+) -> Optional[Any]:
+    """
+    Async chat completion qua pooled keep-alive client
+    
+    Args:
+        messages: List of conversation messages
+        model: Model to use (defaults from config)
+        max_tokens: Maximum tokens to generate
+        temperature: Sampling temperature
+        timeout: Per-call timeout (mặc định AI_ANALYSIS_SETTINGS['timeout_seconds'])
+        caller: Component gọi LLM, dùng làm label trong /metrics
+        session_id: Session bị tính ngân sách (mặc định session_budget_scope hiện tại)
+        priority: Priority trong rate limit queue (mặc định llm_priority_scope hiện tại)
+        **kwargs: Additional parameters
+        
+    Returns:
+        API response or None if failed (kể cả khi session hết ngân sách / bị rate limit)
+    """
+    params = _build_completion_params(messages, model, max_tokens, temperature, **kwargs)
+    if session_id is None:
+        session_id = get_current_session_id()
+    
+    async def send():
+        return await _agenerate_hedged(params, timeout, caller, session_id, priority)
+    
+    if LLM_CLIENT_SETTINGS.get('coalesce_identical_requests', True):
+        return await _single_flight(params, caller, send)
+    return await send()
+
+async def _agenerate_hedged(params: Dict, timeout: Optional[float], caller: Optional[str],
+                            session_id: Optional[str], priority: Optional[int]) -> Optional[Any]:
+    """
+    Gửi request; nếu chạy lâu hơn rolling p95 của caller thì gửi thêm một bản giống hệt
+    
+    Response không None về trước được dùng, request còn lại bị hủy. Hedge đi qua
+    admission như request thường (tính budget + rate limit token) và bị giới hạn
+    bởi LLM_HEDGING_SETTINGS['max_hedge_ratio'].
+    """
+    policy = get_hedging_policy()
+    if not policy.enabled:
+        return await _agenerate_once(params, timeout, caller, session_id, priority)
+    
+    delay = policy.hedge_delay(caller)
+    started = time.perf_counter()
+    primary = asyncio.ensure_future(_agenerate_once(params, timeout, caller, session_id, priority))
+    attempts = {primary: started}
+    try:
+        if delay is not None:
+            await asyncio.wait({primary}, timeout=delay)
+            if not primary.done() and policy.try_hedge(caller):
+                logger.debug(f"Hedging slow LLM request ({caller or 'unknown'}) after {delay:.3f}s")
+                hedge = asyncio.ensure_future(
+                    _agenerate_once(params, _remaining_timeout(timeout, started), caller, session_id, priority)
+                )
+                attempts[hedge] = time.perf_counter()
+        
+        winner = None
+        pending = set(attempts)
+        while pending and winner is None:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if not task.cancelled() and task.exception() is None and task.result() is not None:
+                    winner = winner or task
+        
+        if winner is None:
+            # Cả hai đều lỗi - trả về kết quả (hoặc exception) của request gốc
+            return primary.result()
+        
+        policy.record_latency(caller, time.perf_counter() - attempts[winner])
+        if len(attempts) > 1:
+            policy.record_outcome(caller, hedge_won=winner is not primary)
+        return winner.result()
+    finally:
+        for task in attempts:
+            if not task.done():
+                task.cancel()
+
+async def _agenerate_once(params: Dict, timeout: Optional[float], caller: Optional[str],
+                          session_id: Optional[str], priority: Optional[int]) -> Optional[Any]:
+    """Một LLM request thật: admission (budget, rate limit, circuit) rồi gửi qua pooled client"""
+    queued_at = time.perf_counter()
+    rejected = await _aadmit_call(session_id, caller, priority, timeout)
+    if rejected:
+        logger.debug(f"Together AI request skipped ({rejected})")
+        return None
+    timeout = _remaining_timeout(timeout, queued_at)
+    
+    started = time.perf_counter()
+    try:
+        client = get_async_client()
+        if client is None:
+            # Không có httpx - chạy SDK call trong thread pool của loop
+            response = await asyncio.wait_for(
+                asyncio.to_thread(_sdk_chat_completion, params),
+                _resolve_timeout(timeout)
+            )
+        else:
+            response = await client.chat_completion(params, timeout=timeout)
+        
+        _record_call(response is not None, started, caller, response, session_id=session_id)
+        logger.debug(f"Together AI async request completed: {len(params['messages'])} messages")
+        return response
+        
+    except asyncio.CancelledError:
+        _circuit_breaker.release()
+        raise
+    except Exception as e:
+        _record_call(False, started, caller, session_id=session_id)
+        logger.error(f"Together AI async request failed: {e}")
+        return None
+
+async def astream_chat_completion(
+    messages: List[Dict],
+    model: Optional[str] = None,
+    max_tokens: Optional[int] = None,
+    temperature: Optional[float] = None,
+    timeout: Optional[float] = None,
+    caller: Optional[str] = None,
+    session_id: Optional[str] = None,
+    priority: Optional[int] = None,
+    **kwargs
+) -> AsyncIterator[str]:
+    """
+    Stream chat completion tokens
+    
+    Khác với agenerate_chat_completion, lỗi được raise cho caller để caller
+    quyết định fallback (đã gửi token nào cho user hay chưa).
+    
+    Yields:
+        Text deltas
+    """
+    params = _build_completion_params(messages, model, max_tokens, temperature, **kwargs)
+    if session_id is None:
+        session_id = get_current_session_id()
+    
+    queued_at = time.perf_counter()
+    rejected = await _aadmit_call(session_id, caller, priority, timeout)
+    if rejected == 'budget':
+        raise SessionBudgetExceeded(f"LLM budget exhausted for session {session_id}")
+    if rejected == 'rate_limit':
+        raise LLMQueueRejected("LLM rate limit queue rejected the request")
+    if rejected:
+        raise CircuitOpenError("Together AI circuit is open")
+    timeout = _remaining_timeout(timeout, queued_at)
+    
+    started = time.perf_counter()
+    response = None
+    chunks = 0
+    try:
+        client = get_async_client()
+        if client is None:
+            # Không có streaming transport - trả về cả completion như một chunk
+            response = await asyncio.wait_for(
+                asyncio.to_thread(_sdk_chat_completion, params),
+                _resolve_timeout(timeout)
+            )
+            if response is None:
+                raise RuntimeError("Together AI client not available")
+            yield response.choices[0].message.content
+        else:
+            async for text in client.stream_chat_completion(params, timeout=timeout):
+                chunks += 1
+                yield text
+    except (asyncio.CancelledError, GeneratorExit):
+        _circuit_breaker.release()
+        raise
+    except Exception:
+        _record_call(False, started, caller, session_id=session_id)
+        raise
+    else:
+        _record_call(True, started, caller, response, completion_tokens=chunks, session_id=session_id)
+
+def stream_chat_completion(
+    messages: List[Dict],
+    model: Optional[str] = None,
+    max_tokens: Optional[int] = None,
+    temperature: Optional[float] = None,
+    timeout: Optional[float] = None,
+    caller: Optional[str] = None,
+    session_id: Optional[str] = None,
+    priority: Optional[int] = None,
+    **kwargs
+) -> Iterator[str]:
+    """
+    Sync facade cho astream_chat_completion (dùng trong Flask streaming response)
+    
+    Stream chạy trên background loop; nếu caller dừng iterate (client ngắt
+    kết nối) thì request bị hủy.
+    
+    Yields:
+        Text deltas
+    """
+    call_timeout = _resolve_timeout(timeout)
+    if session_id is None:
+        session_id = get_current_session_id()
+    if priority is None:
+        priority = get_current_priority()
+    chunks: 'queue.Queue' = queue.Queue()
+    
+    async def pump():
+        try:
+            async for text in astream_chat_completion(messages, model, max_tokens, temperature,
+                                                      timeout=call_timeout, caller=caller,
+                                                      session_id=session_id, priority=priority, **kwargs):
+                chunks.put(('chunk', text))
+            chunks.put(('end', None))
+        except BaseException as e:
+            chunks.put(('error', e))
+            if isinstance(e, asyncio.CancelledError):
+                raise
+    
+    future = _get_loop_runner().submit(pump())
+    try:
+        while True:
+            try:
+                kind, value = chunks.get(timeout=call_timeout)
+            except queue.Empty:
+                raise TimeoutError(f"No streamed tokens for {call_timeout} seconds")
+            if kind == 'chunk':
+                yield value
+            elif kind == 'end':
+                return
+            else:
+                raise value
+    finally:
+        future.cancel()
+
+def submit_chat_completion(
+    messages: List[Dict],
+    model: Optional[str] = None,
+    max_tokens: Optional[int] = None,
+    temperature: Optional[float] = None,
+    timeout: Optional[float] = None,
+    caller: Optional[str] = None,
+    session_id: Optional[str] = None,
+    priority: Optional[int] = None,
+    **kwargs
+) -> concurrent.futures.Future:
+    """
+    Bắt đầu chat completion trên background loop mà không chờ kết quả
+    
+    Returns:
+        concurrent.futures.Future - future.cancel() hủy luôn HTTP request đang chạy
+    """
+    call_timeout = _resolve_timeout(timeout)
+    return _get_loop_runner().submit(
+        agenerate_chat_completion(messages, model, max_tokens, temperature, timeout=call_timeout,
+                                  caller=caller, session_id=session_id or get_current_session_id(),
+                                  priority=get_current_priority() if priority is None else priority, **kwargs)
+    )
+
 def test_together_connection() -> bool:
     """
     Test connection to Together AI API
@@ -91,48 +857,61 @@ def generate_chat_completion(
     model: Optional[str] = None,
     max_tokens: Optional[int] = None,
     temperature: Optional[float] = None,
+    caller: Optional[str] = None,
+    session_id: Optional[str] = None,
+    priority: Optional[int] = None,
     **kwargs
 ) -> Optional[Any]:
     """
     Generate chat completion using Together AI
     
+    Sync facade: dùng pooled async client nếu có, ngược lại gọi SDK trực tiếp.
+    
     Args:
         messages: List of conversation messages
         model: Model to use (defaults from config)
         max_tokens: Maximum tokens to generate
         temperature: Sampling temperature
-        **kwargs: Additional parameters
+        caller: Component gọi LLM, dùng làm label trong /metrics
+        session_id: Session bị tính ngân sách (mặc định session_budget_scope hiện tại)
+        priority: Priority trong rate limit queue (mặc định llm_priority_scope hiện tại)
+        **kwargs: Additional parameters (timeout được hỗ trợ)
         
     Returns:
         API response or None if failed
     """
+    timeout = kwargs.pop('timeout', None)
+    # Background loop không thấy contextvar của thread này - truyền session + priority xuống
+    if session_id is None:
+        session_id = get_current_session_id()
+    if priority is None:
+        priority = get_current_priority()
+    
     try:
-        client = get_together_client()
-        if not client:
-            logger.error("Together AI client not available")
-            return None
+        if async_transport_available():
+            call_timeout = _resolve_timeout(timeout)
+            return run_sync(
+                agenerate_chat_completion(messages, model, max_tokens, temperature, timeout=call_timeout,
+                                          caller=caller, session_id=session_id, priority=priority, **kwargs),
+                timeout=call_timeout + 1.0
+            )
         
-        # Set defaults
-        if model is None:
-            model = os.getenv('TOGETHER_MODEL', 'meta-llama/Llama-3.3-70B-Instruct-Turbo-Free')
-        if max_tokens is None:
-            max_tokens = int(os.getenv('AI_MAX_TOKENS', '200'))
-        if temperature is None:
-            temperature = float(os.getenv('AI_TEMPERATURE', '0.7'))
-        
-        # Prepare API parameters
-        params = {
-            'model': model,
-            'messages': messages,
-            'max_tokens': max_tokens,
-            'temperature': temperature
-        }
+        call_timeout = _resolve_timeout(timeout)  # Fail nhanh nếu request đã hết deadline
+        params = _build_completion_params(messages, model, max_tokens, temperature, **kwargs)
         
-        # Add any additional parameters
-        params.update(kwargs)
+        rejected = _admit_call(session_id, caller, priority, call_timeout)
+        if rejected:
+            logger.debug(f"Together AI request skipped ({rejected})")
+            return None
         
         # Make API call
-        response = client.chat.completions.create(**params)
+        started = time.perf_counter()
+        try:
+            response = _sdk_chat_completion(params)
+        except Exception:
+            _record_call(False, started, caller, session_id=session_id)
+            raise
+        _record_call(response is not None, started, caller, response, session_id=session_id)
         
         logger.debug(f"Together AI request completed: {len(messages)} messages")
         return response
@@ -286,14 +1065,3 @@ def quick_chat_request(prompt: str, system_prompt: str = None) -> str:
     except Exception as e:
         logger.error(f"Quick chat request failed: {e}")
         return f"Lỗi: {str(e)}"
-
-# Auto-initialize on import (optional)
-def _auto_initialize():
-    """Auto-initialize client on module import"""
-    try:
-        get_together_client()
-    except:
-        pass  # Fail silently on import
-
-# Uncomment next line to auto-initialize on import
-_auto_initialize()
\ No newline at end of file
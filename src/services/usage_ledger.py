@@ -0,0 +1,263 @@
+"""
+Usage Ledger - Ngân sách LLM cho từng session
+Per-session call/token accounting that enforces AI_USAGE_CONTROL across every LLM caller
+"""
+
+import contextvars
+import logging
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Dict, Iterator, Optional, Any, Tuple
+
+from src.utils.metrics import get_metrics_registry
+
+logger = logging.getLogger(__name__)
+
+try:
+    from config import AI_USAGE_CONTROL
+except ImportError:
+    AI_USAGE_CONTROL = {
+        'min_messages_before_ai': 3,
+        'ai_analysis_interval': 2,
+        'max_ai_calls_per_session': 40,
+        'max_ai_tokens_per_session': 0,
+        'ai_cooldown_minutes': 1,
+        'budget_ttl_hours': 24,
+        'ledger_max_sessions': 10000
+    }
+
+LLM_BUDGET_REJECTIONS = get_metrics_registry().counter(
+    'llm_budget_rejections_total', 'LLM calls refused because the session budget was spent', ('caller',)
+)
+
+class SessionBudgetExceeded(RuntimeError):
+    """Session đã dùng hết ngân sách LLM"""
+
+class SessionBudgetLedger:
+    """
+    Sổ cái LLM usage theo session (in-process, LRU + idle TTL)
+
+    Mỗi LLM call được giữ chỗ (reserve) trước khi gửi nên các call song song
+    (speculative reply + classification) không vượt limit; token được cộng khi
+    call hoàn thành. Session id None (script, benchmark) không bị giới hạn.
+    Mỗi worker process có ledger riêng.
+    """
+
+    def __init__(self, settings: Optional[Dict] = None):
+        settings = settings or {}
+        self.max_calls = int(settings.get('max_ai_calls_per_session', 40))
+        self.max_tokens = int(settings.get('max_ai_tokens_per_session', 0))
+        self.min_messages = int(settings.get('min_messages_before_ai', 3))
+        self.analysis_interval = max(1, int(settings.get('ai_analysis_interval', 2)))
+        self.cooldown_seconds = float(settings.get('ai_cooldown_minutes', 1)) * 60
+        self.ttl_seconds = float(settings.get('budget_ttl_hours', 24)) * 3600
+        self.max_sessions = int(settings.get('ledger_max_sessions', 10000))
+        self._sessions: 'OrderedDict[str, Dict]' = OrderedDict()
+        self._lock = threading.Lock()
+        self.stats = {
+            'reserved': 0,
+            'rejected': 0,
+            'exhausted_sessions': 0,
+            'evicted': 0
+        }
+
+    def _record(self, session_id: str) -> Dict:
+        """Record của session (tạo mới / reset khi idle quá TTL), gọi khi đã giữ lock"""
+        now = time.monotonic()
+        record = self._sessions.get(session_id)
+        if record is None or now - record['updated_at'] > self.ttl_seconds:
+            record = {
+                'calls': 0,
+                'calls_by_caller': {},
+                'prompt_tokens': 0,
+                'completion_tokens': 0,
+                'last_analysis_at': None,
+                'exhausted': False,
+                'updated_at': now
+            }
+            self._sessions[session_id] = record
+            while len(self._sessions) > self.max_sessions:
+                self._sessions.popitem(last=False)
+                self.stats['evicted'] += 1
+        record['updated_at'] = now
+        self._sessions.move_to_end(session_id)
+        return record
+
+    def _has_budget(self, record: Dict) -> bool:
+        if self.max_calls and record['calls'] >= self.max_calls:
+            return False
+        if self.max_tokens and record['prompt_tokens'] + record['completion_tokens'] >= self.max_tokens:
+            return False
+        return True
+
+    def is_available(self, session_id: Optional[str]) -> bool:
+        """True nếu session còn ngân sách cho ít nhất một LLM call"""
+        if not session_id:
+            return True
+        with self._lock:
+            return self._has_budget(self._record(session_id))
+
+    def try_reserve(self, session_id: Optional[str], caller: Optional[str] = None) -> bool:
+        """
+        Giữ chỗ một LLM call trước khi gửi
+
+        Return: False khi session đã hết ngân sách (caller nên dùng local path)
+        """
+        if not session_id:
+            return True
+        with self._lock:
+            record = self._record(session_id)
+            if not self._has_budget(record):
+                self.stats['rejected'] += 1
+                if not record['exhausted']:
+                    record['exhausted'] = True
+                    self.stats['exhausted_sessions'] += 1
+                    logger.info(f"LLM budget exhausted for session {session_id} after {record['calls']} calls")
+                allowed = False
+            else:
+                record['calls'] += 1
+                caller_name = caller or 'unknown'
+                record['calls_by_caller'][caller_name] = record['calls_by_caller'].get(caller_name, 0) + 1
+                self.stats['reserved'] += 1
+                allowed = True
+        if not allowed:
+            LLM_BUDGET_REJECTIONS.inc(caller=caller or 'unknown')
+        return allowed
+
+    def refund(self, session_id: Optional[str], caller: Optional[str] = None) -> None:
+        """Trả lại chỗ đã giữ khi call không được gửi (vd. circuit open)"""
+        if not session_id:
+            return
+        with self._lock:
+            record = self._record(session_id)
+            record['calls'] = max(0, record['calls'] - 1)
+            caller_name = caller or 'unknown'
+            if record['calls_by_caller'].get(caller_name):
+                record['calls_by_caller'][caller_name] -= 1
+
+    def record_tokens(self, session_id: Optional[str], prompt_tokens: int, completion_tokens: int) -> None:
+        """Cộng token usage của một call đã hoàn thành"""
+        if not session_id or not (prompt_tokens or completion_tokens):
+            return
+        with self._lock:
+            record = self._record(session_id)
+            record['prompt_tokens'] += prompt_tokens
+            record['completion_tokens'] += completion_tokens
+
+    def should_analyze(self, session_id: Optional[str], message_count: int,
+                       crisis: bool = False, clinical_signs: bool = False) -> Tuple[bool, str]:
+        """
+        Quyết định lượt này có được dùng LLM context analysis không
+
+        Params:
+            - session_id: Session hiện tại
+            - message_count: Số tin nhắn trong conversation
+            - crisis: Prefilter phát hiện crisis term (bỏ qua interval / cooldown)
+            - clinical_signs: state['potential_clinical_signs']
+
+        Return: (allowed, reason)
+        """
+        if session_id:
+            with self._lock:
+                record = self._record(session_id)
+                if not self._has_budget(record):
+                    return False, 'budget_exhausted'
+                last_analysis_at = record['last_analysis_at']
+        else:
+            last_analysis_at = None
+
+        if crisis:
+            return True, 'crisis'
+
+        if message_count < self.min_messages:
+            return False, 'min_messages'
+
+        if last_analysis_at is not None and time.monotonic() - last_analysis_at < self.cooldown_seconds:
+            return False, 'cooldown'
+
+        if clinical_signs:
+            return True, 'clinical_signs'
+
+        if message_count % self.analysis_interval == 0:
+            return True, 'interval'
+        return False, 'interval'
+
+    def record_analysis(self, session_id: Optional[str]) -> None:
+        """Đánh dấu thời điểm context analysis gần nhất (cooldown)"""
+        if not session_id:
+            return
+        with self._lock:
+            self._record(session_id)['last_analysis_at'] = time.monotonic()
+
+    def get_budget(self, session_id: Optional[str]) -> Dict[str, Any]:
+        """Ngân sách đã dùng / còn lại của session (ai_info)"""
+        if not session_id:
+            return {'tracked': False, 'exhausted': False}
+        with self._lock:
+            record = self._record(session_id)
+            tokens_used = record['prompt_tokens'] + record['completion_tokens']
+            return {
+                'tracked': True,
+                'calls_used': record['calls'],
+                'calls_limit': self.max_calls or None,
+                'calls_remaining': max(0, self.max_calls - record['calls']) if self.max_calls else None,
+                'tokens_used': tokens_used,
+                'tokens_limit': self.max_tokens or None,
+                'tokens_remaining': max(0, self.max_tokens - tokens_used) if self.max_tokens else None,
+                'calls_by_caller': dict(record['calls_by_caller']),
+                'exhausted': not self._has_budget(record)
+            }
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            stats = dict(self.stats)
+            stats['sessions'] = len(self._sessions)
+        stats.update({
+            'max_calls_per_session': self.max_calls,
+            'max_tokens_per_session': self.max_tokens
+        })
+        return stats
+
+# Session của lượt chat hiện tại (LLM calls trong thread / task này được tính cho session đó)
+_current_session: contextvars.ContextVar = contextvars.ContextVar('llm_budget_session', default=None)
+
+@contextmanager
+def session_budget_scope(session_id: Optional[str]) -> Iterator[Optional[str]]:
+    """Tính mọi LLM call bên trong block vào ngân sách của session_id"""
+    token = _current_session.set(session_id)
+    try:
+        yield session_id
+    finally:
+        _current_session.reset(token)
+
+def get_current_session_id() -> Optional[str]:
+    """Session đang được tính ngân sách trong thread / task hiện tại"""
+    return _current_session.get()
+
+# Global instance
+_usage_ledger = None
+_ledger_lock = threading.Lock()
+
+def get_usage_ledger() -> SessionBudgetLedger:
+    """Lazy global ledger từ AI_USAGE_CONTROL"""
+    global _usage_ledger
+
+    if _usage_ledger is None:
+        with _ledger_lock:
+            if _usage_ledger is None:
+                _usage_ledger = SessionBudgetLedger(AI_USAGE_CONTROL)
+    return _usage_ledger
+
+def is_session_budget_available(session_id: Optional[str] = None) -> bool:
+    """Convenience function: session hiện tại (mặc định từ scope) còn ngân sách không"""
+    return get_usage_ledger().is_available(session_id if session_id is not None else get_current_session_id())
+
+def get_session_budget(session_id: Optional[str]) -> Dict[str, Any]:
+    """Convenience function cho ai_info"""
+    return get_usage_ledger().get_budget(session_id)
+
+def get_usage_ledger_stats() -> Dict[str, Any]:
+    """Convenience function for health endpoints"""
+    return get_usage_ledger().get_stats()
@@ -0,0 +1,130 @@
+"""
+Worker Pool - Thread pool dùng chung cho xử lý chat
+App-lifetime bounded executor with per-request deadlines and saturation stats
+"""
+
+import logging
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from typing import Any, Callable, Dict
+
+from src.utils.deadline import Deadline, DeadlineExceeded, deadline_scope
+
+logger = logging.getLogger(__name__)
+
+class ChatWorkerPool:
+    """
+    Bounded executor sống cùng app
+
+    Khác với ThreadPoolExecutor tạo mới mỗi request, timeout ở đây trả request
+    về ngay: worker chạy quá hạn không bị join, và mọi LLM call còn lại của nó
+    fail nhanh vì deadline đã hết.
+    """
+
+    def __init__(self, max_workers: int = 8):
+        self.max_workers = max_workers
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='chat-worker')
+        self._lock = threading.Lock()
+        self._active = 0
+        self._queued = 0
+        self.stats = {
+            'submitted': 0,
+            'completed': 0,
+            'timeouts': 0,
+            'rejected': 0
+        }
+
+    def run(self, fn: Callable[..., Any], timeout_seconds: float, *args, **kwargs) -> Any:
+        """
+        Chạy fn trên pool với deadline
+
+        Params:
+            - fn: Hàm cần chạy
+            - timeout_seconds: Tổng thời gian cho phép (kể cả thời gian chờ trong queue)
+
+        Return: Kết quả của fn, raise DeadlineExceeded (TimeoutError) khi hết hạn
+        """
+        deadline = Deadline(timeout_seconds)
+        future = self.submit(fn, deadline, *args, **kwargs)
+
+        try:
+            return future.result(timeout=deadline.remaining())
+        except FutureTimeoutError:
+            # Chưa chạy thì hủy luôn, đang chạy thì bỏ lại (không join)
+            future.cancel()
+            self._count('timeouts')
+            logger.warning(f"Chat worker timeout after {timeout_seconds} seconds")
+            raise DeadlineExceeded(f"Processing timeout after {timeout_seconds} seconds")
+
+    def submit(self, fn: Callable[..., Any], deadline: Deadline, *args, **kwargs) -> Future:
+        """Submit fn để chạy trong deadline_scope(deadline)"""
+        def task():
+            with self._lock:
+                self._queued -= 1
+                self._active += 1
+            try:
+                if deadline.expired:
+                    raise DeadlineExceeded("Request deadline exceeded while queued")
+                with deadline_scope(deadline):
+                    return fn(*args, **kwargs)
+            finally:
+                with self._lock:
+                    self._active -= 1
+                    self.stats['completed'] += 1
+
+        with self._lock:
+            self._queued += 1
+            self.stats['submitted'] += 1
+
+        future = self._executor.submit(task)
+        future.add_done_callback(self._on_done)
+        return future
+
+    def _on_done(self, future: Future) -> None:
+        # Task bị hủy khi còn trong queue thì không bao giờ chạy
+        if future.cancelled():
+            with self._lock:
+                self._queued -= 1
+                self.stats['rejected'] += 1
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Pool saturation cho /health"""
+        with self._lock:
+            stats = dict(self.stats)
+            stats.update({
+                'max_workers': self.max_workers,
+                'active': self._active,
+                'queued': self._queued,
+                'saturation': round(self._active / self.max_workers, 3) if self.max_workers else 0.0
+            })
+        return stats
+
+    def _count(self, name: str) -> None:
+        with self._lock:
+            self.stats[name] += 1
+
+    def shutdown(self) -> None:
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+# Global instance
+_chat_worker_pool = None
+_pool_lock = threading.Lock()
+
+def get_chat_worker_pool() -> ChatWorkerPool:
+    """Lazy global pool, kích thước từ PERFORMANCE_SETTINGS['chat_worker_threads']"""
+    global _chat_worker_pool
+
+    if _chat_worker_pool is None:
+        with _pool_lock:
+            if _chat_worker_pool is None:
+                try:
+                    from config import PERFORMANCE_SETTINGS
+                    max_workers = PERFORMANCE_SETTINGS.get('chat_worker_threads', 8)
+                except ImportError:
+                    max_workers = 8
+                _chat_worker_pool = ChatWorkerPool(max_workers=max_workers)
+    return _chat_worker_pool
+
+def get_worker_pool_stats() -> Dict[str, Any]:
+    """Convenience function for health endpoints"""
+    return get_chat_worker_pool().get_stats()
@@ -0,0 +1,76 @@
+"""
+Request Deadline - Thời hạn xử lý cho một request
+Per-request deadline propagated to every LLM call via a context variable
+"""
+
+import contextvars
+import time
+from contextlib import contextmanager
+from typing import Iterator, Optional
+
+class DeadlineExceeded(TimeoutError):
+    """Request đã hết thời gian xử lý"""
+
+class Deadline:
+    """
+    Thời điểm hết hạn (monotonic) của một request
+
+    Mỗi LLM call lấy timeout = min(timeout mặc định, thời gian còn lại), nên
+    budget giảm dần qua các bước classification -> transition -> reply.
+    """
+
+    def __init__(self, seconds: float):
+        self.budget_seconds = float(seconds)
+        self.started_at = time.monotonic()
+        self.expires_at = self.started_at + self.budget_seconds
+
+    def remaining(self) -> float:
+        """Số giây còn lại (không âm)"""
+        return max(0.0, self.expires_at - time.monotonic())
+
+    def elapsed(self) -> float:
+        return time.monotonic() - self.started_at
+
+    @property
+    def expired(self) -> bool:
+        return time.monotonic() >= self.expires_at
+
+    def clamp(self, timeout: Optional[float] = None) -> float:
+        """
+        Giới hạn timeout theo thời gian còn lại
+
+        Params:
+            - timeout: Timeout mong muốn của bước hiện tại (None = dùng hết phần còn lại)
+
+        Return: Timeout đã giới hạn, raise DeadlineExceeded nếu đã hết hạn
+        """
+        remaining = self.remaining()
+        if remaining <= 0:
+            raise DeadlineExceeded(f"Request deadline of {self.budget_seconds:.1f}s exceeded")
+        return remaining if timeout is None else min(float(timeout), remaining)
+
+_current_deadline: contextvars.ContextVar = contextvars.ContextVar('request_deadline', default=None)
+
+def get_current_deadline() -> Optional[Deadline]:
+    """Deadline của request đang xử lý trong thread/task hiện tại"""
+    return _current_deadline.get()
+
+@contextmanager
+def deadline_scope(deadline: Optional[Deadline]) -> Iterator[Optional[Deadline]]:
+    """Đặt deadline cho code chạy bên trong block"""
+    token = _current_deadline.set(deadline)
+    try:
+        yield deadline
+    finally:
+        _current_deadline.reset(token)
+
+def clamp_timeout(timeout: Optional[float]) -> Optional[float]:
+    """
+    Giới hạn timeout theo deadline hiện tại (nếu có)
+
+    Return: timeout gốc khi không có deadline, raise DeadlineExceeded nếu hết hạn
+    """
+    deadline = _current_deadline.get()
+    if deadline is None:
+        return timeout
+    return deadline.clamp(timeout)
@@ -0,0 +1,207 @@
+"""
+Keyword Matcher - Aho-Corasick automaton dùng chung cho mọi keyword analyzer
+One pass over the text finds every registered keyword, counted per category
+"""
+
+import logging
+import threading
+import unicodedata
+from collections import deque
+from functools import lru_cache
+from types import MappingProxyType
+from typing import Dict, Iterable, List, Mapping, Optional
+
+from src.utils.constants import DEPTH_INDICATORS, TEMPORAL_INDICATORS
+
+logger = logging.getLogger(__name__)
+
+# Số text gần nhất giữ kết quả scan (cùng tin nhắn được nhiều analyzer scan)
+SCAN_CACHE_SIZE = 512
+
+class AhoCorasickMatcher:
+    """
+    Multi-keyword matcher, O(len(text)) mỗi lần scan
+
+    Kết quả giống hệt `sum(1 for k in keywords if k in text)` cho từng category:
+    mỗi keyword trong list được tính tối đa một lần, kể cả khi xuất hiện nhiều
+    lần hoặc chồng lấn với keyword khác.
+    """
+
+    def __init__(self, tables: Mapping[str, Iterable[str]]):
+        """
+        Params:
+            - tables: {category: [keywords]}
+        """
+        self.categories = list(tables)
+        self._keywords: List[str] = []
+        self._keyword_categories: List[List[str]] = []
+        self._always_present: Dict[str, int] = {}
+
+        keyword_ids: Dict[str, int] = {}
+        for category, keywords in tables.items():
+            for keyword in keywords:
+                if not keyword:
+                    # '' in text luôn True
+                    self._always_present[category] = self._always_present.get(category, 0) + 1
+                    continue
+                if keyword not in keyword_ids:
+                    keyword_ids[keyword] = len(self._keywords)
+                    self._keywords.append(keyword)
+                    self._keyword_categories.append([])
+                # Giữ trùng lặp trong list để count khớp với vòng lặp gốc
+                self._keyword_categories[keyword_ids[keyword]].append(category)
+
+        self._build()
+
+    def _build(self) -> None:
+        """Trie + failure links, rồi gộp thành bảng chuyển đầy đủ (DFA)"""
+        goto: List[Dict[str, int]] = [{}]
+        outputs: List[List[int]] = [[]]
+
+        for keyword_id, keyword in enumerate(self._keywords):
+            node = 0
+            for char in keyword:
+                next_node = goto[node].get(char)
+                if next_node is None:
+                    next_node = len(goto)
+                    goto[node][char] = next_node
+                    goto.append({})
+                    outputs.append([])
+                node = next_node
+            outputs[node].append(keyword_id)
+
+        fail = [0] * len(goto)
+        delta: List[Dict[str, int]] = [dict(goto[0])] + [{} for _ in range(len(goto) - 1)]
+        queue = deque(goto[0].values())
+
+        # BFS: delta[node] = delta[fail[node]] + goto[node]
+        while queue:
+            node = queue.popleft()
+            delta[node] = dict(delta[fail[node]])
+            delta[node].update(goto[node])
+            outputs[node] = outputs[node] + outputs[fail[node]]
+            for char, child in goto[node].items():
+                fail[child] = delta[fail[node]].get(char, 0)
+                queue.append(child)
+
+        self._delta = delta
+        self._outputs = [tuple(output) for output in outputs]
+        logger.debug(f"Keyword automaton: {len(self._keywords)} keywords, {len(goto)} states")
+
+    def find_keywords(self, text: str) -> List[str]:
+        """Các keyword xuất hiện trong text (mỗi keyword một lần, theo thứ tự xuất hiện)"""
+        found = self._scan_ids(text)
+        return [self._keywords[keyword_id] for keyword_id in found]
+
+    def scan(self, text: str) -> Dict[str, int]:
+        """
+        Scan text một lần
+
+        Params:
+            - text: Text đã chuẩn hóa (caller tự lower() nếu cần)
+
+        Return: {category: số keyword của category có trong text}, chỉ gồm category > 0
+        """
+        counts = dict(self._always_present)
+        for keyword_id in self._scan_ids(text or ''):
+            for category in self._keyword_categories[keyword_id]:
+                counts[category] = counts.get(category, 0) + 1
+        return counts
+
+    def _scan_ids(self, text: str) -> List[int]:
+        delta = self._delta
+        outputs = self._outputs
+        seen = set()
+        found = []
+        state = 0
+        for char in text:
+            state = delta[state].get(char, 0)
+            if outputs[state]:
+                for keyword_id in outputs[state]:
+                    if keyword_id not in seen:
+                        seen.add(keyword_id)
+                        found.append(keyword_id)
+        return found
+
+# Registry: namespace -> {category: [keywords]}
+_keyword_tables: Dict[str, Dict[str, List[str]]] = {}
+_matcher: Optional[AhoCorasickMatcher] = None
+_matcher_lock = threading.Lock()
+
+def register_keyword_table(namespace: str, table: Mapping[str, Iterable[str]]) -> None:
+    """
+    Đăng ký keyword table vào automaton dùng chung
+
+    Gọi lúc import module; đăng ký lại cùng nội dung không làm build lại automaton.
+
+    Params:
+        - namespace: Tên nhóm, ví dụ 'depth' hoặc 'closure'
+        - table: {category: [keywords]}, category trong kết quả là '<namespace>.<category>'
+    """
+    normalized = {str(category): list(keywords) for category, keywords in table.items()}
+
+    global _matcher
+    with _matcher_lock:
+        if _keyword_tables.get(namespace) == normalized:
+            return
+        _keyword_tables[namespace] = normalized
+        _matcher = None
+    _cached_scan.cache_clear()
+
+def get_keyword_matcher() -> AhoCorasickMatcher:
+    """Automaton cho toàn bộ keyword tables đã đăng ký (build một lần)"""
+    global _matcher
+
+    matcher = _matcher
+    if matcher is None:
+        with _matcher_lock:
+            if _matcher is None:
+                tables = {
+                    f"{namespace}.{category}": keywords
+                    for namespace, table in _keyword_tables.items()
+                    for category, keywords in table.items()
+                }
+                _matcher = AhoCorasickMatcher(tables)
+            matcher = _matcher
+    return matcher
+
+@lru_cache(maxsize=SCAN_CACHE_SIZE)
+def _cached_scan(text: str) -> Mapping[str, int]:
+    return MappingProxyType(get_keyword_matcher().scan(text))
+
+def scan_keywords(text: str) -> Mapping[str, int]:
+    """
+    Đếm keyword theo category cho mọi table trong một lần scan
+
+    Params:
+        - text: Text đã chuẩn hóa
+
+    Return: Read-only {'<namespace>.<category>': count}
+    """
+    return _cached_scan(text or '')
+
+@lru_cache(maxsize=SCAN_CACHE_SIZE)
+def fold_diacritics(text: str) -> str:
+    """
+    Bỏ dấu tiếng Việt để match tin nhắn gõ không dấu ('tôi muốn chết' -> 'toi muon chet')
+
+    Params:
+        - text: Text đã lower()
+
+    Return: Text không dấu (đ -> d, ’ -> ')
+    """
+    decomposed = unicodedata.normalize('NFD', text or '')
+    stripped = ''.join(char for char in decomposed if not unicodedata.combining(char))
+    return stripped.replace('đ', 'd').replace('Đ', 'D').replace('\u2019', "'")
+
+def count_keywords(text: str, namespace: str, category: str) -> int:
+    """Số keyword của một category có trong text"""
+    return scan_keywords(text).get(f"{namespace}.{category}", 0)
+
+def has_keyword(text: str, namespace: str, category: str) -> bool:
+    """Tương đương any(keyword in text for keyword in table[category])"""
+    return count_keywords(text, namespace, category) > 0
+
+# Keyword tables dùng chung trong constants
+register_keyword_table('depth_indicators', DEPTH_INDICATORS)
+register_keyword_table('temporal_indicators', {'all': list(TEMPORAL_INDICATORS)})
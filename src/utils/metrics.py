@@ -0,0 +1,264 @@
+"""
+Metrics - Counters và latency histograms trong process
+Prometheus text exposition for chat pipeline stages and LLM calls
+"""
+
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+try:
+    from config import MONITORING_SETTINGS
+except ImportError:
+    MONITORING_SETTINGS = {'performance_tracking': True}
+
+# Bucket cố định (giây): stage cục bộ vài ms, LLM call vài giây
+STAGE_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+LLM_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.0, 4.0, 8.0, 15.0, 30.0, 60.0)
+
+def _format_labels(labelnames: Tuple[str, ...], values: Tuple[str, ...], extra: str = '') -> str:
+    parts = []
+    for name, value in zip(labelnames, values):
+        escaped = str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+        parts.append(f'{name}="{escaped}"')
+    if extra:
+        parts.append(extra)
+    return '{' + ','.join(parts) + '}' if parts else ''
+
+def _format_value(value: float) -> str:
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+class Counter:
+    """Counter tăng dần theo label values"""
+
+    def __init__(self, name: str, documentation: str, labelnames: Tuple[str, ...] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1, **labels) -> None:
+        key = tuple(str(labels.get(name, '')) for name in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def get(self, **labels) -> float:
+        key = tuple(str(labels.get(name, '')) for name in self.labelnames)
+        with self._lock:
+            return self._values.get(key, 0)
+
+    def collect(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            items = sorted(self._values.items())
+        for key, value in items:
+            lines.append(f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}")
+        return lines
+
+    def reset(self) -> None:
+        with self._lock:
+            self._values.clear()
+
+class Histogram:
+    """Histogram với bucket cố định (cumulative khi export, như Prometheus client)"""
+
+    def __init__(self, name: str, documentation: str, labelnames: Tuple[str, ...] = (),
+                 buckets: Tuple[float, ...] = STAGE_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # label values -> [bucket counts..., +Inf count], sum
+        self._series: Dict[Tuple[str, ...], Tuple[List[int], List[float]]] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels) -> None:
+        key = tuple(str(labels.get(name, '')) for name in self.labelnames)
+        index = len(self.buckets)
+        for position, bound in enumerate(self.buckets):
+            if value <= bound:
+                index = position
+                break
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = ([0] * (len(self.buckets) + 1), [0.0])
+                self._series[key] = series
+            series[0][index] += 1
+            series[1][0] += value
+
+    def get_count(self, **labels) -> int:
+        key = tuple(str(labels.get(name, '')) for name in self.labelnames)
+        with self._lock:
+            series = self._series.get(key)
+            return sum(series[0]) if series else 0
+
+    def collect(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            items = sorted((key, list(counts), total[0]) for key, (counts, total) in self._series.items())
+        for key, counts, total in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += count
+                le = _format_labels(self.labelnames, key, f'le="{_format_value(bound)}"')
+                lines.append(f"{self.name}_bucket{le} {cumulative}")
+            labels = _format_labels(self.labelnames, key)
+            lines.append(f"{self.name}_sum{labels} {_format_value(round(total, 6))}")
+            lines.append(f"{self.name}_count{labels} {cumulative}")
+        return lines
+
+    def reset(self) -> None:
+        with self._lock:
+            self._series.clear()
+
+class MetricsRegistry:
+    """
+    Tập hợp metrics của process + gauge callbacks
+
+    Gauge callbacks (circuit state, worker pool, ...) được gọi lúc scrape nên
+    không cần cập nhật liên tục.
+    """
+
+    def __init__(self):
+        self._metrics: Dict[str, object] = {}
+        self._gauges: Dict[str, Tuple[str, Callable[[], Dict[Tuple[Tuple[str, str], ...], float]]]] = {}
+        self._lock = threading.Lock()
+
+    def counter(self, name: str, documentation: str, labelnames: Tuple[str, ...] = ()) -> Counter:
+        with self._lock:
+            if name not in self._metrics:
+                self._metrics[name] = Counter(name, documentation, labelnames)
+            return self._metrics[name]
+
+    def histogram(self, name: str, documentation: str, labelnames: Tuple[str, ...] = (),
+                  buckets: Tuple[float, ...] = STAGE_BUCKETS) -> Histogram:
+        with self._lock:
+            if name not in self._metrics:
+                self._metrics[name] = Histogram(name, documentation, labelnames, buckets)
+            return self._metrics[name]
+
+    def register_gauge(self, name: str, documentation: str,
+                       callback: Callable[[], Dict[Tuple[Tuple[str, str], ...], float]]) -> None:
+        """
+        Đăng ký gauge tính lúc scrape
+
+        Params:
+            - callback: Trả về {((label, value), ...): số}; () cho gauge không có label
+        """
+        with self._lock:
+            self._gauges[name] = (documentation, callback)
+
+    def render(self) -> str:
+        """Prometheus text exposition format (version 0.0.4)"""
+        with self._lock:
+            metrics = list(self._metrics.values())
+            gauges = list(self._gauges.items())
+
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.collect())
+        for name, (documentation, callback) in gauges:
+            try:
+                samples = callback()
+            except Exception as e:
+                logger.error(f"Error collecting gauge {name}: {e}")
+                continue
+            lines.append(f"# HELP {name} {documentation}")
+            lines.append(f"# TYPE {name} gauge")
+            for labels, value in sorted(samples.items()):
+                names = tuple(label for label, _ in labels)
+                values = tuple(label_value for _, label_value in labels)
+                lines.append(f"{name}{_format_labels(names, values)} {_format_value(value)}")
+        return '\n'.join(lines) + '\n'
+
+    def reset(self) -> None:
+        """Xóa mọi giá trị đã ghi (benchmarks)"""
+        with self._lock:
+            metrics = list(self._metrics.values())
+        for metric in metrics:
+            metric.reset()
+
+# Global registry + chat pipeline metrics
+_registry = MetricsRegistry()
+
+CHAT_STAGE_SECONDS = _registry.histogram(
+    'chat_stage_duration_seconds', 'Time spent in each stage of a chat turn', ('stage',)
+)
+CHAT_TURN_SECONDS = _registry.histogram(
+    'chat_turn_duration_seconds', 'End-to-end ChatEngine processing time per turn', ('type',)
+)
+LLM_REQUESTS = _registry.counter(
+    'llm_requests_total', 'LLM calls by calling component and outcome', ('caller', 'outcome')
+)
+LLM_TOKENS = _registry.counter(
+    'llm_tokens_total', 'LLM tokens by calling component (streamed replies count chunks)', ('caller', 'kind')
+)
+LLM_REQUEST_SECONDS = _registry.histogram(
+    'llm_request_duration_seconds', 'LLM call latency by calling component', ('caller',), LLM_BUCKETS
+)
+
+def get_metrics_registry() -> MetricsRegistry:
+    return _registry
+
+def is_tracking_enabled() -> bool:
+    return bool(MONITORING_SETTINGS.get('performance_tracking', True))
+
+@contextmanager
+def track_stage(stage: str) -> Iterator[None]:
+    """
+    Span quanh một stage của chat pipeline
+
+    Thời gian được ghi vào chat_stage_duration_seconds kể cả khi stage raise.
+    Stage lồng nhau được tính inclusive (transition_decision gồm depth_duration).
+    """
+    if not is_tracking_enabled():
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        CHAT_STAGE_SECONDS.observe(time.perf_counter() - started, stage=stage)
+
+def observe_turn(seconds: float, turn_type: str) -> None:
+    """Ghi tổng thời gian một lượt chat (type = chat_response / transition / closure / error)"""
+    if is_tracking_enabled():
+        CHAT_TURN_SECONDS.observe(seconds, type=turn_type or 'unknown')
+
+def record_llm_request(caller: Optional[str], success: bool, seconds: float,
+                       prompt_tokens: int = 0, completion_tokens: int = 0) -> None:
+    """
+    Ghi một LLM call đã hoàn thành
+
+    Params:
+        - caller: Component gọi LLM (AIContextAnalyzer, ChatEngine, AIClassifier, ...)
+        - success: False khi lỗi / không có response
+        - seconds: Latency của call
+        - prompt_tokens, completion_tokens: Từ response.usage nếu có
+    """
+    if not is_tracking_enabled():
+        return
+    caller = caller or 'unknown'
+    LLM_REQUESTS.inc(caller=caller, outcome='success' if success else 'error')
+    LLM_REQUEST_SECONDS.observe(seconds, caller=caller)
+    if prompt_tokens:
+        LLM_TOKENS.inc(prompt_tokens, caller=caller, kind='prompt')
+    if completion_tokens:
+        LLM_TOKENS.inc(completion_tokens, caller=caller, kind='completion')
+
+def register_gauge(name: str, documentation: str,
+                   callback: Callable[[], Dict[Tuple[Tuple[str, str], ...], float]]) -> None:
+    """Convenience function: gauge trên global registry"""
+    _registry.register_gauge(name, documentation, callback)
+
+def render_metrics() -> str:
+    """Convenience function cho /metrics"""
+    return _registry.render()
@@ -42,6 +42,17 @@ class ChatInterface {
             totalQuestions: 0
         };
         
+        // Connection state: probe /health lúc tải trang, circuit chỉ mở sau khi gửi thật bị lỗi
+        this.connection = {
+            serverReachable: null,
+            consecutiveFailures: 0,
+            failureThreshold: 2,
+            circuitOpenUntil: 0,
+            circuitCooldownMs: 30000,
+            probeRetries: 3,
+            probeDelayMs: 2000
+        };
+        
         this.init();
     }
     
@@ -78,6 +89,12 @@ class ChatInterface {
         // Set welcome message time
         this.setWelcomeTime();
         
+        // Heartbeat một lần lúc tải trang (không fetch /health trước mỗi tin nhắn)
+        this.probeServerHealth(0);
+        
+        // Reload / tab mới: hiển thị lại hội thoại đang lưu phía server
+        this.restoreConversation();
+        
         this.log('ChatInterface initialized successfully');
     }
     
@@ -229,8 +246,8 @@ class ChatInterface {
         // Show typing indicator
         self.showTypingIndicator();
         
-        // Send message to API
-        self.sendMessageToAPI(message).then(function(response) {
+        // Send message to API (streaming, fallback sang /send_message)
+        self.streamMessageToAPI(message).then(function(response) {
             if (response.success) {
                 self.handleAPIResponse(response.data);
             } else {
@@ -246,59 +263,270 @@ class ChatInterface {
         });
     }
     
+    probeServerHealth(attempt) {
+        var self = this;
+        
+        fetch('/health', { cache: 'no-store' }).then(function(response) {
+            if (!response.ok) {
+                throw new Error('HTTP ' + response.status);
+            }
+            self.log('Server health probe OK');
+            self.connection.serverReachable = true;
+            self.recordSendSuccess();
+        }).catch(function(error) {
+            self.log('Server health probe failed (attempt ' + (attempt + 1) + '):', error);
+            if (attempt + 1 < self.connection.probeRetries) {
+                // Backoff tăng dần giữa các lần thử lại
+                setTimeout(function() {
+                    self.probeServerHealth(attempt + 1);
+                }, self.connection.probeDelayMs * (attempt + 1));
+            } else {
+                // Chỉ ghi nhận - mock replies chỉ dùng khi gửi tin nhắn thật bị lỗi
+                self.connection.serverReachable = false;
+            }
+        });
+    }
+    
+    restoreConversation() {
+        var self = this;
+        
+        fetch('/api/chat/conversation', { method: 'GET' })
+            .then(function(response) {
+                return response.ok ? response.json() : null;
+            })
+            .then(function(data) {
+                if (!data || !data.success || !data.history || !data.history.length) {
+                    return;
+                }
+                // User đã bắt đầu gõ trước khi fetch xong thì không chèn history cũ
+                if (self.conversation.history.length) {
+                    return;
+                }
+                
+                data.history.forEach(function(message) {
+                    var restored = {
+                        role: message.role === 'user' ? 'user' : 'bot',
+                        content: message.content,
+                        timestamp: message.timestamp ? new Date(message.timestamp) : new Date()
+                    };
+                    self.conversation.history.push(restored);
+                    self.addMessageToUI(restored);
+                });
+                
+                if (data.state) {
+                    self.conversation.state = Object.assign(self.conversation.state, data.state);
+                }
+                self.log('Restored conversation:', data.history.length, 'messages');
+                self.updateUI();
+            })
+            .catch(function(error) {
+                self.log('Failed to restore conversation:', error);
+            });
+    }
+    
+    isCircuitOpen() {
+        var connection = this.connection;
+        return connection.consecutiveFailures >= connection.failureThreshold &&
+            Date.now() < connection.circuitOpenUntil;
+    }
+    
+    recordSendSuccess() {
+        this.connection.consecutiveFailures = 0;
+        this.connection.circuitOpenUntil = 0;
+    }
+    
+    recordSendFailure() {
+        var connection = this.connection;
+        connection.consecutiveFailures += 1;
+        
+        if (connection.consecutiveFailures >= connection.failureThreshold) {
+            // Mở circuit: dùng mock replies trong cooldown, sau đó thử lại server (half-open)
+            connection.circuitOpenUntil = Date.now() + connection.circuitCooldownMs;
+            this.log('Send circuit open after ' + connection.consecutiveFailures + ' failures');
+        }
+    }
+    
     sendMessageToAPI(message) {
         var self = this;
         
+        if (self.isCircuitOpen()) {
+            self.log('Send circuit open, using mock response');
+            return Promise.resolve(self.getMockResponse(message));
+        }
+        
         return new Promise(function(resolve, reject) {
             self.log('Sending API request...');
             
-            // First, try to check if API is available
-            fetch('/health').then(function(healthCheck) {
-                if (!healthCheck.ok) {
-                    self.log('Server health check failed, using mock response');
+            fetch('/api/chat/send_message', {
+                method: 'POST',
+                headers: {
+                    'Content-Type': 'application/json'
+                },
+                // History + state nằm ở server (conversation store), chỉ gửi tin nhắn mới
+                body: JSON.stringify({
+                    message: message,
+                    use_ai: true
+                })
+            }).then(function(response) {
+                self.log('API response status:', response.status);
+                
+                if (!response.ok) {
+                    throw new Error('HTTP ' + response.status + ': ' + response.statusText);
+                }
+                
+                return response.json();
+            }).then(function(data) {
+                self.log('API response data:', data);
+                self.recordSendSuccess();
+                
+                if (data.error) {
+                    resolve({ success: false, error: data.message || data.error });
+                } else {
+                    resolve({ success: true, data: data });
+                }
+            }).catch(function(error) {
+                self.recordSendFailure();
+                
+                if (self.isCircuitOpen()) {
+                    self.log('API request failed, using mock response:', error);
                     resolve(self.getMockResponse(message));
+                } else {
+                    self.log('API request failed:', error);
+                    resolve({ success: false, error: 'Không thể kết nối đến máy chủ. Vui lòng thử lại.' });
+                }
+            });
+        });
+    }
+    
+    streamMessageToAPI(message) {
+        var self = this;
+        
+        // Trình duyệt cũ không hỗ trợ đọc response stream, hoặc server đang lỗi (circuit open)
+        if (!window.fetch || !window.ReadableStream || !window.TextDecoder || self.isCircuitOpen()) {
+            return self.sendMessageToAPI(message);
+        }
+        
+        var streamed = { element: null, text: '' };
+        
+        return fetch('/api/chat/stream', {
+            method: 'POST',
+            headers: {
+                'Content-Type': 'application/json',
+                'Accept': 'text/event-stream'
+            },
+            body: JSON.stringify({
+                message: message,
+                use_ai: true
+            })
+        }).then(function(response) {
+            self.log('Stream response status:', response.status);
+            
+            if (!response.ok || !response.body) {
+                throw new Error('HTTP ' + response.status + ': ' + response.statusText);
+            }
+            
+            var reader = response.body.getReader();
+            var decoder = new TextDecoder();
+            var buffer = '';
+            var finalData = null;
+            
+            function handleEvent(rawEvent) {
+                var eventName = 'message';
+                var dataLines = [];
+                
+                rawEvent.split('\n').forEach(function(line) {
+                    if (line.indexOf('event:') === 0) {
+                        eventName = line.slice(6).trim();
+                    } else if (line.indexOf('data:') === 0) {
+                        dataLines.push(line.slice(5).trim());
+                    }
+                });
+                
+                if (!dataLines.length) {
                     return;
                 }
                 
-                // Try real API
-                fetch('/api/chat/send_message', {
-                    method: 'POST',
-                    headers: {
-                        'Content-Type': 'application/json'
-                    },
-                    body: JSON.stringify({
-                        message: message,
-                        history: self.conversation.history.slice(0, -1),
-                        state: self.conversation.state,
-                        use_ai: true
-                    })
-                }).then(function(response) {
-                    self.log('API response status:', response.status);
-                    
-                    if (!response.ok) {
-                        throw new Error('HTTP ' + response.status + ': ' + response.statusText);
+                var payload = JSON.parse(dataLines.join('\n'));
+                if (eventName === 'token') {
+                    self.appendStreamedToken(streamed, payload.text);
+                } else if (eventName === 'done') {
+                    finalData = payload;
+                } else if (eventName === 'error') {
+                    throw new Error(payload.error);
+                }
+            }
+            
+            function pump() {
+                return reader.read().then(function(chunk) {
+                    if (!chunk.done) {
+                        buffer += decoder.decode(chunk.value, { stream: true });
                     }
                     
-                    return response.json();
-                }).then(function(data) {
-                    self.log('API response data:', data);
+                    var boundary;
+                    while ((boundary = buffer.indexOf('\n\n')) !== -1) {
+                        handleEvent(buffer.slice(0, boundary));
+                        buffer = buffer.slice(boundary + 2);
+                    }
                     
-                    if (data.error) {
-                        resolve({ success: false, error: data.message || data.error });
-                    } else {
-                        resolve({ success: true, data: data });
+                    if (chunk.done) {
+                        if (buffer.trim()) {
+                            handleEvent(buffer);
+                        }
+                        return finalData;
                     }
-                }).catch(function(error) {
-                    self.log('API request failed, using mock response:', error);
-                    resolve(self.getMockResponse(message));
+                    return pump();
                 });
-            }).catch(function(e) {
-                self.log('Server not reachable, using mock response');
-                resolve(self.getMockResponse(message));
-            });
+            }
+            
+            return pump();
+        }).then(function(data) {
+            if (!data) {
+                throw new Error('Stream ended without final event');
+            }
+            
+            self.log('Stream final data:', data);
+            self.recordSendSuccess();
+            data.streamedElement = streamed.element;
+            return { success: true, data: data };
+        }).catch(function(error) {
+            if (streamed.element) {
+                // Đã hiển thị một phần reply - giữ lại thay vì gửi lại tin nhắn
+                self.log('Stream interrupted after first token:', error);
+                return {
+                    success: true,
+                    data: { message: streamed.text, streamedElement: streamed.element }
+                };
+            }
+            
+            self.log('Streaming unavailable, falling back to send_message:', error);
+            return self.sendMessageToAPI(message);
         });
     }
     
+    appendStreamedToken(streamed, text) {
+        var self = this;
+        
+        if (!text) {
+            return;
+        }
+        
+        // Token đầu tiên: thay typing indicator bằng bot message
+        if (!streamed.element) {
+            self.hideTypingIndicator();
+            streamed.element = self.addMessageToUI({
+                role: 'bot',
+                content: '',
+                timestamp: new Date()
+            });
+        }
+        
+        streamed.text += text;
+        if (streamed.element) {
+            streamed.element.querySelector('.message-content p').textContent = streamed.text;
+        }
+        self.scrollToBottom();
+    }
+    
     getMockResponse(message) {
         var responses = [
             "Cảm ơn bạn đã chia sẻ. Tôi hiểu bạn đang trải qua những cảm xúc khó khăn. Có thể bạn kể thêm về những gì đang làm bạn cảm thấy lo lắng?",
@@ -402,7 +630,14 @@ class ChatInterface {
             };
             
             self.conversation.history.push(botMessage);
-            self.addMessageToUI(botMessage);
+            
+            if (data.streamedElement) {
+                // Reply đã được render khi stream; closure có thể thay thế nội dung
+                data.streamedElement.querySelector('.message-content p').textContent = data.message;
+                self.scrollToBottom();
+            } else {
+                self.addMessageToUI(botMessage);
+            }
         }
         
         // Check if we should transition to poll mode
@@ -467,6 +702,7 @@ class ChatInterface {
         }, 10);
         
         self.log('Message added to UI successfully');
+        return messageElement;
     }
     
     transitionToPoll(assessmentData) {
@@ -764,6 +1000,11 @@ class ChatInterface {
         var self = this;
         self.log('Resetting chat');
         
+        // Xóa hội thoại phía server để lượt sau bắt đầu lại từ đầu
+        fetch('/api/chat/reset', { method: 'POST' }).catch(function(error) {
+            self.log('Failed to reset server conversation:', error);
+        });
+        
         self.conversation = {
             history: [],
             state: self.initializeState(),